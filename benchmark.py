@@ -0,0 +1,469 @@
+"""
+End-to-end benchmarks of server control with fake server (fake_server.py), fake bot (fake_bot.py) and fake drive
+(fake_drive.py), so nothing of real Forge server, Discord or Google Drive is needed.
+Server and bot run on process hub with supervisor, log pipeline and log event matcher like in ManageServer. Backups
+and restores of synthetic worlds run through incremental backup, streaming upload, parallel download and staged
+restore against local fake drive, so world of given size needs about three times more free disk space.
+Results are written as json and compared with results of previous run.
+Usage:
+python benchmark.py --sizes 100M 1G 10G --runs 3 --compare benchmark_results/previous.json
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from bot_protocol import CHAT_MESSAGE, STATUS_MESSAGE, STOP_MESSAGE, encode_message
+from constants import *
+from fake_drive import FakeDrive
+from incremental_backup import IncrementalBackup
+from log_events import SERVER_STARTED_EVENT, SERVER_STOPPED_EVENT, TPS_EVENT, server_log_matcher
+from log_index import LogIndex
+from log_pipeline import SERVER_SOURCE, start_logging
+from parallel_download import ParallelDownloader
+from process_hub import ProcessHub
+from staged_restore import StagedRestore
+from streaming_upload import ResumableUploader, upload_while_writing
+from supervisor import Supervisor, SERVER, BOT, STARTING, READY, STOPPING, STOPPED
+
+FAKES_DIR = os.path.dirname(os.path.abspath(__file__))
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+MIB = 1024 ** 2
+
+
+def report(message: str) -> None:
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [Benchmark/INFO]: {message}", flush=True)
+
+
+def parse_size(text: str) -> int:
+    """
+    :param text: Size in bytes with optional K, M or G suffix, for example 100M.
+    :return: Number of bytes.
+    """
+    text = text.strip().upper()
+    if text[-1:] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def latency_summary(times_ms: list) -> dict:
+    """
+    :param times_ms: Measured times in ms.
+    :return: Percentiles by nearest rank and maximum.
+    """
+    ordered = sorted(times_ms)
+    return {"p50_ms": ordered[max(0, math.ceil(0.5 * len(ordered)) - 1)],
+            "p95_ms": ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)], "max_ms": ordered[-1]}
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """
+    :param results: Nested dictionary of results.
+    :param prefix: Prefix of names.
+    :return: Dictionary of dotted name -> number, other values are left out.
+    """
+    metrics = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[f"{prefix}{name}"] = value
+    return metrics
+
+
+class LifecycleHarness:
+    def __init__(self, server_dir: str):
+        """
+        Runs fake server and bot the same way as ManageServer runs real ones: on process hub, with states kept by
+        supervisor and every output line logged and matched by log events. Lines are not printed, so console does not
+        take part in measurement.
+        :param server_dir: Working directory of fake server.
+        """
+        self.server_dir = server_dir
+        self.process_hub = ProcessHub()
+        self.process_hub.start()
+        self.supervisor = Supervisor()
+        self.server_logger = logging.getLogger(SERVER_SOURCE)
+        self.server_process = None
+        self.bot_process = None
+        # Counters of server's output
+        self.lines = 0
+        self.line_bytes = 0
+        self.flood_marker = None
+        self.flood_done = threading.Event()
+        self.command_answered = threading.Event()
+        self.message_delivered = threading.Event()
+        self.log_events = server_log_matcher()
+        self.log_events.subscribe(SERVER_STARTED_EVENT, lambda match: self.supervisor.set_state(SERVER, READY))
+        self.log_events.subscribe(SERVER_STOPPED_EVENT, lambda match: self.supervisor.set_state(SERVER, STOPPED))
+        self.log_events.subscribe(TPS_EVENT, lambda match: self.command_answered.set())
+
+    def on_server_line(self, line_text: str):
+        self.lines += 1
+        self.line_bytes += len(line_text) + 1
+        self.server_logger.info(line_text)
+        self.log_events.dispatch(line_text)
+        if self.flood_marker is not None and line_text.endswith(self.flood_marker):
+            self.flood_done.set()
+
+    def on_bot_message(self, message: dict):
+        if message["type"] == STATUS_MESSAGE and message.get("benchmark"):
+            self.message_delivered.set()
+
+    @staticmethod
+    def measure_round_trips(send, answered: threading.Event, count: int) -> dict:
+        """
+        Sends requests one after another, each waits for the answer of the previous one.
+        :param send: Function sending request.
+        :param answered: Event set when answer arrives.
+        :param count: Number of requests.
+        :return: Latency summary.
+        """
+        times_ms = []
+        for _ in range(count):
+            answered.clear()
+            start_time = time.perf_counter()
+            send()
+            if not answered.wait(PROCESS_EXIT_TIMEOUT_S):
+                raise RuntimeError("Answer was not received in time.")
+            times_ms.append((time.perf_counter() - start_time) * 1000)
+        return latency_summary(times_ms)
+
+    def run(self, flood_lines: int = BENCHMARK_FLOOD_LINES, round_trips: int = BENCHMARK_ROUND_TRIPS) -> dict:
+        """
+        Starts server and bot, measures output throughput and round trips, then stops both.
+        :param flood_lines: Number of lines of throughput measurement.
+        :param round_trips: Number of server commands and bot messages.
+        :return: Results of run.
+        """
+        result = {}
+        self.lines = self.line_bytes = 0
+        self.supervisor.set_state(SERVER, STARTING)
+        start_time = time.perf_counter()
+        self.server_process = self.process_hub.spawn(SERVER, [sys.executable, os.path.join(FAKES_DIR, "fake_server.py"),
+                                                              "nogui"], on_line=self.on_server_line,
+                                                     on_close=lambda: self.supervisor.set_state(SERVER, STOPPED),
+                                                     cwd=self.server_dir)
+        if self.supervisor.wait_for(SERVER, READY, timeout=SERVER_START_TIMEOUT_S) != READY:
+            raise RuntimeError("Fake server did not start.")
+        result["start_s"] = time.perf_counter() - start_time
+        result["boot_lines"] = self.lines
+
+        start_time = time.perf_counter()
+        self.bot_process = self.process_hub.spawn(BOT, [sys.executable, os.path.join(FAKES_DIR, "fake_bot.py"),
+                                                        "127.0.0.1:25565"], on_line=self.on_bot_message, framed=True)
+        self.supervisor.set_state(BOT, READY)
+
+        def send_bot_message():
+            self.bot_process.write_bytes(encode_message(CHAT_MESSAGE, "Benchmark message.", benchmark=True))
+
+        # Bot is started when it delivers its first message
+        self.measure_round_trips(send_bot_message, self.message_delivered, 1)
+        result["bot_start_s"] = time.perf_counter() - start_time
+        result["bot_round_trip"] = self.measure_round_trips(send_bot_message, self.message_delivered, round_trips)
+
+        self.flood_done.clear()
+        self.flood_marker = f"Flood of {flood_lines} lines done"
+        lines, line_bytes = self.lines, self.line_bytes
+        start_time = time.perf_counter()
+        self.server_process.write_line(f"flood {flood_lines}")
+        if not self.flood_done.wait(SERVER_START_TIMEOUT_S):
+            raise RuntimeError("Flood of lines did not end in time.")
+        flood_time = time.perf_counter() - start_time
+        self.flood_marker = None
+        result["flood_s"] = flood_time
+        result["lines_per_s"] = (self.lines - lines) / flood_time
+        result["mib_per_s"] = (self.line_bytes - line_bytes) / flood_time / MIB
+
+        result["command_round_trip"] = self.measure_round_trips(
+            lambda: self.server_process.write_line(METRICS_TPS_COMMAND), self.command_answered, round_trips)
+
+        self.supervisor.set_state(SERVER, STOPPING)
+        start_time = time.perf_counter()
+        self.server_process.write_line("/stop")
+        if self.supervisor.wait_for(SERVER, STOPPED, timeout=SERVER_STOP_TIMEOUT_S) is None:
+            raise RuntimeError("Fake server did not stop.")
+        result["stop_saved_s"] = time.perf_counter() - start_time
+        self.supervisor.stop_process(SERVER, self.server_process, PROCESS_EXIT_TIMEOUT_S)
+        result["stop_s"] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        self.bot_process.write_bytes(encode_message(STOP_MESSAGE))
+        self.supervisor.set_state(BOT, STOPPING)
+        self.supervisor.stop_process(BOT, self.bot_process, PROCESS_EXIT_TIMEOUT_S)
+        result["bot_stop_s"] = time.perf_counter() - start_time
+        return result
+
+
+def write_random_file(path: str, size: int, generator: random.Random) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        for offset in range(0, size, HASH_CHUNK_SIZE):
+            file.write(generator.randbytes(min(HASH_CHUNK_SIZE, size - offset)))
+
+
+def create_world(server_dir: str, size: int, seed: int = 0) -> list:
+    """
+    Creates synthetic server files which look like modded world: region files with random, so already compressed,
+    content spread over three dimensions, small level and player data and text configs.
+    :param server_dir: Server's directory.
+    :param size: Approximate size of all files.
+    :param seed: Seed of content.
+    :return: Backed up entries, like DIRECTORIES_TO_ZIP.
+    """
+    generator = random.Random(seed)
+    world_dir = os.path.join(server_dir, "world")
+    config_dir = os.path.join(server_dir, "config")
+    small_files = {os.path.join(world_dir, "level.dat"): 4096, os.path.join(world_dir, "level.dat_old"): 4096}
+    for index in range(20):
+        small_files[os.path.join(world_dir, "playerdata", f"{generator.getrandbits(128):032x}.dat")] = 8192
+        small_files[os.path.join(world_dir, "data", f"mod_{index}_saved_data.dat")] = 16384
+    for path, file_size in small_files.items():
+        write_random_file(path, file_size, generator)
+    os.makedirs(config_dir, exist_ok=True)
+    for index in range(40):
+        with open(os.path.join(config_dir, f"mod_{index}-common.toml"), "w") as file:
+            file.writelines(f"[section_{line // 10}]\n\toption_{line} = {line % 7 == 0}\n" for line in range(200))
+    with open(os.path.join(server_dir, "server.properties"), "w") as file:
+        file.write("server-port=25565\nlevel-name=world\nmax-players=20\n")
+    remaining = max(0, size - sum(small_files.values()))
+    # Most of regions are in overworld
+    dimensions = ["region"] * 8 + [os.path.join("DIM-1", "region"), os.path.join("DIM1", "region")]
+    region_counts = dict.fromkeys(dimensions, 0)
+    index = 0
+    while remaining > 0:
+        file_size = min(BENCHMARK_REGION_FILE_SIZE, remaining)
+        dimension = dimensions[index % len(dimensions)]
+        count = region_counts[dimension]
+        write_random_file(os.path.join(world_dir, dimension, f"r.{count % 32 - 16}.{count // 32 - 16}.mca"),
+                          file_size, generator)
+        region_counts[dimension] += 1
+        remaining -= file_size
+        index += 1
+    return [world_dir, config_dir, os.path.join(server_dir, "server.properties")]
+
+
+def modify_world(entries: list, fraction: float, seed: int = 1) -> int:
+    """
+    Rewrites part of region files, like chunks changed by players.
+    :param entries: Backed up entries.
+    :param fraction: Part of region files which are rewritten.
+    :param seed: Seed of new content.
+    :return: Number of rewritten files.
+    """
+    generator = random.Random(seed)
+    regions = sorted(entry[0] for entry in IncrementalBackup(entries, os.devnull).scan().values()
+                     if entry[0].endswith(".mca"))
+    changed = generator.sample(regions, max(1, int(len(regions) * fraction))) if regions else []
+    for path in changed:
+        write_random_file(path, os.path.getsize(path), generator)
+    return len(changed)
+
+
+def world_stats(entries: list) -> tuple:
+    """
+    :param entries: Backed up entries.
+    :return: Tuple of (number of files, size of files).
+    """
+    scanned = IncrementalBackup(entries, os.devnull).scan().values()
+    return len(scanned), sum(entry[1] for entry in scanned)
+
+
+def benchmark_backup(size: int, work_dir: str, drive: FakeDrive, session,
+                     delta_fraction: float = BENCHMARK_DELTA_FRACTION) -> dict:
+    """
+    Backs up synthetic world as base and delta to fake drive, then restores the chain into empty server directory.
+    :param size: Size of world.
+    :param work_dir: Directory for server and its files, removed at start.
+    :param drive: Started fake drive.
+    :param session: Requests session.
+    :param delta_fraction: Part of region files changed before delta.
+    :return: Results.
+    """
+    shutil.rmtree(work_dir, ignore_errors=True)
+    drive.clear()
+    server_dir = os.path.join(work_dir, "server")
+    result = {"world_bytes": size}
+    start_time = time.perf_counter()
+    entries = create_world(server_dir, size)
+    result["create_world_s"] = time.perf_counter() - start_time
+    backup = IncrementalBackup(entries, os.path.join(work_dir, "backup_manifest.json"))
+    folder_id = session.request("POST", drive.files_url, json={"name": SAVE_FOLDER_NAME,
+                                                               "mimeType": "application/vnd.google-apps.folder"}
+                                ).json()["id"]
+    chain = []
+
+    def save(kind: str) -> None:
+        start_time = time.perf_counter()
+        snapshot = backup.prepare_snapshot()
+        result[f"{kind}_scan_s"] = time.perf_counter() - start_time
+        uploader = ResumableUploader(session, upload_url=drive.upload_url)
+        file = upload_while_writing(uploader, {"name": snapshot["file_name"], "parents": [folder_id]},
+                                    backup.write_snapshot)
+        backup.commit(folder_id)
+        result[f"{kind}_backup_s"] = time.perf_counter() - start_time
+        result[f"{kind}_archive_bytes"] = int(drive.files[file["id"]]["size"])
+        chain.append(drive.files[file["id"]])
+
+    save("base")
+    result["base_backup_mib_per_s"] = size / result["base_backup_s"] / MIB
+    # The check done before every save of world which did not change
+    start_time = time.perf_counter()
+    if backup.prepare_snapshot() is not None:
+        raise RuntimeError("Unchanged world was taken as changed.")
+    result["unchanged_scan_s"] = time.perf_counter() - start_time
+    result["delta_changed_files"] = modify_world(entries, delta_fraction)
+    changed_stats = world_stats(entries)
+    save("delta")
+
+    # Restore into server without world, like on new machine
+    for entry in entries:
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        else:
+            os.remove(entry)
+    start_time = time.perf_counter()
+    staged_restore = StagedRestore(backup.known_crc, server_dir, os.path.join(work_dir, "restore_staging"), entries)
+    staged_restore.prepare()
+    downloader = ParallelDownloader(session, files_url=drive.files_url)
+    metadata = None
+    for record in chain:
+        archive = os.path.join(work_dir, record["name"])
+        downloader.download(record["id"], archive, int(record["size"]), record["md5Checksum"],
+                            staged_restore.staging_dir, [BACKUP_METADATA_NAME], None, staged_restore.extract_member)
+        metadata = backup.apply_archive(archive, staged_restore.staging_dir, extract=False)
+        os.remove(archive)
+    staged_restore.swap()
+    backup.reset_manifest(metadata, folder_id)
+    result["restore_s"] = time.perf_counter() - start_time
+    result["restore_mib_per_s"] = size / result["restore_s"] / MIB
+    result["restore_verified"] = world_stats(entries) == changed_stats
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def summary_metrics(results: dict) -> dict:
+    """
+    :param results: Results of benchmark run.
+    :return: Dictionary of dotted name -> number, lifecycle represented by medians of its runs.
+    """
+    return {**flatten(results.get("lifecycle", {}).get("median", {}), "lifecycle."),
+            **flatten(results.get("backup", {}), "backup.")}
+
+
+def compare(previous: dict, current: dict, factor: float = BENCHMARK_REGRESSION_FACTOR,
+            noise_s: float = BENCHMARK_NOISE_S) -> list:
+    """
+    Compares metrics of two runs. Metrics ending with _per_s are better when higher, other times (_s and _ms) are
+    better when lower, the rest is not compared.
+    :param previous: Results of previous run.
+    :param current: Results of current run.
+    :param factor: Allowed ratio of worse metric.
+    :param noise_s: Times which differ less are not compared.
+    :return: Descriptions of regressions.
+    """
+    previous_metrics = summary_metrics(previous)
+    regressions = []
+    for name, value in summary_metrics(current).items():
+        previous_value = previous_metrics.get(name)
+        if not previous_value or not value:
+            continue
+        if name.endswith("_per_s"):
+            ratio = previous_value / value
+        elif name.endswith("_s") or name.endswith("_ms"):
+            ratio = value / previous_value
+            # Differences of short times are noise
+            if abs(value - previous_value) / (1000 if name.endswith("_ms") else 1) < noise_s:
+                continue
+        else:
+            continue
+        if ratio > factor:
+            regressions.append(f"{name}: {previous_value:.4g} -> {value:.4g}, {ratio:.2f}x worse")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of server control with fake server, bot and drive.")
+    parser.add_argument("--sizes", nargs="*", default=BENCHMARK_WORLD_SIZES,
+                        help="Sizes of synthetic worlds for backup and restore, for example 100M 1G 10G. Each size "
+                             "runs once, no size skips backups.")
+    parser.add_argument("--runs", type=int, default=BENCHMARK_RUNS, help="Number of server lifecycle runs.")
+    parser.add_argument("--flood-lines", type=int, default=BENCHMARK_FLOOD_LINES,
+                        help="Number of lines of output throughput measurement.")
+    parser.add_argument("--round-trips", type=int, default=BENCHMARK_ROUND_TRIPS,
+                        help="Number of server commands and bot messages of round trip measurement.")
+    parser.add_argument("--work-dir", default=BENCHMARK_DIR, help="Directory for fake server, worlds and drive.")
+    parser.add_argument("--output", help="Path of results json, new file in BENCHMARK_RESULTS_DIR by default.")
+    parser.add_argument("--compare", help="Results json of previous run, regressions are reported.")
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    log_index = LogIndex(os.path.join(args.work_dir, "log_index.sqlite")) if USE_LOG_INDEX else None
+    start_logging(os.path.join(args.work_dir, "benchmark.jsonl"), handlers=(log_index.handler(),) if log_index else ())
+    os.environ["FAKE_SERVER_BOOT_LINES"] = str(BENCHMARK_BOOT_LINES)
+    results = {"time": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+               "platform": platform.platform(), "cpu_count": os.cpu_count(),
+               "settings": {"runs": args.runs, "flood_lines": args.flood_lines, "round_trips": args.round_trips,
+                            "boot_lines": BENCHMARK_BOOT_LINES, "sizes": args.sizes}}
+
+    server_dir = os.path.join(args.work_dir, "lifecycle")
+    os.makedirs(server_dir, exist_ok=True)
+    harness = LifecycleHarness(server_dir)
+    runs = []
+    for run in range(args.runs):
+        runs.append(harness.run(args.flood_lines, args.round_trips))
+        report(f"Lifecycle run {run + 1}/{args.runs}: start {runs[-1]['start_s']:.2f}s, "
+               f"{runs[-1]['lines_per_s']:.0f} lines/s, command round trip p95 "
+               f"{runs[-1]['command_round_trip']['p95_ms']:.1f}ms, stop {runs[-1]['stop_s']:.2f}s.")
+    harness.process_hub.stop()
+    flat_runs = [flatten(run) for run in runs]
+    results["lifecycle"] = {"runs": runs, "median": {name: statistics.median(run[name] for run in flat_runs)
+                                                     for name in flat_runs[0]} if flat_runs else {}}
+
+    results["backup"] = {}
+    if args.sizes:
+        drive = FakeDrive(os.path.join(args.work_dir, "drive"))
+        drive.start()
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_connections=DOWNLOAD_CONCURRENCY, pool_maxsize=DOWNLOAD_CONCURRENCY))
+        try:
+            for size_text in args.sizes:
+                result = benchmark_backup(parse_size(size_text), os.path.join(args.work_dir, "backup"), drive, session)
+                results["backup"][size_text] = result
+                report(f"World of {size_text}: base backup {result['base_backup_s']:.2f}s, delta backup "
+                       f"{result['delta_backup_s']:.2f}s, restore {result['restore_s']:.2f}s, verified "
+                       f"{result['restore_verified']}.")
+        finally:
+            drive.stop()
+            drive.clear()
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r") as file:
+            regressions = compare(json.load(file), results)
+        results["compared_with"] = args.compare
+        results["regressions"] = regressions
+    output = args.output or os.path.join(BENCHMARK_RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    report(f"Results written to {output}.")
+    for regression in regressions:
+        report(f"Regression of {regression}.")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
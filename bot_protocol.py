@@ -0,0 +1,72 @@
+import asyncio
+import json
+import struct
+
+from constants import *
+
+# Types of messages exchanged between main app and discord bot
+CHAT_MESSAGE = "chat"
+ADMIN_MESSAGE = "admin"
+STATUS_MESSAGE = "status"
+STOP_MESSAGE = "stop"
+# Every message is JSON object preceded by its length
+FRAME_HEADER = struct.Struct(">I")
+
+
+def encode_message(message_type: str, text: str = "", **fields) -> bytes:
+    """
+    Builds frame of message.
+    :param message_type: One of message types.
+    :param text: Content of message.
+    :param fields: Additional fields of message.
+    :return: Frame bytes.
+    """
+    payload = json.dumps({"type": message_type, "text": text, **fields}).encode('utf-8')
+    if len(payload) > BOT_MAX_FRAME_SIZE:
+        raise ValueError(f"Message of {len(payload)} bytes exceeds frame limit.")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def frame_length(header: bytes) -> int:
+    """
+    :param header: Frame header.
+    :return: Length of frame's payload.
+    """
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > BOT_MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds limit.")
+    return length
+
+
+def read_message(stream):
+    """
+    Reads one message from binary stream, blocks until it is complete.
+    :param stream: Binary file-like object, for example sys.stdin.buffer.
+    :return: Message dictionary or None at the end of stream.
+    """
+    def read_exactly(size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = stream.read(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    try:
+        return json.loads(read_exactly(frame_length(read_exactly(FRAME_HEADER.size))).decode('utf-8'))
+    except EOFError:
+        return None
+
+
+async def read_message_async(reader: asyncio.StreamReader):
+    """
+    Reads one message from asyncio stream.
+    :param reader: Stream reader, for example stdout of subprocess.
+    :return: Message dictionary or None at the end of stream.
+    """
+    try:
+        length = frame_length(await reader.readexactly(FRAME_HEADER.size))
+        return json.loads((await reader.readexactly(length)).decode('utf-8'))
+    except asyncio.IncompleteReadError:
+        return None
@@ -1,6 +1,5 @@
 import os
 from datetime import datetime
-import logging
 
 # Used directories
 CURRENT_DIR = os.getcwd()
@@ -12,35 +11,78 @@ LOGS_DIR = f"{CURRENT_DIR}/logs"
 PYTHON_DIR = f"{CURRENT_DIR}/../../python/python"
 SAVE_DIR = f"{SERVER_DIR}/world"
 CONFIG_DIR = f"{SERVER_DIR}/config"
-OUT_NGROK_FILE = "output.log"
 
 # Run command mods
 RUN_SERVER_COMMAND = [f"{SERVER_DIR}/run.bat"]
+# Direct start of server's JVM with forge's argument files, paths relative to server's directory
+USE_DIRECT_JVM_LAUNCH = True
+SERVER_JVM_ARGS_FILE = "user_jvm_args.txt"
+SERVER_LAUNCH_ARGS_GLOB = f"libraries/net/minecraftforge/forge/*/{'win' if os.name == 'nt' else 'unix'}_args.txt"
+SERVER_EXTRA_ARGS = ["nogui"]
+# Class Data Sharing archive, dumped at the first clean exit and mapped by later starts
+USE_APP_CDS = True
+APP_CDS_ARCHIVE_FILE = f"{SERVER_DIR}/server_classes.jsa"
 
-# Create and configure logger / log file
+# Log file, json lines of all sources, started by log_pipeline.start_logging
 NOT_FILE_NAME_SIGNS = ["-", ":", ".", " "]
-os.makedirs("logs", exist_ok=True)
-LOG_NAME = f"logs/{''.join([elem if elem not in NOT_FILE_NAME_SIGNS else '_' for elem in str(datetime.now())])}.log"
-logging.basicConfig(filename=LOG_NAME,
-                    format='%(message)s',
-                    filemode='w')
+LOG_NAME = f"logs/{''.join([elem if elem not in NOT_FILE_NAME_SIGNS else '_' for elem in str(datetime.now())])}.jsonl"
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_ROTATE_INTERVAL_S = 24 * 60 * 60
+LOG_BACKUP_COUNT = 20
+# Searchable index of log records
+USE_LOG_INDEX = True
+LOG_INDEX_FILE = f"{CURRENT_DIR}/logs/log_index.sqlite"
+LOG_INDEX_BATCH_SIZE = 500
+LOG_INDEX_COMMIT_PERIOD_S = 1
+LOG_INDEX_QUERY_LIMIT = 20
+LOG_INDEX_MESSAGE_LENGTH = 300
 # Regex pattern vanilla
 # SERVER_STARTED_RE = r'\[Server thread/INFO\]: Done \((.*?)\)! For help, type "help"'
 
 # Regex pattern mods
 SERVER_STARTED_RE = r'\[minecraft/DedicatedServer]: Done \((.*?)\)! For help, type "help"'
-ZROK_STARTED_RE = "Run: started"
-TCP_RE = r'url=tcp://(.*?)\n'
+NGROK_ADDRESS_RE = r'url=tcp://(\S+)'
 SERVER_STOPPED_PATTERN = "ThreadedAnvilChunkStorage: All dimensions are saved"
+PLAYER_JOINED_RE = r'\[minecraft/MinecraftServer]: (\w{3,16}) joined the game$'
+PLAYER_LEFT_RE = r'\[minecraft/MinecraftServer]: (\w{3,16}) left the game$'
+TPS_RE = r'Overall ?: Mean tick time: ([\d.]+) ms\. Mean TPS: ([\d.]+)'
+CANT_KEEP_UP_RE = r"Can't keep up! Is the server overloaded\? Running (\d+)ms or (\d+) ticks behind"
+CRASH_RE = r'(?:This crash report has been saved to|Crash report saved to): (.*)$'
+SAVED_GAME_RE = r'\[minecraft/MinecraftServer]: Saved the game$'
+# Phases of server's boot, the last one is "Done" line
+BOOT_PHASE_PATTERNS = {
+    "launcher": r"ModLauncher running",
+    "server": r"Starting minecraft server version",
+    "level": r'Preparing level "',
+}
+BOOT_DONE_PHASE = "done"
 ADMIN_PREFIX = "admin"
 EXTERNAL_SAVE_PATTERN = "save"
 EXTERNAL_STOP_PATTERN = "exit"
+EXTERNAL_METRICS_PATTERN = "metrics"
+EXTERNAL_LOGS_PATTERN = "logs"
 
 # Timings
 SERVER_STATUS_CHECK_PERIOD_S = 60
 SERVER_START_TIMEOUT_S = 5 * 60
+SERVER_STOP_TIMEOUT_S = 2 * 60
+PROCESS_EXIT_TIMEOUT_S = 10
 ZROK_START_TIMEOUT_S = 10
-NGROK_STABILIZATION_TIME_S = 3
+NGROK_START_TIMEOUT_S = 15
+# Period of asking tunnel for its address while waiting for it
+TUNNEL_POLL_PERIOD_S = 0.5
+LAG_NOTIFY_PERIOD_S = 5 * 60
+TUNNEL_PROBE_PERIOD_S = 30
+HOT_BACKUP_PERIOD_S = 30 * 60
+HOT_BACKUP_SAVE_TIMEOUT_S = 60
+# Boot slower than median of previous ones times factor is reported
+BOOT_REGRESSION_FACTOR = 1.2
+BOOT_HISTORY_LENGTH = 50
+BOOT_HISTORY_FILE = f"{CURRENT_DIR}/boot_history.jsonl"
+# Maximal length of sub-process output line, longer lines are truncated
+STREAM_LINE_LIMIT = 64 * 1024
+# Size of one read of sub-process output
+STREAM_READ_SIZE = 64 * 1024
 # Google drive scopes
 SCOPES = ['https://www.googleapis.com/auth/drive.metadata.readonly',
           'https://www.googleapis.com/auth/drive.file']
@@ -49,6 +91,11 @@ HELP_MESSAGE = "\n\n" \
                "* exit - Safely stops the server application with all its sub-processes.\n" \
                "* save - Safely stops the server application with all its sub-processes and sends current content of " \
                "server's world folder to Google Drive.\n" \
+               "* backup - Saves current world to Google Drive without stopping the server.\n" \
+               "* metrics - Shows current server's health: TPS, CPU, memory and players.\n" \
+               "* tunnel - Shows current tunnel with its latency percentiles.\n" \
+               "* logs [query] - Searches logs, for example 'logs event=player_joined since=7d Steve'. Conditions: " \
+               "source, event, since, until (7d, 12h, 30m or ISO time) and limit, other words are searched text.\n" \
                "* /s [command] - Sends [command] to server and redirects its output to current console.\n" \
                "* /b [message] - Sends [message] to discord channel for chatting with bot.\n" \
                "* help - Lists possible server control options.\n"
@@ -56,14 +103,120 @@ HELP_MESSAGE = "\n\n" \
 ADMIN_CHANNEL_NAME = "admin_control"
 USERS_CHANNEL_NAME = "bot_chatting"
 # Discord constants
-DISCORD_BOT_STOP_SIGNAL = "###DISCORD_BOT_STOP_SIGNAL###"
 BOT_PREFIX = "BOT"
 ZROK_PREFIX = "ZROK"
 NGROK_PREFIX = "NGROK"
+# Tunnels, commands can be replaced with fake tunnel for tests
+ZROK_BACKEND = "zrok"
+NGROK_BACKEND = "ngrok"
+ZROK_COMMAND = ["zrok", "share", "reserved", "--headless"]
+NGROK_API_URL = "http://127.0.0.1:4040/api/tunnels"
+# Backends in order of preference, the next one is used when the current one fails
+TUNNEL_BACKENDS = [ZROK_BACKEND, NGROK_BACKEND]
+# Local address of "zrok access private" frontend of the share, zrok is probed only with it. Without it latency
+# failover is disabled for zrok and only end of its process is detected. To enable it run on this machine for example
+# zrok access private TOKEN --headless --bind 127.0.0.1:25566
+# and set ZROK_PROBE_ADDRESS = "127.0.0.1:25566"
+ZROK_PROBE_ADDRESS = None
+# Tunnel monitoring with server list ping through public address
+USE_TUNNEL_MONITOR = True
+MINECRAFT_PROTOCOL_VERSION = 763
+TUNNEL_PROBE_TIMEOUT_S = 5
+TUNNEL_PROBE_WINDOW = 20
+TUNNEL_MIN_SAMPLES = 5
+TUNNEL_MAX_P95_MS = 500
+TUNNEL_MAX_FAILURES = 3
+# Maximal size of message between main app and bot
+BOT_MAX_FRAME_SIZE = 1024 * 1024
+# Outgoing discord messages
+DISCORD_MESSAGE_LIMIT = 2000
+DISCORD_FLUSH_WINDOW_S = 0.5
+DISCORD_FLUSH_TIMEOUT_S = 10
+# Per channel rate limit of messages
+DISCORD_RATE_LIMIT_MESSAGES = 5
+DISCORD_RATE_LIMIT_PERIOD_S = 5
 # Upload and download variables
 DIRECTORIES_TO_ZIP = [SAVE_DIR, CONFIG_DIR, f"{SERVER_DIR}/whitelist.json", f"{SERVER_DIR}/banned-players.json",
                       f"{SERVER_DIR}/server.properties"]
 SAVE_FILE_NAME = "world_save.zip"
 SAVE_FOLDER_NAME = "world"
+# Last port on which server started
+PORT_STATE_FILE = f"{CURRENT_DIR}/last_port.json"
 
 
+# Local index of saves on drive
+USE_DRIVE_INDEX = True
+SAVE_CATALOG_PAGE_SIZE = 10
+DRIVE_INDEX_FILE = f"{CURRENT_DIR}/drive_index.json"
+# Retention of saves on drive
+RETENTION_KEEP_LAST = 5
+RETENTION_KEEP_DAILY_DAYS = 7
+RETENTION_KEEP_WEEKLY_WEEKS = 4
+RETENTION_MAX_TOTAL_BYTES = 20 * 1024 ** 3
+DRIVE_BATCH_SIZE = 100
+# Hot backups of running server, opt-in because snapshot keeps a second copy of the world in HOT_BACKUP_DIR
+USE_HOT_BACKUPS = False
+HOT_BACKUP_DIR = f"{SERVER_DIR}/hot_backup"
+# Background jobs, rates in bytes per second (None for no limit)
+JOB_NICENESS = 10
+JOB_IO_CLASS = 3
+JOB_READ_RATE = 64 * 1024 * 1024
+JOB_WRITE_RATE = 32 * 1024 * 1024
+JOB_UPLOAD_RATE = 2 * 1024 * 1024
+# Jobs are paused for given time when TPS drops under minimum or server can't keep up
+JOB_MIN_TPS = 18
+JOB_LAG_PAUSE_S = 30
+# Metrics of running server, sampled every SERVER_STATUS_CHECK_PERIOD_S
+USE_METRICS = True
+METRICS_RING_SIZE = 24 * 60
+METRICS_TPS_COMMAND = "forge tps"
+USE_METRICS_EXPORTER = True
+METRICS_EXPORTER_HOST = "127.0.0.1"
+METRICS_EXPORTER_PORT = 9225
+# Incremental backups
+USE_INCREMENTAL_BACKUPS = True
+BACKUP_MANIFEST_FILE = f"{CURRENT_DIR}/backup_manifest.json"
+BACKUP_METADATA_NAME = "backup_manifest.json"
+INCREMENTAL_DELTA_PREFIX = "world_delta_"
+INCREMENTAL_MAX_CHAIN_LENGTH = 24
+HASH_CHUNK_SIZE = 1024 * 1024
+# Parallel compression
+ZIP_COMPRESSION_LEVEL = 6
+ZIP_WORKERS = os.cpu_count() or 1
+ZIP_CHUNK_SIZE = 16 * 1024 * 1024
+ALREADY_COMPRESSED_EXTENSIONS = {".mca", ".mcc", ".png", ".jpg", ".jpeg", ".ogg", ".zip", ".jar", ".gz"}
+# Streaming upload
+USE_STREAMING_UPLOAD = True
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+STREAM_PIPE_MAX_CHUNKS = 4
+UPLOAD_MAX_RETRIES = 5
+# Parallel download
+USE_PARALLEL_DOWNLOAD = True
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_MAX_RETRIES = 5
+RESTORE_STAGING_DIR = f"{SERVER_DIR}/restore_staging"
+# Benchmarks with fake server, bot and drive, sizes of synthetic worlds accept K, M and G suffixes
+BENCHMARK_DIR = f"{CURRENT_DIR}/benchmark"
+BENCHMARK_RESULTS_DIR = f"{CURRENT_DIR}/benchmark_results"
+BENCHMARK_WORLD_SIZES = ["100M", "1G", "10G"]
+BENCHMARK_RUNS = 3
+BENCHMARK_BOOT_LINES = 3000
+BENCHMARK_FLOOD_LINES = 200000
+BENCHMARK_ROUND_TRIPS = 100
+BENCHMARK_REGION_FILE_SIZE = 8 * 1024 * 1024
+# Part of region files changed before delta backup
+BENCHMARK_DELTA_FRACTION = 0.02
+# Metric worse than in compared results times factor is reported, times closer than noise are not compared
+BENCHMARK_REGRESSION_FACTOR = 1.2
+BENCHMARK_NOISE_S = 0.02
+# Tracing of app's phases, Chrome trace of every run is written to TRACE_DIR (open it in chrome://tracing or Perfetto)
+USE_TRACING = True
+TRACE_DIR = f"{LOGS_DIR}/traces"
+TRACE_MAX_SPANS = 10000
+# Profiling of chosen phases, mode "cprofile" writes .prof files, "sampling" writes folded stacks for flame graphs
+TRACE_PROFILE_MODE = None
+TRACE_PROFILE_PHASES = []
+TRACE_SAMPLE_INTERVAL_S = 0.005
@@ -5,13 +5,56 @@ import discord
 import asyncio
 from datetime import datetime
 from sensitive_data import BOT_TOKEN
-from constants import USERS_CHANNEL_NAME, ADMIN_CHANNEL_NAME, ADMIN_PREFIX, DISCORD_BOT_STOP_SIGNAL
+from constants import USERS_CHANNEL_NAME, ADMIN_CHANNEL_NAME, ADMIN_PREFIX, DISCORD_FLUSH_TIMEOUT_S
+from bot_protocol import CHAT_MESSAGE, ADMIN_MESSAGE, STATUS_MESSAGE, STOP_MESSAGE, encode_message, read_message
+from message_queue import OutboundMessageQueue
 
 tcp_address = sys.argv[1]
 
 # All intents found on developers side
 intents = discord.Intents.all()
 bot = discord.Client(intents=intents)
+# Created in on_ready, when bot's event loop runs
+outbound = None
+bot_ready = threading.Event()
+# Channel name -> channel id of working channels, rebuilt on channel events instead of searching on every message
+channel_ids = {}
+# Channel of every message type sent by main app
+MESSAGE_CHANNELS = {CHAT_MESSAGE: USERS_CHANNEL_NAME, ADMIN_MESSAGE: ADMIN_CHANNEL_NAME,
+                    STATUS_MESSAGE: ADMIN_CHANNEL_NAME}
+
+
+def refresh_channel_ids():
+    """
+    Finds ids of working channels with one scan of all channels.
+    :return:
+    """
+    global channel_ids
+    found = {}
+    for channel in bot.get_all_channels():
+        if channel.name in (USERS_CHANNEL_NAME, ADMIN_CHANNEL_NAME):
+            found.setdefault(channel.name, channel.id)
+    channel_ids = found
+
+
+def get_channel(channel_name: str):
+    """
+    :param channel_name: Name of working channel.
+    :return: Channel or None if it is not known.
+    """
+    channel_id = channel_ids.get(channel_name)
+    return bot.get_channel(channel_id) if channel_id is not None else None
+
+
+def send_to_main(message_type: str, text: str):
+    """
+    Writes message frame to parent process.
+    :param message_type: One of protocol message types.
+    :param text: Content of message.
+    :return:
+    """
+    sys.stdout.buffer.write(encode_message(message_type, text))
+    sys.stdout.buffer.flush()
 
 
 async def send_server_status():
@@ -19,33 +62,47 @@ async def send_server_status():
     Sens status of server at start.
     :return:
     """
-    channel = discord.utils.get(bot.get_all_channels(), name='admin_control')
+    channel = get_channel(ADMIN_CHANNEL_NAME)
     if channel:
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        await channel.send(f"[{current_time}] [Server control/INFO]: Server status started.")
+        outbound.put_in_loop(channel, f"[{current_time}] [Server control/INFO]: Server status started.")
+
+
+def route_message(message: dict):
+    """
+    Puts message from parent process into outbound queue of its channel, runs in bot's loop.
+    :param message: Message dictionary.
+    :return:
+    """
+    global tcp_address
+    if message["type"] == STATUS_MESSAGE and message.get("address"):
+        tcp_address = message["address"]
+    channel = get_channel(MESSAGE_CHANNELS.get(message["type"], ADMIN_CHANNEL_NAME))
+    if channel and outbound and message["text"]:
+        # Lines are coalesced per channel and sent in bot's loop, reading of input never waits for discord
+        outbound.put_in_loop(channel, message["text"])
 
 
 def wait_for_user_input():
     """
-    Redirects info from parent process to specific channel.
+    Redirects messages from parent process to specific channel.
     :return:
     """
-    stop_app = False
     while True:
-        user_input = input()
-        channel_name = USERS_CHANNEL_NAME
-        if user_input.startswith(USERS_CHANNEL_NAME):
-            user_input = user_input.replace(USERS_CHANNEL_NAME, "")
-        else:
-            user_input = user_input.replace(ADMIN_CHANNEL_NAME, "")
-            channel_name = ADMIN_CHANNEL_NAME
-            if DISCORD_BOT_STOP_SIGNAL in user_input:
-                stop_app = True
-        channel = discord.utils.get(bot.get_all_channels(), name=channel_name)
-        if stop_app:
-            sys.exit()
-        if channel:
-            asyncio.run_coroutine_threadsafe(channel.send(user_input), bot.loop)
+        message = read_message(sys.stdin.buffer)
+        if message is None or message["type"] == STOP_MESSAGE:
+            break
+        # Messages sent before login wait for it instead of being lost
+        bot_ready.wait()
+        bot.loop.call_soon_threadsafe(route_message, message)
+    # Let already queued messages reach discord, then close the bot so its process ends
+    if bot_ready.wait(DISCORD_FLUSH_TIMEOUT_S):
+        try:
+            asyncio.run_coroutine_threadsafe(outbound.flush(), bot.loop).result(DISCORD_FLUSH_TIMEOUT_S)
+        except Exception:
+            pass
+        asyncio.run_coroutine_threadsafe(bot.close(), bot.loop)
+    sys.exit()
 
 
 @bot.event
@@ -54,9 +111,29 @@ async def on_ready():
     Bots behaviour when started.
     :return:
     """
+    global outbound
+    if outbound is None:
+        outbound = OutboundMessageQueue(asyncio.get_running_loop())
+    refresh_channel_ids()
+    bot_ready.set()
     bot.loop.create_task(send_server_status())
 
 
+@bot.event
+async def on_guild_channel_create(channel):
+    refresh_channel_ids()
+
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    refresh_channel_ids()
+
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    refresh_channel_ids()
+
+
 @bot.event
 async def on_message(message):
     """
@@ -81,7 +158,7 @@ async def on_message(message):
             await message.channel.send(f'Bye {username}.')
     if channel == ADMIN_CHANNEL_NAME:
         if user_message.lower().startswith(ADMIN_PREFIX):
-            print(f"{ADMIN_CHANNEL_NAME} message: {user_message}")
+            send_to_main(ADMIN_MESSAGE, user_message)
         else:
             await message.channel.send(f'{username} "{user_message}" is unrecognized command.')
 
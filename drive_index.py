@@ -0,0 +1,138 @@
+import json
+import os
+
+from constants import *
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+ZIP_MIME_TYPES = ("application/zip", "application/x-zip-compressed")
+FILE_FIELDS = "id, name, mimeType, size, parents, modifiedTime, trashed"
+# Fields of file kept in index
+INDEXED_FIELDS = ("id", "name", "mimeType", "size", "parents", "modifiedTime")
+
+
+def is_save_artifact(item: dict) -> bool:
+    """
+    :param item: Drive file resource.
+    :return: True for world folders, full saves and incremental deltas.
+    """
+    if item.get("mimeType") == FOLDER_MIME_TYPE:
+        return item.get("name") == SAVE_FOLDER_NAME
+    return item.get("mimeType") in ZIP_MIME_TYPES and \
+        (item.get("name") == SAVE_FILE_NAME or item.get("name", "").startswith(INCREMENTAL_DELTA_PREFIX))
+
+
+class DriveIndex:
+    def __init__(self, index_file: str = DRIVE_INDEX_FILE):
+        """
+        Local index of save artifacts on drive. It is filled by one filtered listing and later kept up to date with
+        drive's changes feed, so every sync costs one request when nothing changed, regardless of drive's size.
+        :param index_file: Json file where index and changes page token are kept between runs.
+        """
+        self.index_file = index_file
+        # File id -> indexed fields of file
+        self.files = {}
+        self.page_token = None
+
+    def load(self) -> None:
+        """
+        Loads index saved by previous run, missing or damaged file leaves index empty.
+        :return:
+        """
+        try:
+            with open(self.index_file, "r") as file:
+                data = json.load(file)
+            self.files = data["files"]
+            self.page_token = data["page_token"]
+        except (OSError, ValueError, KeyError):
+            self.files = {}
+            self.page_token = None
+
+    def save(self) -> None:
+        """
+        Writes index atomically, so interrupted write never leaves broken index.
+        :return:
+        """
+        temporary_file = f"{self.index_file}.tmp"
+        with open(temporary_file, "w") as file:
+            json.dump({"page_token": self.page_token, "files": self.files}, file)
+        os.replace(temporary_file, self.index_file)
+
+    def sync(self, service) -> int:
+        """
+        Brings index up to date with drive.
+        :param service: Google Drive API service object.
+        :return: Number of applied changes, -1 when index was rebuilt.
+        """
+        if self.page_token is None:
+            self.rebuild(service)
+            applied = -1
+        else:
+            try:
+                applied = self.apply_changes(service)
+            except Exception:
+                # Page token may expire, then the index has to be listed again
+                self.rebuild(service)
+                applied = -1
+        self.save()
+        return applied
+
+    def rebuild(self, service) -> None:
+        """
+        Lists all save artifacts on drive. Start token is taken before listing, so changes made during listing are
+        applied by the next sync.
+        :param service: Google Drive API service object.
+        :return:
+        """
+        self.page_token = service.changes().getStartPageToken().execute()["startPageToken"]
+        self.files = {}
+        query = f"trashed=false and (name='{SAVE_FILE_NAME}' or name contains '{INCREMENTAL_DELTA_PREFIX}' or " \
+                f"(name='{SAVE_FOLDER_NAME}' and mimeType='{FOLDER_MIME_TYPE}'))"
+        page_token = None
+        while True:
+            results = service.files().list(q=query, pageSize=1000, pageToken=page_token,
+                                           fields=f"nextPageToken, files({FILE_FIELDS})").execute()
+            for item in results.get("files", []):
+                self.update(item)
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+
+    def apply_changes(self, service) -> int:
+        """
+        Applies changes made on drive since the last sync.
+        :param service: Google Drive API service object.
+        :return: Number of changes.
+        """
+        applied = 0
+        page_token = self.page_token
+        while page_token:
+            results = service.changes().list(
+                pageToken=page_token, pageSize=1000,
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))").execute()
+            for change in results.get("changes", []):
+                if change.get("removed") or "file" not in change:
+                    self.files.pop(change["fileId"], None)
+                else:
+                    self.update(change["file"])
+                applied += 1
+            if "newStartPageToken" in results:
+                self.page_token = results["newStartPageToken"]
+            page_token = results.get("nextPageToken")
+        return applied
+
+    def update(self, item: dict) -> None:
+        """
+        Adds, updates or removes file from index.
+        :param item: Drive file resource.
+        :return:
+        """
+        if item.get("trashed") or not is_save_artifact(item):
+            self.files.pop(item["id"], None)
+        else:
+            self.files[item["id"]] = {field: item[field] for field in INDEXED_FIELDS if field in item}
+
+    def items(self) -> list:
+        """
+        :return: Indexed files as drive file resources.
+        """
+        return list(self.files.values())
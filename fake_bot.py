@@ -0,0 +1,63 @@
+"""
+Fake discord bot used for benchmarks and tests of bot handling without discord. It speaks the same framed protocol
+as discord_bot.py: every message from main app is "delivered" and confirmed by status message with the same fields,
+so main app can measure round trip. Behaviour is set by environment variables:
+FAKE_BOT_LATENCY_MS - delay of every delivery, like discord's API.
+FAKE_BOT_COMMANDS - admin commands separated by ";" sent to main app after start, for example "admin exit".
+FAKE_BOT_COMMAND_DELAY_S - delay before admin commands are sent.
+Usage, in place of bot's command:
+python fake_bot.py ADDRESS
+"""
+import os
+import sys
+import threading
+import time
+
+from bot_protocol import ADMIN_MESSAGE, STATUS_MESSAGE, STOP_MESSAGE, encode_message, read_message
+
+output_lock = threading.Lock()
+
+
+def send_to_main(message_type: str, text: str = "", **fields) -> None:
+    """
+    Writes message frame to parent process.
+    :param message_type: One of protocol message types.
+    :param text: Content of message.
+    :param fields: Additional fields of message.
+    :return:
+    """
+    with output_lock:
+        sys.stdout.buffer.write(encode_message(message_type, text, **fields))
+        sys.stdout.buffer.flush()
+
+
+def send_commands(commands: list, delay_s: float) -> None:
+    """
+    Sends admin commands like written by admin in discord.
+    :param commands: Commands.
+    :param delay_s: Delay before the first command.
+    :return:
+    """
+    time.sleep(delay_s)
+    for command in commands:
+        send_to_main(ADMIN_MESSAGE, command)
+
+
+def main() -> None:
+    latency_s = float(os.environ.get("FAKE_BOT_LATENCY_MS", 0)) / 1000
+    commands = [command.strip() for command in os.environ.get("FAKE_BOT_COMMANDS", "").split(";") if command.strip()]
+    if commands:
+        threading.Thread(target=send_commands, daemon=True,
+                         args=(commands, float(os.environ.get("FAKE_BOT_COMMAND_DELAY_S", 0)))).start()
+    while True:
+        message = read_message(sys.stdin.buffer)
+        if message is None or message["type"] == STOP_MESSAGE:
+            return
+        if latency_s:
+            time.sleep(latency_s)
+        fields = {key: value for key, value in message.items() if key not in ("type", "text")}
+        send_to_main(STATUS_MESSAGE, "delivered", delivered_type=message["type"], **fields)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Fake discord channel used for testing and measuring throughput of outgoing messages without network. It records every
+sent message with its send time instead of posting it. Usage, in place of channel given by discord client:
+channel = FakeChannel(1, latency_ms=50)
+outbound.put(channel, "line")
+"""
+import asyncio
+import time
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, latency_ms: float = 0):
+        """
+        Channel with async send like discord.TextChannel.
+        :param channel_id: ID of channel.
+        :param latency_ms: Delay of every send, like request to discord API.
+        """
+        self.id = channel_id
+        self.latency_s = latency_ms / 1000
+        # (monotonic send time, message)
+        self.sent = []
+
+    async def send(self, content: str) -> None:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        self.sent.append((time.monotonic(), content))
+
+    @property
+    def messages(self) -> list:
+        return [message for _, message in self.sent]
+
+    @property
+    def send_times(self) -> list:
+        return [send_time for send_time, _ in self.sent]
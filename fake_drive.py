@@ -0,0 +1,574 @@
+"""
+Fake Google Drive API used for benchmarks of uploads and downloads without network. It serves the endpoints used by
+ResumableUploader and ParallelDownloader and keeps uploaded files on local disk:
+POST /upload/drive/v3/files?uploadType=resumable - starts resumable upload session.
+PUT /upload/drive/v3/files?uploadType=resumable&upload_id=ID - uploads chunk with Content-Range.
+POST /drive/v3/files - creates file without content, for example folder.
+GET /drive/v3/files?q=QUERY&orderBy=modifiedTime desc - lists files, q supports conditions on name, mimeType,
+trashed, modifiedTime and parents joined with and, or, not and parentheses.
+GET /drive/v3/files/ID - metadata with size and md5Checksum.
+GET /drive/v3/files/ID?alt=media - content, Range header gives partial content.
+DELETE /drive/v3/files/ID - deletes file.
+GET /drive/v3/changes/startPageToken - token of the current end of changes feed.
+GET /drive/v3/changes?pageToken=TOKEN - changes of files since token, expired tokens give 400.
+FakeDriveService gives these endpoints the interface of googleapiclient's service.
+Usage, as standalone server:
+python fake_drive.py STORAGE_DIR
+with FAKE_DRIVE_PORT and FAKE_DRIVE_LATENCY_MS environment variables.
+"""
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+CONTENT_RANGE_RE = r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)"
+QUERY_TOKEN_RE = re.compile(r"\s*(?:([()])|'((?:\\.|[^'\\])*)'|(!=|<=|>=|=|<|>)|(\w+))")
+RANGE_RE = r"bytes=(\d+)-(\d*)"
+COPY_BUFFER_SIZE = 1024 * 1024
+# Every chunk of resumable upload but the last one must be multiple of this size
+CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_PAGE_SIZE = 100
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+COMPARISONS = {"=": lambda a, b: a == b, "!=": lambda a, b: a != b, "<": lambda a, b: a < b,
+               "<=": lambda a, b: a <= b, ">": lambda a, b: a > b, ">=": lambda a, b: a >= b}
+
+
+def compile_query(query: str):
+    """
+    Compiles drive search query into predicate of file metadata.
+    :param query: Query, for example "trashed=false and (name='a' or name contains 'b') and 'ID' in parents".
+    :return: Function (metadata) -> bool.
+    """
+    tokens = []
+    position = 0
+    while position < len(query.rstrip()):
+        match = QUERY_TOKEN_RE.match(query, position)
+        if match is None:
+            raise ValueError(f"Invalid query: {query}")
+        bracket, string, operator, word = match.groups()
+        if string is not None:
+            tokens.append(("string", re.sub(r"\\(.)", r"\1", string)))
+        else:
+            tokens.append(("word", bracket or operator or word))
+        position = match.end()
+    tokens.append(("end", None))
+    index = 0
+
+    def take(expected: str = None):
+        nonlocal index
+        kind, value = tokens[index]
+        if expected is not None and (kind != "word" or value != expected):
+            raise ValueError(f"Invalid query, {expected} expected: {query}")
+        index += 1
+        return kind, value
+
+    def peek_word():
+        kind, value = tokens[index]
+        return value if kind == "word" else None
+
+    def value_of(token: tuple):
+        kind, value = token
+        if kind == "word" and value in ("true", "false"):
+            return value == "true"
+        if kind != "string":
+            raise ValueError(f"Invalid query value {value}: {query}")
+        return value
+
+    def parse_or():
+        conditions = [parse_and()]
+        while peek_word() == "or":
+            take()
+            conditions.append(parse_and())
+        return lambda metadata: any(condition(metadata) for condition in conditions)
+
+    def parse_and():
+        conditions = [parse_atom()]
+        while peek_word() == "and":
+            take()
+            conditions.append(parse_atom())
+        return lambda metadata: all(condition(metadata) for condition in conditions)
+
+    def parse_atom():
+        if peek_word() == "(":
+            take()
+            condition = parse_or()
+            take(")")
+            return condition
+        if peek_word() == "not":
+            take()
+            condition = parse_atom()
+            return lambda metadata: not condition(metadata)
+        first = take()
+        if first[0] == "string":
+            take("in")
+            field = take()[1]
+            return lambda metadata: first[1] in metadata.get(field, [])
+        field = first[1]
+        operator = take()[1]
+        value = value_of(take())
+        if operator == "contains":
+            # Drive matches names by prefix
+            return lambda metadata: str(metadata.get(field, "")).startswith(value)
+        if operator not in COMPARISONS:
+            raise ValueError(f"Invalid query operator {operator}: {query}")
+        return lambda metadata: COMPARISONS[operator](metadata.get(field, False if field == "trashed" else ""),
+                                                      value)
+
+    predicate = parse_or()
+    if tokens[index][0] != "end":
+        raise ValueError(f"Invalid query, unexpected {tokens[index][1]}: {query}")
+    return predicate
+
+
+class FakeDrive:
+    def __init__(self, storage_dir: str, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0,
+                 persist_limit: int = None, max_page_size: int = 1000):
+        """
+        Serves fake drive in daemon thread, content of files is stored in storage directory.
+        :param storage_dir: Directory for uploaded files.
+        :param host: Address of listening socket.
+        :param port: Port of listening socket, 0 for any free one.
+        :param latency_ms: Delay added to every request.
+        :param persist_limit: Maximal number of bytes persisted from one upload request, the rest is dropped like by
+        interrupted request. None for no limit.
+        :param max_page_size: Maximal number of files or changes in one listing page, larger page sizes are cut.
+        """
+        self.storage_dir = storage_dir
+        self.address = (host, port)
+        self.latency_s = latency_ms / 1000
+        self.persist_limit = persist_limit
+        self.max_page_size = max_page_size
+        self.server = None
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        # File id -> metadata, content of file is in storage directory under its id
+        self.files = {}
+        # Upload id -> dictionary with metadata, received bytes and running md5
+        self.sessions = {}
+        # IDs of changed files in order of changes, page token is position in this list
+        self.changes = []
+        self.first_page_token = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def upload_url(self) -> str:
+        return f"{self.base_url}/upload/drive/v3/files"
+
+    @property
+    def files_url(self) -> str:
+        return f"{self.base_url}/drive/v3/files"
+
+    def start(self) -> None:
+        os.makedirs(self.storage_dir, exist_ok=True)
+        drive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Connections are kept alive like with real API
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                drive.handle(self, "POST")
+
+            def do_PUT(self):
+                drive.handle(self, "PUT")
+
+            def do_GET(self):
+                drive.handle(self, "GET")
+
+            def do_DELETE(self):
+                drive.handle(self, "DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(self.address, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def clear(self) -> None:
+        """
+        Removes all files and upload sessions.
+        :return:
+        """
+        with self.lock:
+            self.files.clear()
+            self.sessions.clear()
+            self.changes.clear()
+            self.first_page_token = 0
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+    def file_path(self, file_id: str) -> str:
+        return os.path.join(self.storage_dir, file_id)
+
+    def new_file(self, metadata: dict) -> dict:
+        """
+        :param metadata: Metadata sent by client.
+        :return: Metadata of new file with its id.
+        """
+        with self.lock:
+            file_id = f"fake{next(self.ids):08d}"
+        metadata = {"id": file_id, "name": metadata.get("name", file_id), "parents": metadata.get("parents", []),
+                "mimeType": metadata.get("mimeType", "application/octet-stream"), "size": "0",
+                "md5Checksum": hashlib.md5().hexdigest(), "modifiedTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z",
+                                                                                        time.gmtime())}
+        if metadata["mimeType"] == FOLDER_MIME_TYPE:
+            # Drive gives neither size nor checksum of folders
+            del metadata["size"], metadata["md5Checksum"]
+        return metadata
+
+    def store(self, metadata: dict) -> None:
+        """
+        Adds or updates file and records its change.
+        :param metadata: Metadata of file.
+        :return:
+        """
+        with self.lock:
+            self.files[metadata["id"]] = metadata
+            self.changes.append(metadata["id"])
+
+    def add_file(self, name: str, content: bytes = b"", parents: list = None,
+                 mime_type: str = "application/octet-stream", modified_time: str = None) -> dict:
+        """
+        Stores file directly, like one uploaded before.
+        :param name: Name of file.
+        :param content: Content of file.
+        :param parents: IDs of parent folders.
+        :param mime_type: Mime type, for example of folder.
+        :param modified_time: RFC 3339 modification time, current time by default.
+        :return: Metadata of file.
+        """
+        metadata = self.new_file({"name": name, "parents": parents or [], "mimeType": mime_type})
+        with open(self.file_path(metadata["id"]), "wb") as file:
+            file.write(content)
+        if mime_type != FOLDER_MIME_TYPE:
+            metadata["size"] = str(len(content))
+            metadata["md5Checksum"] = hashlib.md5(content).hexdigest()
+        metadata["modifiedTime"] = modified_time or metadata["modifiedTime"]
+        self.store(metadata)
+        return metadata
+
+    def trash_file(self, file_id: str) -> None:
+        self.store(dict(self.files[file_id], trashed=True))
+
+    def delete_file(self, file_id: str) -> None:
+        with self.lock:
+            self.files.pop(file_id, None)
+            self.changes.append(file_id)
+        if os.path.exists(self.file_path(file_id)):
+            os.remove(self.file_path(file_id))
+
+    def expire_page_tokens(self) -> None:
+        """
+        Makes all page tokens given so far invalid, like tokens which are too old.
+        :return:
+        """
+        with self.lock:
+            self.first_page_token = len(self.changes)
+
+    def page_size(self, query: dict) -> int:
+        return min(int(query.get("pageSize", DEFAULT_PAGE_SIZE)), self.max_page_size)
+
+    def list_files(self, query: dict) -> tuple:
+        """
+        :param query: Parameters q, orderBy, pageSize and pageToken of files.list.
+        :return: Tuple of (status, response).
+        """
+        try:
+            predicate = compile_query(query.get("q", "trashed=false"))
+        except ValueError as exception:
+            return 400, {"error": {"code": 400, "message": str(exception)}}
+        with self.lock:
+            files = [metadata for metadata in self.files.values() if predicate(metadata)]
+        order = query.get("orderBy", "")
+        if order.startswith("modifiedTime"):
+            files.sort(key=lambda metadata: metadata["modifiedTime"], reverse=order.endswith(" desc"))
+        start = int(query.get("pageToken", 0))
+        end = start + self.page_size(query)
+        response = {"files": files[start:end]}
+        if end < len(files):
+            response["nextPageToken"] = str(end)
+        return 200, response
+
+    def list_changes(self, query: dict) -> tuple:
+        """
+        :param query: Parameters pageToken and pageSize of changes.list.
+        :return: Tuple of (status, response).
+        """
+        with self.lock:
+            token = query.get("pageToken", "")
+            if not token.isdigit() or not self.first_page_token <= int(token) <= len(self.changes):
+                return 400, {"error": {"code": 400, "message": f"Invalid page token: {token}"}}
+            start = int(token)
+            end = min(start + self.page_size(query), len(self.changes))
+            changes = [{"fileId": file_id, "removed": False, "file": self.files[file_id]}
+                       if file_id in self.files else {"fileId": file_id, "removed": True}
+                       for file_id in self.changes[start:end]]
+            response = {"changes": changes}
+            if end < len(self.changes):
+                response["nextPageToken"] = str(end)
+            else:
+                response["newStartPageToken"] = str(end)
+        return 200, response
+
+    def handle(self, request: BaseHTTPRequestHandler, method: str) -> None:
+        """
+        Routes request to its endpoint.
+        :param request: Request handler.
+        :param method: HTTP method.
+        :return:
+        """
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        url = urlsplit(request.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/upload/drive/v3/files" and method == "POST":
+            self.start_upload(request)
+        elif url.path == "/upload/drive/v3/files" and method == "PUT" and query.get("upload_id") in self.sessions:
+            self.upload_chunk(request, query["upload_id"])
+        elif url.path == "/drive/v3/files" and method == "POST":
+            metadata = self.new_file(self.read_json(request))
+            self.store(metadata)
+            self.send_json(request, 200, metadata)
+        elif url.path == "/drive/v3/files" and method == "GET":
+            self.send_json(request, *self.list_files(query))
+        elif url.path == "/drive/v3/changes/startPageToken" and method == "GET":
+            self.send_json(request, 200, {"startPageToken": str(len(self.changes))})
+        elif url.path == "/drive/v3/changes" and method == "GET":
+            self.send_json(request, *self.list_changes(query))
+        elif url.path.startswith("/drive/v3/files/") and method == "DELETE" and \
+                url.path.split("/")[-1] in self.files:
+            self.delete_file(url.path.split("/")[-1])
+            request.send_response(204)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+        elif url.path.startswith("/drive/v3/files/") and method == "GET" and \
+                url.path.split("/")[-1] in self.files:
+            file_id = url.path.split("/")[-1]
+            if query.get("alt") == "media":
+                self.send_content(request, file_id)
+            else:
+                self.send_json(request, 200, self.files[file_id])
+        else:
+            self.discard_body(request)
+            self.send_json(request, 404, {"error": {"code": 404, "message": "Not found."}})
+
+    def start_upload(self, request: BaseHTTPRequestHandler) -> None:
+        metadata = self.new_file(self.read_json(request))
+        with self.lock:
+            upload_id = f"upload{next(self.ids):08d}"
+            self.sessions[upload_id] = {"metadata": metadata, "received": 0, "md5": hashlib.md5()}
+        open(self.file_path(metadata["id"]), "wb").close()
+        request.send_response(200)
+        request.send_header("Location", f"{self.upload_url}?uploadType=resumable&upload_id={upload_id}")
+        request.send_header("Content-Length", "0")
+        request.end_headers()
+
+    def upload_chunk(self, request: BaseHTTPRequestHandler, upload_id: str) -> None:
+        """
+        Appends chunk to file, bytes already received are skipped. Answers 308 with persisted range until the last
+        byte of file arrives, then 200 with file's metadata.
+        :param request: Request handler.
+        :param upload_id: Upload session id.
+        :return:
+        """
+        session = self.sessions[upload_id]
+        metadata = session["metadata"]
+        match = re.fullmatch(CONTENT_RANGE_RE, request.headers.get("Content-Range", ""))
+        if match is None:
+            self.discard_body(request)
+            self.send_json(request, 400, {"error": {"code": 400, "message": "Invalid Content-Range."}})
+            return
+        length = int(request.headers.get("Content-Length", 0))
+        if match[1] is not None and int(match[1]) > session["received"]:
+            self.discard_body(request)
+            self.send_json(request, 400, {"error": {"code": 400, "message": "Chunk does not continue upload."}})
+            return
+        if match[1] is not None and (match[3] == "*" or int(match[2]) + 1 < int(match[3])) and \
+                length % CHUNK_ALIGNMENT:
+            self.discard_body(request)
+            self.send_json(request, 400, {"error": {"code": 400, "message": "Chunk size is not multiple of 256 KiB."}})
+            return
+        skip = session["received"] - int(match[1]) if match[1] is not None else length
+        persist = self.persist_limit if self.persist_limit is not None else length
+        with open(self.file_path(metadata["id"]), "ab") as file:
+            while length:
+                data = request.rfile.read(min(length, COPY_BUFFER_SIZE))
+                if not data:
+                    break
+                length -= len(data)
+                if skip >= len(data):
+                    skip -= len(data)
+                    continue
+                data = data[skip:persist + skip]
+                skip = 0
+                persist -= len(data)
+                file.write(data)
+                session["md5"].update(data)
+                session["received"] += len(data)
+        if match[3] != "*" and session["received"] == int(match[3]):
+            metadata["size"] = str(session["received"])
+            metadata["md5Checksum"] = session["md5"].hexdigest()
+            self.store(metadata)
+            with self.lock:
+                self.sessions.pop(upload_id, None)
+            self.send_json(request, 200, {"id": metadata["id"]})
+            return
+        request.send_response(308)
+        if session["received"]:
+            request.send_header("Range", f"bytes=0-{session['received'] - 1}")
+        request.send_header("Content-Length", "0")
+        request.end_headers()
+
+    def send_content(self, request: BaseHTTPRequestHandler, file_id: str) -> None:
+        """
+        Sends whole file or its range.
+        :param request: Request handler.
+        :param file_id: ID of file.
+        :return:
+        """
+        size = int(self.files[file_id]["size"])
+        start, end = 0, size - 1
+        match = re.fullmatch(RANGE_RE, request.headers.get("Range", ""))
+        if match:
+            start = int(match[1])
+            end = min(int(match[2]), size - 1) if match[2] else size - 1
+            if start > end:
+                self.send_json(request, 416, {"error": {"code": 416, "message": "Range not satisfiable."}})
+                return
+        request.send_response(206 if match else 200)
+        request.send_header("Content-Type", "application/octet-stream")
+        request.send_header("Content-Length", str(end - start + 1))
+        if match:
+            request.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        request.end_headers()
+        with open(self.file_path(file_id), "rb") as file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining and (data := file.read(min(remaining, COPY_BUFFER_SIZE))):
+                request.wfile.write(data)
+                remaining -= len(data)
+
+    @staticmethod
+    def read_json(request: BaseHTTPRequestHandler) -> dict:
+        body = request.rfile.read(int(request.headers.get("Content-Length", 0)))
+        try:
+            return json.loads(body) if body else {}
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def discard_body(request: BaseHTTPRequestHandler) -> None:
+        length = int(request.headers.get("Content-Length", 0))
+        while length and (data := request.rfile.read(min(length, COPY_BUFFER_SIZE))):
+            length -= len(data)
+
+    @staticmethod
+    def send_json(request: BaseHTTPRequestHandler, status: int, content: dict) -> None:
+        body = json.dumps(content).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json; charset=UTF-8")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+class FakeDriveError(Exception):
+    def __init__(self, status: int, content: bytes):
+        """
+        Error response of fake drive, like HttpError of googleapiclient.
+        :param status: HTTP status.
+        :param content: Body of response.
+        """
+        super().__init__(f"Fake drive answered {status}: {content.decode('utf-8', 'replace')}")
+        self.status = status
+        self.content = content
+
+
+class FakeDriveRequest:
+    def __init__(self, method: str, url: str, parameters: dict):
+        self.method = method
+        self.url = url
+        self.parameters = {key: value for key, value in parameters.items() if value is not None}
+
+    def execute(self) -> dict:
+        """
+        Sends request.
+        :return: Decoded json response, empty for responses without body.
+        """
+        url = f"{self.url}?{urlencode(self.parameters)}" if self.parameters else self.url
+        try:
+            with urlopen(Request(url, method=self.method)) as response:
+                body = response.read()
+        except HTTPError as error:
+            raise FakeDriveError(error.code, error.read()) from None
+        return json.loads(body) if body else {}
+
+
+class FakeDriveResource:
+    def __init__(self, base_url: str, methods: dict):
+        """
+        Resource of fake drive service with methods returning requests.
+        :param base_url: URL of fake drive.
+        :param methods: Method name -> (HTTP method, path), path can contain {fileId}.
+        """
+        self.base_url = base_url
+        self.methods = methods
+
+    def __getattr__(self, name: str):
+        if name not in self.methods:
+            raise AttributeError(name)
+        http_method, path = self.methods[name]
+
+        def method(**parameters) -> FakeDriveRequest:
+            url = self.base_url + path.format(fileId=parameters.pop("fileId", ""))
+            return FakeDriveRequest(http_method, url, parameters)
+
+        return method
+
+
+class FakeDriveService:
+    def __init__(self, drive: FakeDrive):
+        """
+        Client of fake drive with interface of googleapiclient's drive v3 service, used in place of service built by
+        googleapiclient.discovery.build.
+        :param drive: Started fake drive.
+        """
+        self.base_url = drive.base_url
+
+    def files(self) -> FakeDriveResource:
+        return FakeDriveResource(self.base_url, {"list": ("GET", "/drive/v3/files"),
+                                                 "get": ("GET", "/drive/v3/files/{fileId}"),
+                                                 "delete": ("DELETE", "/drive/v3/files/{fileId}")})
+
+    def changes(self) -> FakeDriveResource:
+        return FakeDriveResource(self.base_url, {"getStartPageToken": ("GET", "/drive/v3/changes/startPageToken"),
+                                                 "list": ("GET", "/drive/v3/changes")})
+
+
+if __name__ == '__main__':
+    fake_drive = FakeDrive(sys.argv[1] if len(sys.argv) > 1 else "fake_drive",
+                           port=int(os.environ.get("FAKE_DRIVE_PORT", 0)),
+                           latency_ms=float(os.environ.get("FAKE_DRIVE_LATENCY_MS", 0)))
+    fake_drive.start()
+    print(f"Fake drive upload url: {fake_drive.upload_url}, files url: {fake_drive.files_url}", flush=True)
+    threading.Event().wait()
@@ -0,0 +1,177 @@
+"""
+Fake Forge server used for benchmarks of server handling without java and game files. It writes log lines in the
+format of Forge server, boot phases and "Done" line included, and answers the commands used by server control.
+Behaviour is set by environment variables:
+FAKE_SERVER_BOOT_LINES - number of mod loading lines written during boot.
+FAKE_SERVER_BOOT_S - duration of boot before "Done" line.
+FAKE_SERVER_STOP_S - duration of saving of worlds after /stop.
+FAKE_SERVER_NOISE_LINES_PER_S - lines written every second while server runs, like chatty mods.
+Commands:
+/stop or stop - saves worlds and ends with SERVER_STOPPED_PATTERN line.
+save-all flush, save-off, save-on, forge tps, list - answered as by real server.
+flood N - writes N lines as fast as possible and then "Flood of N lines done", used for throughput measurement.
+Usage, in place of server's command:
+python fake_server.py nogui
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from constants import SERVER_STOPPED_PATTERN
+
+# Lines are written in batches, so writing is not slower than reading on the other side
+BATCH_SIZE = 1000
+NOISE_TEMPLATES = [
+    "[Server thread/INFO] [minecraft/MinecraftServer]: Villager EntityVillager['Villager'/{n}, l='ServerLevel[world]', "
+    "x={x}.50, y=64.00, z={z}.50] died, message: 'Villager was squashed by a falling block'",
+    "[Server thread/WARN] [minecraft/ServerGamePacketListenerImpl]: Player{n} moved wrongly!",
+    "[Worker-Main-{w}/INFO] [create/]: Loaded contraption {n} at chunk [{x}, {z}] with 128 blocks",
+    "[Server thread/INFO] [ae2/]: Grid node {n} powered on at [{x}, 64, {z}] in minecraft:overworld",
+    "[Server thread/WARN] [minecraft/ChunkMap]: Skipping BlockEntity with id mod_{n}:machine at [{x}, 70, {z}]",
+]
+BOOT_TEMPLATE = "[modloading-worker-{w}/INFO] [net.minecraftforge.common.ForgeConfigSpec/]: Loaded config file " \
+                "mod_{n}-common.toml, {n} entries of {w} sections validated"
+output_lock = threading.Lock()
+stopping = threading.Event()
+
+
+def timestamp() -> str:
+    return datetime.now().strftime("%d%b%Y %H:%M:%S.%f")[:-3]
+
+
+def write_lines(lines: list) -> None:
+    """
+    Writes lines with Forge time prefix.
+    :param lines: Lines without time prefix.
+    :return:
+    """
+    prefix = f"[{timestamp()}] "
+    data = "".join(f"{prefix}{line}\n" for line in lines).encode("utf-8")
+    with output_lock:
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+
+def noise_lines(count: int, first: int = 0) -> list:
+    """
+    :param count: Number of lines.
+    :param first: Number of the first line, lines differ by it.
+    :return: Lines of running modded server.
+    """
+    return [NOISE_TEMPLATES[n % len(NOISE_TEMPLATES)].format(n=n, w=n % 8, x=n * 16 % 4096, z=n * 7 % 4096)
+            for n in range(first, first + count)]
+
+
+def boot(boot_lines: int, boot_s: float) -> None:
+    """
+    Writes boot log with phases recognized by server control spread over boot time.
+    :param boot_lines: Number of mod loading lines.
+    :param boot_s: Duration of boot.
+    :return:
+    """
+    start_time = time.perf_counter()
+    phases = [
+        "[main/INFO] [cpw.mods.modlauncher.Launcher/MODLAUNCHER]: ModLauncher running: args [--launchTarget, "
+        "forgeserver, --fml.forgeVersion, 47.2.0, --fml.mcVersion, 1.20.1]",
+        "[main/INFO] [minecraft/DedicatedServer]: Starting minecraft server version 1.20.1",
+        "[Server thread/INFO] [minecraft/MinecraftServer]: Preparing level \"world\"",
+    ]
+    for index, phase in enumerate(phases):
+        write_lines([phase])
+        for first in range(index * boot_lines // 3, (index + 1) * boot_lines // 3, BATCH_SIZE):
+            write_lines([BOOT_TEMPLATE.format(n=n, w=n % 8)
+                         for n in range(first, min(first + BATCH_SIZE, (index + 1) * boot_lines // 3))])
+        time.sleep(max(0.0, start_time + boot_s * (index + 1) / 3 - time.perf_counter()))
+    write_lines([f"[Server thread/INFO] [minecraft/DedicatedServer]: Done ({time.perf_counter() - start_time:.3f}s)! "
+                 f"For help, type \"help\""])
+
+
+def make_noise(lines_per_s: float) -> None:
+    """
+    Writes noise lines every second until server stops.
+    :param lines_per_s: Number of lines per second.
+    :return:
+    """
+    written = 0
+    while not stopping.wait(1):
+        write_lines(noise_lines(int(lines_per_s), written))
+        written += int(lines_per_s)
+
+
+def flood(count: int) -> None:
+    """
+    Writes given number of lines as fast as possible.
+    :param count: Number of lines.
+    :return:
+    """
+    for first in range(0, count, BATCH_SIZE):
+        write_lines(noise_lines(min(BATCH_SIZE, count - first), first))
+    write_lines([f"[Server thread/INFO] [minecraft/MinecraftServer]: Flood of {count} lines done"])
+
+
+def stop(stop_s: float) -> None:
+    """
+    Writes shutdown log, the last line is the one awaited by server control.
+    :param stop_s: Duration of saving.
+    :return:
+    """
+    stopping.set()
+    write_lines(["[Server thread/INFO] [minecraft/MinecraftServer]: Stopping server",
+                 "[Server thread/INFO] [minecraft/MinecraftServer]: Saving players",
+                 "[Server thread/INFO] [minecraft/MinecraftServer]: Saving worlds"])
+    for dimension in ("overworld", "the_nether", "the_end"):
+        time.sleep(stop_s / 3)
+        write_lines([f"[Server thread/INFO] [minecraft/MinecraftServer]: Saving chunks for level "
+                     f"'ServerLevel[world]'/minecraft:{dimension}",
+                     f"[Server thread/INFO] [minecraft/ChunkMap]: ThreadedAnvilChunkStorage ({dimension}): "
+                     f"All chunks are saved"])
+    write_lines([f"[Server thread/INFO] [minecraft/ChunkMap]: {SERVER_STOPPED_PATTERN}"])
+
+
+def answer(command: str) -> bool:
+    """
+    Reacts on command from server's input.
+    :param command: Command without newline.
+    :return: False when server stopped.
+    """
+    words = command.strip().split()
+    name = words[0].lstrip("/") if words else ""
+    if name == "stop":
+        stop(float(os.environ.get("FAKE_SERVER_STOP_S", 0)))
+        return False
+    if name == "save-all":
+        write_lines(["[Server thread/INFO] [minecraft/MinecraftServer]: Saving the game (this may take a moment!)",
+                     "[Server thread/INFO] [minecraft/MinecraftServer]: Saved the game"])
+    elif name == "save-off":
+        write_lines(["[Server thread/INFO] [minecraft/MinecraftServer]: Automatic saving is now disabled"])
+    elif name == "save-on":
+        write_lines(["[Server thread/INFO] [minecraft/MinecraftServer]: Automatic saving is now enabled"])
+    elif name == "forge" and words[1:] == ["tps"]:
+        write_lines(["[Server thread/INFO] [minecraft/MinecraftServer]: Dim minecraft:overworld (minecraft:overworld): "
+                     "Mean tick time: 0.781 ms. Mean TPS: 20.000",
+                     "[Server thread/INFO] [minecraft/MinecraftServer]: Overall: Mean tick time: 0.912 ms. "
+                     "Mean TPS: 20.000"])
+    elif name == "list":
+        write_lines(["[Server thread/INFO] [minecraft/MinecraftServer]: There are 0 of a max of 20 players online: "])
+    elif name == "flood" and len(words) == 2 and words[1].isdigit():
+        flood(int(words[1]))
+    elif name:
+        write_lines(["[Server thread/INFO] [minecraft/MinecraftServer]: Unknown or incomplete command, see below for "
+                     "error"])
+    return True
+
+
+def main() -> None:
+    boot(int(os.environ.get("FAKE_SERVER_BOOT_LINES", 3000)), float(os.environ.get("FAKE_SERVER_BOOT_S", 0)))
+    noise_lines_per_s = float(os.environ.get("FAKE_SERVER_NOISE_LINES_PER_S", 0))
+    if noise_lines_per_s:
+        threading.Thread(target=make_noise, args=(noise_lines_per_s,), daemon=True).start()
+    for command in sys.stdin:
+        if not answer(command):
+            return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Fake zrok or ngrok used for testing of tunnel handling without network. It forwards TCP connections from local
+port to server and writes log lines in the format of the real tunnel. Behaviour is set by environment variables:
+FAKE_TUNNEL_PORT - listening port, 0 for any free one.
+FAKE_TUNNEL_TARGET_PORT - port of server for zrok, ngrok takes it from command.
+FAKE_TUNNEL_START_DELAY_S - delay before tunnel reports its address.
+FAKE_TUNNEL_LATENCY_MS - delay added to every forwarded chunk of data.
+FAKE_TUNNEL_EXIT_AFTER_S - tunnel ends after given time, like a dying connection.
+Usage, in place of real commands:
+python fake_tunnel.py zrok share reserved --headless TOKEN
+python fake_tunnel.py ngrok tcp PORT --log stdout --log-format logfmt
+"""
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime
+
+
+def log_line(backend: str, message: str, **fields) -> None:
+    """
+    Writes log line in format of given backend, zrok to stderr as json and ngrok to stdout as logfmt.
+    :param backend: zrok or ngrok.
+    :param message: Message.
+    :param fields: Additional fields.
+    :return:
+    """
+    if backend == "zrok":
+        print(json.dumps({"level": "info", "msg": message, **fields}), file=sys.stderr, flush=True)
+    else:
+        extra = " ".join(f"{key}={value}" for key, value in fields.items())
+        print(f't={datetime.now().isoformat()} lvl=info msg="{message}" {extra}', flush=True)
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, latency_s: float) -> None:
+    try:
+        while data := await reader.read(64 * 1024):
+            if latency_s:
+                await asyncio.sleep(latency_s)
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def main(arguments: list) -> None:
+    backend = arguments[0]
+    target_port = int(arguments[2]) if backend == "ngrok" else int(os.environ.get("FAKE_TUNNEL_TARGET_PORT", 25565))
+    latency_s = float(os.environ.get("FAKE_TUNNEL_LATENCY_MS", 0)) / 1000
+
+    async def forward(client_reader, client_writer):
+        try:
+            server_reader, server_writer = await asyncio.open_connection("127.0.0.1", target_port)
+        except OSError:
+            client_writer.close()
+            return
+        try:
+            await asyncio.gather(pipe(client_reader, server_writer, latency_s),
+                                 pipe(server_reader, client_writer, latency_s))
+        except asyncio.CancelledError:
+            # Tunnel ends with connections still open
+            pass
+
+    server = await asyncio.start_server(forward, "127.0.0.1", int(os.environ.get("FAKE_TUNNEL_PORT", 0)))
+    port = server.sockets[0].getsockname()[1]
+    await asyncio.sleep(float(os.environ.get("FAKE_TUNNEL_START_DELAY_S", 0)))
+    if backend == "zrok":
+        log_line(backend, f"access your zrok share at the following endpoints: {arguments[-1]}",
+                 frontend=f"127.0.0.1:{port}")
+    else:
+        log_line(backend, "started tunnel", obj="tunnels", name="command_line", addr=f"//localhost:{target_port}",
+                 url=f"tcp://127.0.0.1:{port}")
+    exit_after_s = os.environ.get("FAKE_TUNNEL_EXIT_AFTER_S")
+    async with server:
+        if exit_after_s is None:
+            await server.serve_forever()
+        else:
+            await asyncio.sleep(float(exit_after_s))
+            log_line(backend, "tunnel session ended")
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,170 @@
+import os
+import shutil
+
+from constants import *
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux ioctl which makes copy-on-write clone of file (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def clone_file(source: str, target: str) -> bool:
+    """
+    Makes copy-on-write clone of file if file system supports it.
+    :param source: Path to source file.
+    :param target: Path to new file.
+    :return: True if file was cloned.
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(source, "rb") as source_file, open(target, "wb") as target_file:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+    except OSError:
+        return False
+    shutil.copystat(source, target)
+    return True
+
+
+class HotSnapshot:
+    def __init__(self, entries: list = DIRECTORIES_TO_ZIP, snapshot_dir: str = HOT_BACKUP_DIR, throttle=None):
+        """
+        Consistent copy of live save taken while server runs. Files are copied in advance with saving on, unchanged
+        files are hard linked from the previous snapshot. Only files modified since then are copied again in
+        finalize, which runs while saving is off, so the pause lasts as short as possible. Snapshot never links to
+        live files, because server rewrites region files in place.
+        :param entries: Live directories and files which are backed up.
+        :param snapshot_dir: Directory with snapshots, must be on the same drive as previous snapshot.
+        :param throttle: JobThrottle limiting copying in advance, copying during pause is never limited.
+        """
+        self.entries = entries
+        self.current_dir = os.path.join(snapshot_dir, "current")
+        self.next_dir = os.path.join(snapshot_dir, "next")
+        self.throttle = throttle
+        # Relative path -> (size, modification time in ns) of live file read before it was copied
+        self.files = {}
+        # Statistics
+        self.linked = 0
+        self.copied = 0
+
+    def live_files(self) -> dict:
+        """
+        :return: Dictionary of relative path -> (live path, size, modification time in ns).
+        """
+        files = {}
+        for item in self.entries:
+            if os.path.isfile(item):
+                stat = os.stat(item)
+                files[os.path.basename(item)] = (item, stat.st_size, stat.st_mtime_ns)
+            elif os.path.isdir(item):
+                base_name = os.path.basename(item)
+                for root, dirs, names in os.walk(item):
+                    for name in names:
+                        file_path = os.path.join(root, name)
+                        stat = os.stat(file_path)
+                        files[os.path.join(base_name, os.path.relpath(file_path, item))] = \
+                            (file_path, stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def snapshot_entries(self) -> list:
+        """
+        :return: Paths of backed up entries inside finalized snapshot, with the same base names as live ones.
+        """
+        return [os.path.join(self.current_dir, os.path.basename(entry)) for entry in self.entries
+                if os.path.lexists(os.path.join(self.current_dir, os.path.basename(entry)))]
+
+    def copy_file(self, relative_path: str, live_path: str, size: int, mtime_ns: int,
+                  throttled: bool = False) -> None:
+        """
+        Puts live file into next snapshot, status of live file must be read before copying, so changes made during
+        copying are detected by finalize.
+        :param relative_path: Path relative to snapshot.
+        :param live_path: Path to live file.
+        :param size: Size of live file.
+        :param mtime_ns: Modification time of live file.
+        :param throttled: Copies with throttle's rates.
+        :return:
+        """
+        target = os.path.join(self.next_dir, relative_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Target can be a hard link to previous snapshot, it must not be overwritten in place
+        if os.path.lexists(target):
+            os.remove(target)
+        if not clone_file(live_path, target):
+            if throttled and self.throttle:
+                self.copy_throttled(live_path, target)
+            else:
+                shutil.copy2(live_path, target)
+        self.files[relative_path] = (size, mtime_ns)
+        self.copied += 1
+
+    def copy_throttled(self, live_path: str, target: str) -> None:
+        """
+        Copies file in chunks limited by throttle, keeps its modification time.
+        :param live_path: Path to live file.
+        :param target: Path to new file.
+        :return:
+        """
+        with open(live_path, "rb") as source_file, open(target, "wb") as target_file:
+            while chunk := source_file.read(HASH_CHUNK_SIZE):
+                self.throttle.read(len(chunk))
+                self.throttle.write(len(chunk))
+                target_file.write(chunk)
+        shutil.copystat(live_path, target)
+
+    def prepare(self) -> None:
+        """
+        Builds next snapshot while saving is on. Files not modified since previous snapshot are hard linked.
+        :return:
+        """
+        shutil.rmtree(self.next_dir, ignore_errors=True)
+        os.makedirs(self.next_dir)
+        self.files = {}
+        for relative_path, (live_path, size, mtime_ns) in self.live_files().items():
+            previous_path = os.path.join(self.current_dir, relative_path)
+            try:
+                previous_stat = os.stat(previous_path)
+                if previous_stat.st_size == size and previous_stat.st_mtime_ns == mtime_ns:
+                    target = os.path.join(self.next_dir, relative_path)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.link(previous_path, target)
+                    self.files[relative_path] = (size, mtime_ns)
+                    self.linked += 1
+                    continue
+            except OSError:
+                pass
+            try:
+                self.copy_file(relative_path, live_path, size, mtime_ns, throttled=True)
+            except FileNotFoundError:
+                # File was removed by server after listing
+                pass
+
+    def finalize(self) -> int:
+        """
+        Copies files modified after prepare and removes deleted ones, must run while saving is off and world is
+        flushed. Then next snapshot becomes the current one.
+        :return: Number of files copied during pause.
+        """
+        live_files = self.live_files()
+        copied = 0
+        for relative_path, (live_path, size, mtime_ns) in live_files.items():
+            if self.files.get(relative_path) != (size, mtime_ns):
+                self.copy_file(relative_path, live_path, size, mtime_ns)
+                copied += 1
+        for relative_path in [path for path in self.files if path not in live_files]:
+            os.remove(os.path.join(self.next_dir, relative_path))
+            del self.files[relative_path]
+        shutil.rmtree(self.current_dir, ignore_errors=True)
+        os.replace(self.next_dir, self.current_dir)
+        return copied
+
+    def discard(self) -> None:
+        """
+        Removes not finalized snapshot, current one stays untouched.
+        :return:
+        """
+        shutil.rmtree(self.next_dir, ignore_errors=True)
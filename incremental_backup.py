@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import zipfile
+import zlib
+
+from constants import *
+from parallel_zip import ParallelZipWriter
+
+
+class IncrementalBackup:
+    def __init__(self, directory_list: list, manifest_path: str = BACKUP_MANIFEST_FILE):
+        """
+        Keeps local manifest of backed up files (size, modification time and content hash) and builds base or delta
+        archives containing only files changed since the last snapshot.
+        :param directory_list: List of directories and files which are part of the backup.
+        :param manifest_path: Path to local json manifest describing the last uploaded snapshot.
+        """
+        self.directory_list = directory_list
+        self.manifest_path = manifest_path
+        self.manifest = self.load_manifest()
+        # Manifest and changes of snapshot which was created but not yet committed (uploaded)
+        self.pending_manifest = None
+        self.pending_changes = ("base", [], [])
+        self.pending_directory_list = directory_list
+        self.pending_throttle = None
+
+    def load_manifest(self) -> dict:
+        """
+        Loads local manifest, if it does not exist or is broken returns empty one which forces new base snapshot.
+        :return: Manifest dictionary.
+        """
+        empty_manifest = {"folder_id": None, "sequence": 0, "files": {}}
+        if not os.path.exists(self.manifest_path):
+            return empty_manifest
+        try:
+            with open(self.manifest_path, "r") as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, json.JSONDecodeError):
+            return empty_manifest
+
+    def save_manifest(self) -> None:
+        """
+        Writes manifest to temporary file and replaces the old one, so crash during save never leaves broken manifest.
+        :return:
+        """
+        temporary_path = f"{self.manifest_path}.tmp"
+        with open(temporary_path, "w") as manifest_file:
+            json.dump(self.manifest, manifest_file)
+        os.replace(temporary_path, self.manifest_path)
+
+    def scan(self, directory_list: list = None) -> dict:
+        """
+        Walks through all backed up directories and files.
+        :param directory_list: Directories and files with the same base names as backed up ones, for example copy in
+        hot backup snapshot, backed up ones by default.
+        :return: Dictionary of archive name -> (absolute path, size, modification time in ns).
+        """
+        scanned = {}
+        for item in directory_list or self.directory_list:
+            if os.path.isfile(item):
+                stat = os.stat(item)
+                scanned[os.path.basename(item)] = (item, stat.st_size, stat.st_mtime_ns)
+            elif os.path.isdir(item):
+                base_name = os.path.basename(item)
+                for root, dirs, files in os.walk(item):
+                    for file in files:
+                        file_path = os.path.join(root, file)
+                        stat = os.stat(file_path)
+                        arc_name = os.path.join(base_name, os.path.relpath(file_path, item)).replace(os.sep, "/")
+                        scanned[arc_name] = (file_path, stat.st_size, stat.st_mtime_ns)
+        return scanned
+
+    @staticmethod
+    def hash_file(file_path: str, throttle=None) -> tuple:
+        """
+        Calculates sha1 and crc32 of file content reading it in constant size chunks. Crc32 is the checksum stored in
+        zip archives, so restore can compare members with files on disk without reading them.
+        :param file_path: Path to file.
+        :param throttle: JobThrottle limiting reading, None for no limit.
+        :return: Tuple of (sha1 hex digest, crc32).
+        """
+        digest = hashlib.sha1()
+        crc = 0
+        with open(file_path, "rb") as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                if throttle:
+                    throttle.read(len(chunk))
+                digest.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+        return digest.hexdigest(), crc
+
+    def diff(self, force_full: bool = False, directory_list: list = None, throttle=None):
+        """
+        Compares current state of files with manifest. Files with unchanged size and modification time are trusted
+        without hashing, others are hashed and compared by content.
+        :param force_full: Treats every file as changed, used for base snapshots.
+        :param directory_list: Directories and files compared instead of backed up ones.
+        :param throttle: JobThrottle limiting hashing, None for no limit.
+        :return: Tuple of (changed archive names, removed archive names, new files manifest).
+        """
+        old_files = self.manifest["files"]
+        scanned = self.scan(directory_list)
+        changed = []
+        new_files = {}
+        for arc_name, (file_path, size, mtime_ns) in scanned.items():
+            old_entry = old_files.get(arc_name)
+            if old_entry and len(old_entry) > 3 and old_entry[0] == size and old_entry[1] == mtime_ns:
+                new_files[arc_name] = old_entry
+                if force_full:
+                    changed.append(arc_name)
+                continue
+            file_hash, file_crc = self.hash_file(file_path, throttle)
+            new_files[arc_name] = [size, mtime_ns, file_hash, file_crc]
+            if force_full or not old_entry or old_entry[2] != file_hash:
+                changed.append(arc_name)
+        removed = [] if force_full else [arc_name for arc_name in old_files if arc_name not in scanned]
+        return changed, removed, new_files
+
+    def needs_base(self) -> bool:
+        """
+        Checks if next snapshot should be a full one.
+        :return: True if there is no base on drive or delta chain reached its limit.
+        """
+        return not self.manifest["folder_id"] or self.manifest["sequence"] >= INCREMENTAL_MAX_CHAIN_LENGTH
+
+    def prepare_snapshot(self, directory_list: list = None, throttle=None):
+        """
+        Compares files with manifest and decides kind of the next snapshot, archive is not written yet.
+        :param directory_list: Directories and files packed instead of backed up ones.
+        :param throttle: JobThrottle of background job, used also when archive is written.
+        :return: Dictionary with snapshot info or None if nothing has changed since the last snapshot.
+        """
+        is_base = self.needs_base()
+        changed, removed, new_files = self.diff(force_full=is_base, directory_list=directory_list, throttle=throttle)
+        if not is_base and not changed and not removed:
+            return None
+        sequence = 0 if is_base else self.manifest["sequence"] + 1
+        kind = "base" if is_base else "delta"
+        self.pending_manifest = {"folder_id": None if is_base else self.manifest["folder_id"],
+                                 "sequence": sequence, "files": new_files}
+        self.pending_changes = (kind, changed, removed)
+        self.pending_directory_list = directory_list or self.directory_list
+        self.pending_throttle = throttle
+        return {"kind": kind, "sequence": sequence, "changed": len(changed),
+                "removed": len(removed),
+                "file_name": SAVE_FILE_NAME if is_base else f"{INCREMENTAL_DELTA_PREFIX}{sequence:04d}.zip"}
+
+    def write_snapshot(self, output_zip_name) -> None:
+        """
+        Writes archive of snapshot prepared by prepare_snapshot.
+        :param output_zip_name: Path or writable file object of output zip.
+        :return:
+        """
+        kind, changed, removed = self.pending_changes
+        scanned_paths = self.scan_paths(changed, self.pending_directory_list)
+        metadata = {
+            "kind": kind,
+            "sequence": self.pending_manifest["sequence"],
+            "created": datetime.now().isoformat(),
+            "removed": removed,
+            # Size, hash, crc and modification time, which restore gives back to extracted files
+            "files": {arc_name: [entry[0], entry[2], entry[3], entry[1]]
+                      for arc_name, entry in self.pending_manifest["files"].items()}
+        }
+        with ParallelZipWriter(output_zip_name, throttle=self.pending_throttle) as zipf:
+            for arc_name in changed:
+                zipf.write(scanned_paths[arc_name], arc_name)
+            zipf.writestr(BACKUP_METADATA_NAME, json.dumps(metadata))
+
+    def scan_paths(self, arc_names: list, directory_list: list = None) -> dict:
+        """
+        Maps archive names back to paths on disk.
+        :param arc_names: Archive names.
+        :param directory_list: Directories and files scanned instead of backed up ones.
+        :return: Dictionary of archive name -> absolute path.
+        """
+        wanted = set(arc_names)
+        return {arc_name: entry[0] for arc_name, entry in self.scan(directory_list).items() if arc_name in wanted}
+
+    def commit(self, folder_id: str) -> None:
+        """
+        Marks pending snapshot as uploaded and saves manifest, must be called only after successful upload.
+        :param folder_id: Drive folder id which holds base and deltas of current chain.
+        :return:
+        """
+        if self.pending_manifest is None:
+            return
+        self.manifest = self.pending_manifest
+        self.manifest["folder_id"] = self.manifest["folder_id"] or folder_id
+        self.pending_manifest = None
+        self.save_manifest()
+
+    @staticmethod
+    def read_metadata(zip_ref: zipfile.ZipFile) -> dict:
+        """
+        Reads snapshot metadata from archive. Archives made before incremental backups are treated as base.
+        :param zip_ref: Opened zip file.
+        :return: Metadata dictionary.
+        """
+        if BACKUP_METADATA_NAME in zip_ref.namelist():
+            return json.loads(zip_ref.read(BACKUP_METADATA_NAME))
+        return {"kind": "base", "sequence": 0, "removed": [], "files": None}
+
+    def apply_archive(self, zip_file: str, destination: str, extract: bool = True) -> dict:
+        """
+        Extracts base or delta archive into destination and removes files deleted in this snapshot. Members get
+        modification times they had when snapshot was made.
+        :param zip_file: Path to archive.
+        :param destination: Directory where archive should be applied.
+        :param extract: False if members were already extracted during download.
+        :return: Metadata of applied snapshot.
+        """
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            metadata = self.read_metadata(zip_ref)
+            members = [member for member in zip_ref.namelist() if member != BACKUP_METADATA_NAME]
+            if extract:
+                zip_ref.extractall(destination, members)
+        for arc_name in metadata["removed"]:
+            removed_path = os.path.join(destination, arc_name)
+            if os.path.isfile(removed_path):
+                os.remove(removed_path)
+        self.restore_times(metadata, destination, members)
+        return metadata
+
+    @staticmethod
+    def restore_times(metadata: dict, destination: str, members: list) -> None:
+        """
+        Sets modification times from metadata to extracted members, content of members was checked by crc during
+        extraction, so the manifest can later trust files with matching size and time.
+        :param metadata: Metadata of applied snapshot.
+        :param destination: Directory where archive was applied.
+        :param members: Names of extracted members.
+        :return:
+        """
+        known_files = metadata.get("files") or {}
+        for arc_name in members:
+            entry = known_files.get(arc_name)
+            member_path = os.path.join(destination, arc_name)
+            if entry and len(entry) > 3 and os.path.isfile(member_path):
+                os.utime(member_path, ns=(entry[3], entry[3]))
+
+    def reset_manifest(self, metadata: dict, folder_id: str) -> None:
+        """
+        After restore manifest describes the last snapshot on drive. Hashes from its metadata are trusted for files
+        whose size and modification time match it. Files which differ keep hash of drive copy with unknown time, so
+        the next diff hashes and compares them, files not on drive are left out, so they are added.
+        :param metadata: Metadata of the last applied snapshot.
+        :param folder_id: Drive folder id which holds restored chain.
+        :return:
+        """
+        known_files = metadata.get("files") if metadata else None
+        files = {}
+        scanned = self.scan()
+        for arc_name, (file_path, size, mtime_ns) in scanned.items():
+            known_entry = known_files.get(arc_name) if known_files is not None else None
+            if known_entry and len(known_entry) > 3 and known_entry[0] == size and known_entry[3] == mtime_ns:
+                files[arc_name] = [size, mtime_ns, known_entry[1], known_entry[2]]
+            elif known_files is None:
+                # Save without metadata, files on disk are the saved ones
+                files[arc_name] = [size, mtime_ns, *self.hash_file(file_path)]
+        for arc_name, known_entry in (known_files or {}).items():
+            if arc_name not in files:
+                files[arc_name] = [known_entry[0], None, known_entry[1], known_entry[2]]
+        self.manifest = {"folder_id": folder_id, "sequence": metadata["sequence"] if metadata else 0, "files": files}
+        self.pending_manifest = None
+        self.save_manifest()
+
+    def known_crc(self, arc_name: str, file_path: str):
+        """
+        Gives crc32 of file on disk from manifest, if file was not modified since manifest was written.
+        :param arc_name: Archive name of file.
+        :param file_path: Path to file on disk.
+        :return: Crc32 or None if it is unknown.
+        """
+        entry = self.manifest["files"].get(arc_name)
+        if not entry or len(entry) < 4:
+            return None
+        stat = os.stat(file_path)
+        if entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+            return None
+        return entry[3]
@@ -0,0 +1,208 @@
+import ctypes
+import os
+import platform
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from constants import *
+
+# Windows background modes, lower both CPU and I/O priority
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+# Linux ioprio_set syscall
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_SET_SYSCALLS = {"x86_64": 251, "aarch64": 30}
+
+
+def set_io_priority(who: int, io_class: int) -> bool:
+    """
+    Sets I/O scheduling class on Linux, like ionice.
+    :param who: Thread or process id, 0 for calling thread.
+    :param io_class: 1 real time, 2 best effort, 3 idle.
+    :return: True if priority was set.
+    """
+    number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if number is None or not hasattr(ctypes, "CDLL"):
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    return libc.syscall(number, IOPRIO_WHO_PROCESS, who, io_class << IOPRIO_CLASS_SHIFT) == 0
+
+
+def lower_thread_priority(niceness: int = JOB_NICENESS, io_class: int = JOB_IO_CLASS) -> None:
+    """
+    Lowers CPU and I/O priority of calling thread.
+    :param niceness: Nice value on Linux.
+    :param io_class: I/O class on Linux.
+    :return:
+    """
+    if os.name == "nt":
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+        return
+    thread_id = threading.get_native_id()
+    try:
+        # On Linux every thread has its own nice value
+        os.setpriority(os.PRIO_PROCESS, thread_id, niceness)
+    except OSError:
+        pass
+    set_io_priority(thread_id, io_class)
+
+
+def lower_process_priority(niceness: int = JOB_NICENESS, io_class: int = JOB_IO_CLASS) -> None:
+    """
+    Lowers CPU and I/O priority of calling process, used as initializer of worker processes.
+    :param niceness: Nice value on Linux.
+    :param io_class: I/O class on Linux.
+    :return:
+    """
+    if os.name == "nt":
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_BEGIN)
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, niceness)
+    except OSError:
+        pass
+    set_io_priority(0, io_class)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Limits throughput to rate, bursts up to capacity pass without waiting.
+        :param rate: Bytes per second, None for no limit.
+        :param capacity: Size of burst in bytes, one second of rate by default.
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.last_time = time.monotonic()
+        self.lock = threading.Lock()
+        # Set when limit is lifted, wakes consumers sleeping off their debt
+        self.lifted = threading.Event()
+
+    def consume(self, amount: int) -> None:
+        """
+        Takes amount of tokens, sleeps if bucket went into debt. Amount can exceed capacity.
+        :param amount: Number of bytes.
+        :return:
+        """
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate) - amount
+            self.last_time = now
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait_time:
+            self.lifted.wait(wait_time)
+
+    def lift(self) -> None:
+        """
+        Removes limit for good, waiting consumers continue at once.
+        :return:
+        """
+        with self.lock:
+            self.rate = None
+        self.lifted.set()
+
+
+class JobThrottle:
+    def __init__(self, read_rate: float = JOB_READ_RATE, write_rate: float = JOB_WRITE_RATE,
+                 upload_rate: float = JOB_UPLOAD_RATE):
+        """
+        Bandwidth caps of background job and gate which stops it while server lags.
+        :param read_rate: Disk read limit in bytes per second, None for no limit.
+        :param write_rate: Disk write limit in bytes per second, None for no limit.
+        :param upload_rate: Upload limit in bytes per second, None for no limit.
+        """
+        self.read_bucket = TokenBucket(read_rate)
+        self.write_bucket = TokenBucket(write_rate)
+        self.upload_bucket = TokenBucket(upload_rate)
+        self.condition = threading.Condition()
+        self.paused_until = 0
+        self.lifted = False
+
+    def pause(self, duration_s: float) -> None:
+        """
+        Stops throttled work for given time, repeated calls extend the pause.
+        :param duration_s: Pause length in seconds.
+        :return:
+        """
+        with self.condition:
+            if not self.lifted:
+                self.paused_until = max(self.paused_until, time.monotonic() + duration_s)
+
+    def resume(self) -> None:
+        with self.condition:
+            self.paused_until = 0
+            self.condition.notify_all()
+
+    def lift(self) -> None:
+        """
+        Removes caps and pause gate for good, used when app stops and waits for running job.
+        :return:
+        """
+        for bucket in (self.read_bucket, self.write_bucket, self.upload_bucket):
+            bucket.lift()
+        with self.condition:
+            self.lifted = True
+            self.paused_until = 0
+            self.condition.notify_all()
+
+    @property
+    def paused(self) -> bool:
+        return self.paused_until > time.monotonic()
+
+    def wait_if_paused(self) -> None:
+        with self.condition:
+            while (remaining := self.paused_until - time.monotonic()) > 0:
+                self.condition.wait(remaining)
+
+    def read(self, amount: int) -> None:
+        self.wait_if_paused()
+        self.read_bucket.consume(amount)
+
+    def write(self, amount: int) -> None:
+        self.wait_if_paused()
+        self.write_bucket.consume(amount)
+
+    def upload(self, amount: int) -> None:
+        self.wait_if_paused()
+        self.upload_bucket.consume(amount)
+
+
+class JobExecutor:
+    def __init__(self, throttle: JobThrottle = None, niceness: int = JOB_NICENESS, io_class: int = JOB_IO_CLASS):
+        """
+        Runs backup jobs one by one in background thread with low CPU and I/O priority. Jobs get throttle which
+        they pass to their readers, writers and uploaders.
+        :param throttle: Bandwidth caps and pause gate shared by jobs.
+        :param niceness: Nice value of job thread on Linux.
+        :param io_class: I/O class of job thread on Linux.
+        """
+        self.throttle = throttle or JobThrottle()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job",
+                                           initializer=lower_thread_priority, initargs=(niceness, io_class))
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        """
+        Queues job.
+        :param function: Job function.
+        :return: Future of job result.
+        """
+        return self.executor.submit(function, *args, **kwargs)
+
+    def pause(self, duration_s: float) -> None:
+        self.throttle.pause(duration_s)
+
+    def resume(self) -> None:
+        self.throttle.resume()
+
+    def unthrottle(self) -> None:
+        self.throttle.lift()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,164 @@
+import re
+
+from constants import *
+
+# Events of server's output
+SERVER_STARTED_EVENT = "server_started"
+SERVER_STOPPED_EVENT = "server_stopped"
+PLAYER_JOINED_EVENT = "player_joined"
+PLAYER_LEFT_EVENT = "player_left"
+TPS_EVENT = "tps"
+CANT_KEEP_UP_EVENT = "cant_keep_up"
+CRASH_EVENT = "crash"
+SAVED_GAME_EVENT = "saved_game"
+# Phases of boot are events with prefixed phase name
+BOOT_PHASE_EVENT_PREFIX = "boot_"
+# Braces are quantifier only in these forms, otherwise they are literal characters
+QUANTIFIER_RE = re.compile(r"\{(?:\d+|\d*,\d*)\}")
+# Global flags at start of pattern
+INLINE_FLAGS_RE = re.compile(r"\(\?([aiLmsux]+)\)")
+# Number of characters after escape which are part of character code
+ESCAPE_ARGUMENT_LENGTHS = {"x": 2, "u": 4, "U": 8}
+
+
+def required_literal(pattern: str) -> str:
+    """
+    Finds the longest plain text which every match of pattern contains, parts inside groups, classes and optional
+    characters are left out.
+    :param pattern: Regex pattern.
+    :return: Literal text, empty if pattern has none or has alternation at top level.
+    """
+    if (flags := INLINE_FLAGS_RE.match(pattern)) and set(flags[1]) & {"i", "x"}:
+        # Case insensitive and verbose patterns match other text than written
+        return ""
+    runs = [""]
+    depth = 0
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        index += 1
+        literal = None
+        if char == "\\" and index < len(pattern):
+            escaped = pattern[index]
+            index += 1
+            if not escaped.isalnum():
+                literal = escaped
+            elif escaped in ESCAPE_ARGUMENT_LENGTHS:
+                # Arguments of character codes are not literal text
+                index += ESCAPE_ARGUMENT_LENGTHS[escaped]
+            elif escaped == "N" and pattern[index:index + 1] == "{":
+                index = pattern.find("}", index) + 1 or len(pattern)
+            elif escaped.isdigit():
+                # Octal code or group reference
+                while index < len(pattern) and pattern[index].isdigit():
+                    index += 1
+        elif char == "[":
+            # Class ends with the first "]" which is not its first character or escaped
+            index += 1 if pattern[index:index + 1] == "^" else 0
+            index += 1 if pattern[index:index + 1] == "]" else 0
+            while index < len(pattern) and pattern[index] != "]":
+                index += 2 if pattern[index] == "\\" else 1
+            index += 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return ""
+        elif char == "{" and (quantifier := QUANTIFIER_RE.match(pattern, index - 1)):
+            index = quantifier.end()
+        elif char not in ".^$*+?|":
+            literal = char
+        if literal is not None and depth == 0 and pattern[index:index + 1] not in ("*", "+", "?") and \
+                not QUANTIFIER_RE.match(pattern, index):
+            runs[-1] += literal
+        elif runs[-1]:
+            runs.append("")
+    return max(runs, key=len)
+
+
+class LogEventMatcher:
+    def __init__(self, patterns: dict = None):
+        """
+        Matches every output line against registered patterns and dispatches match of the recognized event to its
+        subscribers. Pattern runs only on lines containing its required literal text, which is checked much faster
+        than regex search, so most lines are passed by plain substring checks.
+        :param patterns: Dictionary of event name -> regex pattern registered at start.
+        """
+        self.patterns = {}
+        self.subscribers = {}
+        # List of (event, required literal, pattern), built on first match
+        self.compiled = None
+        for event, pattern in (patterns or {}).items():
+            self.register(event, pattern)
+
+    def register(self, event: str, pattern: str) -> None:
+        """
+        Registers pattern of event, list of patterns is rebuilt on next match.
+        :param event: Event name.
+        :param pattern: Regex pattern searched in line.
+        :return:
+        """
+        self.patterns[event] = re.compile(pattern)
+        self.compiled = None
+
+    def subscribe(self, event: str, callback) -> None:
+        """
+        Adds callback called with re.Match of event's own pattern (so its groups are numbered as in the pattern).
+        :param event: Event name.
+        :param callback: Function taking re.Match.
+        :return:
+        """
+        self.subscribers.setdefault(event, []).append(callback)
+
+    def compile(self) -> None:
+        """
+        Finds required literal of every pattern, case insensitive and verbose patterns have none.
+        :return:
+        """
+        self.compiled = [(event, "" if pattern.flags & (re.IGNORECASE | re.VERBOSE) else
+                          required_literal(pattern.pattern), pattern) for event, pattern in self.patterns.items()]
+
+    def match(self, line: str):
+        """
+        Finds the first registered event of line.
+        :param line: Output line.
+        :return: Tuple of (event name, re.Match of event's pattern) or None.
+        """
+        if self.compiled is None:
+            self.compile()
+        for event, literal, pattern in self.compiled:
+            if literal in line and (event_match := pattern.search(line)) is not None:
+                return event, event_match
+        return None
+
+    def dispatch(self, line: str):
+        """
+        Matches line and calls subscribers of its event.
+        :param line: Output line.
+        :return: Name of matched event or None.
+        """
+        matched = self.match(line)
+        if matched is None:
+            return None
+        event, event_match = matched
+        for callback in self.subscribers.get(event, []):
+            callback(event_match)
+        return event
+
+
+def server_log_matcher() -> LogEventMatcher:
+    """
+    :return: Matcher with all events of server's output registered.
+    """
+    return LogEventMatcher({
+        SERVER_STARTED_EVENT: SERVER_STARTED_RE,
+        SERVER_STOPPED_EVENT: f"{re.escape(SERVER_STOPPED_PATTERN)}$",
+        PLAYER_JOINED_EVENT: PLAYER_JOINED_RE,
+        PLAYER_LEFT_EVENT: PLAYER_LEFT_RE,
+        TPS_EVENT: TPS_RE,
+        CANT_KEEP_UP_EVENT: CANT_KEEP_UP_RE,
+        CRASH_EVENT: CRASH_RE,
+        SAVED_GAME_EVENT: SAVED_GAME_RE,
+        **{f"{BOOT_PHASE_EVENT_PREFIX}{phase}": pattern for phase, pattern in BOOT_PHASE_PATTERNS.items()},
+    })
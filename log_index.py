@@ -0,0 +1,279 @@
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from constants import *
+from log_events import server_log_matcher
+from log_pipeline import CONTROL_SOURCE, SERVER_SOURCE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, time TEXT NOT NULL, source TEXT NOT NULL, event TEXT,
+                                    message TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS records_time ON records (time);
+CREATE INDEX IF NOT EXISTS records_source_time ON records (source, time);
+CREATE INDEX IF NOT EXISTS records_event_time ON records (event, time);
+CREATE VIRTUAL TABLE IF NOT EXISTS records_text USING fts5(message, content='records', content_rowid='id');
+CREATE TABLE IF NOT EXISTS archives (size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, PRIMARY KEY (size, mtime_ns));
+"""
+# Log files written by log pipeline, rotated ones are compressed
+LOG_FILE_PATTERNS = ("*.jsonl", "*.jsonl.*.gz")
+# Relative time of query, for example 7d, 12h or 30m
+RELATIVE_TIME_RE = r"^(\d+)([dhm])$"
+RELATIVE_TIME_UNITS = {"d": "days", "h": "hours", "m": "minutes"}
+
+
+def parse_time(value: str, now: datetime = None) -> str:
+    """
+    :param value: Relative time (7d, 12h, 30m) or ISO date and time.
+    :param now: Current time.
+    :return: ISO time comparable with indexed times.
+    """
+    if match := re.match(RELATIVE_TIME_RE, value):
+        now = now or datetime.now()
+        return (now - timedelta(**{RELATIVE_TIME_UNITS[match[2]]: int(match[1])})).isoformat(timespec="milliseconds")
+    return datetime.fromisoformat(value).isoformat(timespec="milliseconds")
+
+
+def parse_query(query: str) -> dict:
+    """
+    Parses query of user, key=value words are conditions and the other ones are searched text.
+    For example "event=player_joined since=7d Steve".
+    :param query: Query text.
+    :return: Keyword arguments of LogIndex.search.
+    """
+    conditions = {}
+    words = []
+    for word in query.split():
+        key, separator, value = word.partition("=")
+        if separator and key in ("source", "event", "since", "until", "limit"):
+            conditions[key] = value
+        else:
+            words.append(word)
+    if words:
+        conditions["text"] = " ".join(words)
+    for key in ("since", "until"):
+        if key in conditions:
+            conditions[key] = parse_time(conditions[key])
+    if "limit" in conditions:
+        conditions["limit"] = int(conditions["limit"])
+    return conditions
+
+
+class LogIndex:
+    def __init__(self, db_file: str = LOG_INDEX_FILE, batch_size: int = LOG_INDEX_BATCH_SIZE,
+                 commit_period_s: float = LOG_INDEX_COMMIT_PERIOD_S):
+        """
+        On-disk index of log records by time, source, event type and full text of message. Records are added by
+        handler running on log listener's thread and committed in batches.
+        :param db_file: Path to SQLite database.
+        :param batch_size: Number of pending records which causes commit.
+        :param commit_period_s: Maximal time of record waiting for commit.
+        """
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.batch_size = batch_size
+        self.commit_period_s = commit_period_s
+        self.lock = threading.Lock()
+        self.pending = []
+        self.last_commit_time = time.monotonic()
+        self.matcher = server_log_matcher()
+        self.closed = False
+
+    def event_of(self, source: str, message: str):
+        """
+        :param source: Source of record.
+        :param message: Message of record.
+        :return: Event recognized in server's line or None.
+        """
+        if source != SERVER_SOURCE:
+            return None
+        matched = self.matcher.match(message)
+        return matched[0] if matched else None
+
+    def add(self, record_time: str, source: str, message: str) -> None:
+        """
+        Queues record, it is committed with batch.
+        :param record_time: ISO time of record.
+        :param source: Source of record.
+        :param message: Message of record.
+        :return:
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.pending.append((record_time, source, self.event_of(source, message), message))
+            if len(self.pending) >= self.batch_size or \
+                    time.monotonic() - self.last_commit_time >= self.commit_period_s:
+                self.commit()
+
+    def commit(self) -> None:
+        """
+        Writes pending records, must be called with lock held.
+        :return:
+        """
+        if self.pending:
+            with self.connection:
+                self.insert(self.pending)
+            self.pending = []
+        self.last_commit_time = time.monotonic()
+
+    def insert(self, records: list, skip_existing: bool = False) -> int:
+        """
+        Inserts records in transaction opened by caller.
+        :param records: List of (time, source, event, message).
+        :param skip_existing: Skips records which are already indexed, used for archives.
+        :return: Number of inserted records.
+        """
+        inserted = 0
+        for record in records:
+            if skip_existing and self.connection.execute(
+                    "SELECT 1 FROM records WHERE time = ? AND source = ? AND message = ?",
+                    (record[0], record[1], record[3])).fetchone():
+                continue
+            row_id = self.connection.execute(
+                "INSERT INTO records (time, source, event, message) VALUES (?, ?, ?, ?)", record).lastrowid
+            self.connection.execute("INSERT INTO records_text (rowid, message) VALUES (?, ?)", (row_id, record[3]))
+            inserted += 1
+        return inserted
+
+    def read_archive(self, path: str):
+        """
+        :param path: Path to json lines log file, compressed with gzip if its name ends with .gz.
+        :return: Generator of records (time, source, event, message), broken lines are skipped.
+        """
+        with (gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else
+              open(path, "r", encoding="utf-8")) as file:
+            for line in file:
+                try:
+                    item = json.loads(line)
+                    yield item["time"], item["source"], self.event_of(item["source"], item["message"]), \
+                        item["message"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def backfill(self, logs_dir: str = LOGS_DIR, live_file: str = LOG_NAME) -> int:
+        """
+        Indexes log files written before index existed or while it was disabled, including rotated and compressed
+        ones. Each file is read once, it is recognized by size and modification time which rotation does not change.
+        Records indexed when they were logged are skipped. Plain text .log files of old versions are not indexed.
+        :param logs_dir: Directory with log files.
+        :param live_file: Log file being written now, its records are indexed live.
+        :return: Number of added records.
+        """
+        paths = sorted({path for pattern in LOG_FILE_PATTERNS for path in glob.glob(os.path.join(logs_dir, pattern))})
+        added = 0
+        for path in paths:
+            if os.path.abspath(path) == os.path.abspath(live_file):
+                continue
+            try:
+                stat = os.stat(path)
+                with self.lock:
+                    if self.closed or self.connection.execute(
+                            "SELECT 1 FROM archives WHERE size = ? AND mtime_ns = ?",
+                            (stat.st_size, stat.st_mtime_ns)).fetchone():
+                        continue
+                records = list(self.read_archive(path))
+            except (OSError, EOFError):
+                continue
+            for start in range(0, len(records), self.batch_size):
+                with self.lock:
+                    if self.closed:
+                        return added
+                    # Pending live records are written first, so they are not indexed twice
+                    self.commit()
+                    with self.connection:
+                        added += self.insert(records[start:start + self.batch_size], skip_existing=True)
+            with self.lock:
+                if self.closed:
+                    return added
+                with self.connection:
+                        self.connection.execute("INSERT OR IGNORE INTO archives (size, mtime_ns) VALUES (?, ?)",
+                                            (stat.st_size, stat.st_mtime_ns))
+        return added
+
+    def search(self, text: str = None, source: str = None, event: str = None, since: str = None, until: str = None,
+               limit: int = LOG_INDEX_QUERY_LIMIT) -> list:
+        """
+        Finds records fulfilling all given conditions.
+        :param text: Words which message must contain.
+        :param source: Source of record.
+        :param event: Event type, name of log event.
+        :param since: The oldest ISO time.
+        :param until: The newest ISO time.
+        :param limit: Maximal number of records.
+        :return: List of (time, source, event, message) from the newest.
+        """
+        conditions = []
+        arguments = []
+        if text:
+            # Words are searched as phrase prefixes, so special characters of FTS syntax are not interpreted
+            conditions.append("id IN (SELECT rowid FROM records_text WHERE records_text MATCH ?)")
+            arguments.append(" ".join('"' + word.replace('"', '""') + '"*' for word in text.split()))
+        for column, operator, value in (("source", "=", source), ("event", "=", event), ("time", ">=", since),
+                                        ("time", "<=", until)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                arguments.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock:
+            self.commit()
+            return self.connection.execute(f"SELECT time, source, event, message FROM records {where} "
+                                           f"ORDER BY time DESC LIMIT ?", arguments + [limit]).fetchall()
+
+    def query_text(self, query: str) -> str:
+        """
+        Runs query of user and formats results.
+        :param query: Query text, see parse_query.
+        :return: Found records as text, from the oldest.
+        """
+        try:
+            conditions = parse_query(query)
+        except ValueError as exception:
+            return f"Wrong log query: {exception}"
+        start_time = time.perf_counter()
+        records = self.search(**conditions)
+        lines = [f"Found {len(records)} log records in {(time.perf_counter() - start_time) * 1000:.1f}ms."]
+        for record_time, source, event, message in reversed(records):
+            lines.append(f"[{record_time}] [{source}{'/' + event if event else ''}]: "
+                         f"{message[:LOG_INDEX_MESSAGE_LENGTH]}")
+        return "\n".join(lines)
+
+    def handler(self) -> logging.Handler:
+        """
+        :return: Handler adding records to index, for log listener.
+        """
+        return LogIndexHandler(self)
+
+    def close(self) -> None:
+        """
+        Commits pending records and closes database, records added later are dropped.
+        :return:
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.commit()
+            self.connection.close()
+            self.closed = True
+
+
+class LogIndexHandler(logging.Handler):
+    def __init__(self, log_index: LogIndex):
+        super().__init__()
+        self.log_index = log_index
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.log_index.add(datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+                           record.name if record.name != "root" else CONTROL_SOURCE, record.getMessage())
+
+    def flush(self) -> None:
+        with self.log_index.lock:
+            if not self.log_index.closed:
+                self.log_index.commit()
@@ -0,0 +1,113 @@
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from datetime import datetime
+
+from constants import *
+
+# Sources of log records, names of their loggers
+CONTROL_SOURCE = "control"
+SERVER_SOURCE = "server"
+ZROK_SOURCE = "zrok"
+NGROK_SOURCE = "ngrok"
+BOT_SOURCE = "bot"
+# Prefixes of log_file_message which name source instead of level
+PREFIX_SOURCES = {ZROK_PREFIX: ZROK_SOURCE, NGROK_PREFIX: NGROK_SOURCE, BOT_PREFIX: BOT_SOURCE}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        :param record: Log record, logger name is its source.
+        :return: Record as one line of json.
+        """
+        return json.dumps({
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "source": record.name if record.name != "root" else CONTROL_SOURCE,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }, ensure_ascii=False)
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    def __init__(self, file_name: str, max_bytes: int = LOG_MAX_BYTES, interval_s: float = LOG_ROTATE_INTERVAL_S,
+                 backup_count: int = LOG_BACKUP_COUNT):
+        """
+        Rotates log file when it exceeds size or interval, rotated files are compressed with gzip.
+        :param file_name: Path to log file.
+        :param max_bytes: Maximal size of log file.
+        :param interval_s: Maximal time covered by one log file.
+        :param backup_count: Number of kept rotated files.
+        """
+        super().__init__(file_name, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.interval_s = interval_s
+        self.rollover_at = time.time() + interval_s
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self.compress
+
+    @staticmethod
+    def compress(source: str, destination: str) -> None:
+        """
+        :param source: Path to closed log file.
+        :param destination: Path to compressed file.
+        :return:
+        """
+        with open(source, "rb") as source_file, gzip.open(destination, "wb") as destination_file:
+            shutil.copyfileobj(source_file, destination_file)
+        os.remove(source)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        """
+        Size is checked by position in the file, base class formats every record a second time and checks the file
+        on disk, which doubled the cost of each record.
+        :param record: Log record.
+        :return: True if file should be rotated before the record.
+        """
+        if time.time() >= self.rollover_at:
+            return True
+        if self.stream is None:
+            self.stream = self._open()
+        return 0 < self.maxBytes <= self.stream.tell()
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval_s
+
+
+def start_logging(file_name: str = LOG_NAME, handlers: tuple = ()) -> logging.handlers.QueueListener:
+    """
+    Routes all log records through queue to listener thread, which is the only one writing log file, so threads
+    reading sub-processes' output never wait for disk. Listener is stopped and flushed at exit.
+    :param file_name: Path to log file.
+    :param handlers: Additional handlers run on listener's thread.
+    :return: Started listener.
+    """
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    file_handler = CompressingRotatingFileHandler(file_name)
+    file_handler.setFormatter(JsonLinesFormatter())
+    record_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(record_queue, file_handler, *handlers)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG)
+    root_logger.addHandler(logging.handlers.QueueHandler(record_queue))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def log_record(message: str, prefix: str = "INFO") -> None:
+    """
+    Logs message of server control, prefix is either level name or name of source.
+    :param message: Message without time prefix.
+    :param prefix: Level name or ZROK_PREFIX, NGROK_PREFIX, BOT_PREFIX.
+    :return:
+    """
+    level = logging.getLevelName(prefix)
+    logging.getLogger(PREFIX_SOURCES.get(prefix, CONTROL_SOURCE)).log(
+        level if isinstance(level, int) else logging.INFO, message)
@@ -2,12 +2,11 @@
 # https://www.python.org/downloads/release/python-3118/
 # My libraries
 import argparse
-import errno
+import atexit
 import io
-import json
+import logging
 import re
 import shutil
-import socket
 import subprocess
 import sys
 import threading
@@ -19,10 +18,35 @@ import zipfile
 
 from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import Request, AuthorizedSession
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from requests.adapters import HTTPAdapter
 
+from bot_protocol import CHAT_MESSAGE, ADMIN_MESSAGE, STATUS_MESSAGE, STOP_MESSAGE, encode_message
 from constants import *
+from drive_index import DriveIndex
+from hot_backup import HotSnapshot
+from incremental_backup import IncrementalBackup
+from job_executor import JobExecutor
+from log_events import (BOOT_PHASE_EVENT_PREFIX, CANT_KEEP_UP_EVENT, CRASH_EVENT, PLAYER_JOINED_EVENT,
+                        PLAYER_LEFT_EVENT, SAVED_GAME_EVENT, SERVER_STARTED_EVENT, SERVER_STOPPED_EVENT, TPS_EVENT,
+                        server_log_matcher)
+from log_index import LogIndex
+from log_pipeline import SERVER_SOURCE, BOT_SOURCE, start_logging, log_record
+from metrics import MetricsSampler, MetricsExporter
+from parallel_zip import ParallelZipWriter
+from parallel_download import ParallelDownloader
+from staged_restore import StagedRestore
+from streaming_upload import ResumableUploader, upload_while_writing
+from port_allocator import PortAllocator
+from process_hub import ProcessHub
+from retention import RetentionPolicy, batch_delete
+from save_catalog import SaveCatalog, IndexedSaveCatalog
+from server_boot import BootTimer, server_command
+from supervisor import Supervisor, SERVER, TUNNEL, BOT, STARTING, READY, STOPPING, STOPPED
+from tunnel_manager import TunnelManager, ZrokBackend, NgrokBackend
+from tunnel_monitor import TunnelMonitor, status_ping
+from tracing import Tracer, traced
 from sensitive_data import ZROK_TOKEN
 
 
@@ -33,62 +57,100 @@ class ManageServer:
         :param standard_process: Flag which indicated default processing strategy execution.
         :param reset_flag: Indicates that app is during reset and input from user should not be proceeded.
         """
+        # Spans of app's phases, trace is written after start and at exit
+        self.tracer = Tracer()
+        atexit.register(self.tracer.export)
         # Processes
         self.server_process = None
         self.tcp_process = None
         self.discord_bot_process = None
-        # Main threads
-        self.server_listener_thread = None
-        self.discord_bot_thread = None
-        # Logger set up
-        self.logger = logging.getLogger()
-        self.logger.setLevel(logging.DEBUG)
+        self.supervisor = Supervisor()
+        # One event loop thread handles input and output of all sub-processes
+        self.process_hub = ProcessHub()
+        self.process_hub.start()
+        self.server_start_time = None
+        self.server_command_description = None
+        self.boot_timer = BootTimer()
+        # Server's output events
+        self.log_events = server_log_matcher()
+        self.last_lag_notify_time = 0
+        self.subscribe_log_events()
+        # Logger set up, server's console is recorded with its own source
+        os.makedirs(LOGS_DIR, exist_ok=True)
+        self.log_index = LogIndex() if USE_LOG_INDEX else None
+        if self.log_index:
+            # Registered before log listener, so queued records are indexed before index is closed
+            atexit.register(self.log_index.close)
+        self.log_listener = start_logging(handlers=(self.log_index.handler(),) if self.log_index else ())
+        if self.log_index:
+            # Logs of previous runs, rotated ones included
+            threading.Thread(target=self.log_index.backfill, daemon=True).start()
+        self.server_logger = logging.getLogger(SERVER_SOURCE)
+        self.bot_logger = logging.getLogger(BOT_SOURCE)
         # Flags
-        self.use_zrok_ngrok = True  # Flag which indicates usage of ZROK [True] or NGROK [False] # TODO set as IN
         self.standard_process = standard_process
-        self.server_started = False
         self.tcp_address_found = False
-        self.server_stopped = False
         self.reset_app = False
         self.external_stop = False
         # Port variable
         self.free_port = None
+        self.port_allocator = PortAllocator()
         self.log_file_message("Searching for free port.")
         self.find_free_port()
         # Google drive processing variables
-        self.drive_files_list = []
+        self.save_catalog = None
+        # Service and session are built once and reuse their connections
+        self.drive_service = None
+        self.drive_session = None
+        self.drive_index = DriveIndex()
+        self.drive_index.load()
+        # Only one backup at a time uses incremental manifest and drive
+        self.backup_lock = threading.Lock()
+        # Backups of running server are low priority jobs limited in bandwidth
+        self.job_executor = JobExecutor()
+        self.game_saved = threading.Event()
+        # Health of running server
+        self.metrics = MetricsSampler()
+        self.metrics_exporter = MetricsExporter(self.metrics.ring)
+        self.incremental_backup = IncrementalBackup(DIRECTORIES_TO_ZIP)
         # Tcp communication variables
         self.extracted_address = ""
+        self.tunnel_manager = TunnelManager(self.process_hub, [ZrokBackend(ZROK_TOKEN), NgrokBackend()],
+                                            self.log_file_message)
+        self.tunnel_monitor = TunnelMonitor()
+        # Monitor's failover and stopping of app do not change tunnel at the same time
+        self.tunnel_lock = threading.Lock()
+        self.tunnel_stopping = False
 
         if self.standard_process:
             standard_start = not reset_flag
             self.run_app(standard_start)
 
+    @property
+    def server_started(self) -> bool:
+        """
+        :return: True if server reported that it is ready at any time.
+        """
+        return self.supervisor.has_reached(SERVER, READY)
+
+    @property
+    def server_stopped(self) -> bool:
+        """
+        :return: True if server saved all dimensions or its process ended.
+        """
+        return self.supervisor.state(SERVER) == STOPPED
+
+    @traced()
     def find_free_port(self) -> None:
         """
-        Function searches for free port in localhost in range from 49152 to 65536.
+        Function reserves free port for server, last working one if it is still free.
         If found will be saved to variable if not further app execution will be stopped.
         :return:
         """
-        # https://en.wikipedia.org/wiki/Registered_port
-        port_out = None
-        for port in range(49152, 65536):
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex(('localhost', port))
-            sock.close()
-
-            if result == 0:  # If the connection was successful, the port is not free
-                continue
-            elif result == errno.ECONNREFUSED:  # Connection refused, likely means the port is free
-                port_out = port
-                break
-            else:
-                # Handle other error cases if needed
-                self.log_file_message(f"Error checking port {port}: {result}")
-
-        self.free_port = port_out
+        self.free_port = self.port_allocator.allocate()
         if self.free_port:
-            self.log_file_message(f"Free port found: {self.free_port}.")
+            self.log_file_message(f"Free port found: {self.free_port} in "
+                                  f"{self.port_allocator.allocation_time_s * 1000:.2f}ms.")
         else:
             self.log_file_message("Free port not found.")
             self.standard_process = False
@@ -100,15 +162,27 @@ class ManageServer:
         :param start_flag: Indicates that app is during standard start, not reboot.
         :return:
         """
-        self.check_credentials()
-        self.download_last_save(start_flag)
-        self.change_config_port()
-        self.run_server()
+        with self.tracer.span("startup") as startup:
+            self.check_credentials()
+            self.download_last_save(start_flag)
+            self.change_config_port()
+            self.run_server()
+            if self.server_started:
+                self.connect_tunnels()
+                self.run_discord_bot()
+        if USE_TRACING:
+            self.log_file_message(f"Startup phases: {self.tracer.summary(startup)}.")
+            self.tracer.export()
         if self.server_started:
-            self.connect_zrok() if self.use_zrok_ngrok else self.connect_ngrok()
-            self.log_file_message("Starting discord bot thread.")
-            self.discord_bot_thread = threading.Thread(target=self.run_discord_bot)
-            self.discord_bot_thread.start()
+            self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [Server control/INFO]: "
+                                  f"Server booted with {self.server_command_description}: "
+                                  f"{self.boot_timer.report()}.", send_to_admin=True)
+            if USE_HOT_BACKUPS:
+                threading.Thread(target=self.schedule_hot_backups, daemon=True).start()
+            if USE_METRICS:
+                threading.Thread(target=self.schedule_metrics, daemon=True).start()
+            if USE_TUNNEL_MONITOR:
+                threading.Thread(target=self.schedule_tunnel_monitor, daemon=True).start()
             # Run while true console
             while True:
                 self.console_interface()
@@ -119,11 +193,13 @@ class ManageServer:
                     # wait a moment to make output visible
                     time.sleep(5)
                     break
+            self.metrics_exporter.stop()
+            self.process_hub.stop()
 
         else:
-            self.log_file_message(f"Server starting time out exceeded: "
-                                  f"{SERVER_START_TIMEOUT_S} limit.")
+            self.log_file_message("Server did not start, app stops.")
 
+    @traced()
     def check_credentials(self):
         """
         Informs user about current status of credentials.json used by Google Drive service. If modify date of this file
@@ -149,6 +225,7 @@ class ManageServer:
             self.log_file_message(f"No {credentials_name} file found.")
             raise Exception("Stopping further execution.")
 
+    @traced()
     def change_config_port(self):
         """
         After finding free port to connect server, changes its value in server's properties file before starting
@@ -167,172 +244,288 @@ class ManageServer:
         """
         Takes input message and creates communicate with time prefix. Then info is sent to console and logg file.
         :param message_content: String which should be sent.
-        :param mess_prefix: Prefix used before every message after time.
+        :param mess_prefix: Prefix used before every message after time, level name or name of source.
         :return:
         """
-        message = f"[{str(datetime.now()).split(' ')[-1].split('.')[0]}] [Server control/{mess_prefix}]: " \
-                  f"{message_content}"
-        print(message)
-        self.logger.info(f"{message}")
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] [Server control/{mess_prefix}]: {message_content}")
+        log_record(message_content, mess_prefix)
 
+    @traced("server_boot")
     def run_server(self):
         """
-        Runs server's thread and waits in case of start-up timeout.
-        After correct activation calls server's listener thread.
+        Runs server's subprocess on process hub and waits in case of start-up timeout.
+        After correct activation server's output is passed to on_server_line.
         :return:
         """
-        # Create a Thread object and pass server run function to it
-        server_start_time = time.time()
-        self.log_file_message("Starting server thread.")
-        serv_thread = threading.Thread(target=self.run_server_proc)
-        serv_thread.start()
-        while int(time.time() - server_start_time) < SERVER_START_TIMEOUT_S and not self.server_started:
-            pass
-        serv_thread.join()
-        self.log_file_message("Server started properly.")
-        self.log_file_message("Starting server listener thread.")
+        # https://minecraft.wiki/w/Tutorials/Setting_up_a_server
+        # https://discordpy.readthedocs.io/en/latest/intents.html
+        # https://stackoverflow.com/questions/70920148/pycord-message-content-is-empty
+        command, self.server_command_description = server_command()
+        self.log_file_message(f"Starting server subprocess with {self.server_command_description}.")
+        self.supervisor.set_state(SERVER, STARTING)
+        self.server_start_time = time.time()
+        # Reservation is held until the last moment, so nothing else takes the port in the meantime
+        self.port_allocator.release()
+        self.boot_timer.start()
+        self.server_process = self.process_hub.spawn(SERVER, command, on_line=self.on_server_line,
+                                                     on_close=self.on_server_close, cwd=SERVER_DIR)
+        self.metrics.attach(self.server_process.pid)
+        self.log_file_message("Recording server console...")
+        state = self.supervisor.wait_for(SERVER, READY, timeout=SERVER_START_TIMEOUT_S)
+        if state is None:
+            self.log_file_message(f"Server starting time out exceeded: {SERVER_START_TIMEOUT_S} limit.")
+            self.supervisor.terminate_process(SERVER, self.server_process, PROCESS_EXIT_TIMEOUT_S)
+        elif state == STOPPED:
+            # Output ended before server was ready, process exits right after it
+            self.supervisor.stop_process(SERVER, self.server_process, PROCESS_EXIT_TIMEOUT_S)
+            self.log_file_message(f"Server exited during startup with exit code {self.server_process.returncode}.",
+                                  mess_prefix="ERROR")
         if self.server_started:
-            self.server_listener_thread = threading.Thread(target=self.server_listener)
-            self.server_listener_thread.start()
+            self.log_file_message("Server started properly.")
 
-    def run_server_proc(self):
+    def subscribe_log_events(self):
         """
-        Runs server's subprocess and check by Regex if everything started correctly.
+        Connects events recognized in server's output with their handlers, including messages to discord.
         :return:
         """
-        # https://minecraft.wiki/w/Tutorials/Setting_up_a_server
-        # https://discordpy.readthedocs.io/en/latest/intents.html
-        # https://stackoverflow.com/questions/70920148/pycord-message-content-is-empty
-        os.chdir(SERVER_DIR)
-        self.log_file_message("Starting server subprocess.")
-        self.server_process = subprocess.Popen(RUN_SERVER_COMMAND, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        server_start_time = time.time()
-        self.log_file_message("Recording server console...")
-        for line in iter(self.server_process.stdout.readline, ""):
-            line = line.decode('utf-8', errors='ignore')
-            print(line[:-2])
-            if match := re.search(SERVER_STARTED_RE, line):
-                result = match[1]
-                self.log_file_message(f"Server started in: {result}.")
-                self.log_file_message(f"Whole server environment build process took: ~.-"
-                                      f"{int(time.time() - server_start_time)}s.")
-                self.server_started = True
-                break
-            elif int(time.time() - server_start_time) > SERVER_START_TIMEOUT_S:
-                self.log_file_message(f"Server starting time out exceeded: "
-                                      f"{SERVER_START_TIMEOUT_S} limit.")
-        os.chdir(CURRENT_DIR)
-        self.log_file_message("Server thread ended.")
+        self.log_events.subscribe(SERVER_STARTED_EVENT, self.on_server_started)
+        self.log_events.subscribe(SERVER_STOPPED_EVENT, self.on_server_saved)
+        self.log_events.subscribe(SAVED_GAME_EVENT, lambda match: self.game_saved.set())
+        self.log_events.subscribe(PLAYER_JOINED_EVENT,
+                                  lambda match: self.send_bot_message(f"{match[1]} joined the server."))
+        self.log_events.subscribe(PLAYER_JOINED_EVENT, lambda match: self.metrics.player_joined(match[1]))
+        self.log_events.subscribe(PLAYER_LEFT_EVENT,
+                                  lambda match: self.send_bot_message(f"{match[1]} left the server."))
+        self.log_events.subscribe(PLAYER_LEFT_EVENT, lambda match: self.metrics.player_left(match[1]))
+        self.log_events.subscribe(CANT_KEEP_UP_EVENT, self.on_server_lag)
+        self.log_events.subscribe(TPS_EVENT, self.on_server_tps)
+        for phase in BOOT_PHASE_PATTERNS:
+            self.log_events.subscribe(f"{BOOT_PHASE_EVENT_PREFIX}{phase}",
+                                      lambda match, phase=phase: self.boot_timer.mark(phase))
+            self.log_events.subscribe(f"{BOOT_PHASE_EVENT_PREFIX}{phase}",
+                                      lambda match, phase=phase: self.tracer.instant(phase))
+        self.log_events.subscribe(CRASH_EVENT, lambda match: self.send_bot_message(
+            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [Server control/ERROR]: Server crashed, "
+            f"report: {match[1]}", send_to_admin=True))
 
-    def server_listener(self):
+    def on_server_line(self, line_text: str):
         """
-        Function called by server sub-process listening thread to provide output from console to user.
-        If output line will equal standard last line after /stop command, changes flag of app termination.
+        Called by process hub with every line of server's output. Provides output to user, records it in log file and
+        dispatches events recognized in line.
+        :param line_text: Decoded line without newline.
         :return:
         """
-        for line in iter(self.server_process.stdout.readline, b''):
-            try:
-                line_text = line.decode('utf-8')[:-2]
-                print(line_text)
-                if line_text.endswith(SERVER_STOPPED_PATTERN):
-                    self.server_stopped = True
-                    break
-            except UnicodeDecodeError as exception:
-                self.log_file_message(f"Exception: {exception}. Line from server listener cannot be decoded")
+        print(line_text)
+        self.server_logger.info(line_text)
+        self.log_events.dispatch(line_text)
 
-    def connect_ngrok(self):
+    def on_server_started(self, match: re.Match):
         """
-        Creates temporary ngrok log file and run its subprocess.
+        Marks server as ready after "Done" line.
+        :param match: Match of SERVER_STARTED_RE.
         :return:
         """
-        # https://www.sitepoint.com/use-ngrok-test-local-site/
-        # https://www.endtoend.ai/tutorial/ngrok-ssh-forwarding/
-        os.chdir(NGROK_DIR)
-        # Clearing the previous log
-        self.log_file_message("Clearing ngrok temporary log file.", mess_prefix=NGROK_PREFIX)
-        open(OUT_NGROK_FILE, 'w').close()
-        with open(OUT_NGROK_FILE, "r") as output_file:
-            run_ngrok_command = ["ngrok", "tcp", f"{self.free_port}", "--log", f"{OUT_NGROK_FILE}"]
-            self.log_file_message("Staring ngrok subprocess.", mess_prefix=NGROK_PREFIX)
-            self.tcp_process = subprocess.Popen(run_ngrok_command, stdout=subprocess.DEVNULL,
-                                                stderr=subprocess.DEVNULL)
-            self.get_tcp_address(output_file)
-            output_file.close()
-        os.chdir(CURRENT_DIR)
-
-    def get_tcp_address(self, output_file: io.TextIOWrapper) -> None:
-        """
-        Gives few second for ngrok to start connection.
-        Checks its output temporary log file and if found saves it to variable and changes tcp_address_found flag.
-        :param output_file:
-        :return:
-        """
-        # Give ngrok some time for stabilization
-        time.sleep(NGROK_STABILIZATION_TIME_S)
-        log_content = "".join(output_file.readlines())
-        # Search for the TCP_RE pattern in the logs
-        if match := re.search(TCP_RE, log_content):
-            result = match[1]
-            self.log_file_message(f"Extracted server tcp address: {result}", mess_prefix=NGROK_PREFIX)
-            self.extracted_address = result
-            self.tcp_address_found = True
-        else:
-            self.log_file_message("Server tcp address not found.", mess_prefix=NGROK_PREFIX)
+        if self.server_started:
+            return
+        self.log_file_message(f"Server started in: {match[1]}.")
+        self.log_file_message(f"Whole server environment build process took: ~.-"
+                              f"{int(time.time() - self.server_start_time)}s.")
+        self.boot_timer.mark(BOOT_DONE_PHASE)
+        self.tracer.instant(BOOT_DONE_PHASE)
+        self.log_file_message(f"Server boot phases: {self.boot_timer.report()}.")
+        if regression := self.boot_timer.finish(self.server_command_description):
+            self.log_file_message(regression, mess_prefix="WARNING")
+        self.port_allocator.save_last_port()
+        self.supervisor.set_state(SERVER, READY)
+
+    def on_server_saved(self, match: re.Match):
+        """
+        Marks server as stopped after standard last line after /stop command.
+        :param match: Match of SERVER_STOPPED_PATTERN.
+        :return:
+        """
+        if self.server_started:
+            self.supervisor.set_state(SERVER, STOPPED)
 
-    def connect_zrok(self):
+    def on_server_lag(self, match: re.Match):
         """
-        Runs zrok process with fixed timeout.
+        Pauses background jobs and informs admins about server overload, at most once per LAG_NOTIFY_PERIOD_S.
+        :param match: Match of CANT_KEEP_UP_RE.
         :return:
         """
+        self.job_executor.pause(JOB_LAG_PAUSE_S)
+        if time.time() - self.last_lag_notify_time < LAG_NOTIFY_PERIOD_S:
+            return
+        self.last_lag_notify_time = time.time()
+        self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [Server control/WARNING]: "
+                              f"Server can't keep up, running {match[1]}ms behind.", send_to_admin=True)
+
+    def on_server_tps(self, match: re.Match):
+        """
+        Records tick timing in metrics and pauses background jobs while server's TPS is under JOB_MIN_TPS.
+        :param match: Match of TPS_RE.
+        :return:
+        """
+        self.metrics.tick_timing(float(match[1]), float(match[2]))
+        if float(match[2]) < JOB_MIN_TPS:
+            self.job_executor.pause(JOB_LAG_PAUSE_S)
+
+    def on_server_close(self):
+        """
+        Called by process hub when server's output ended, also before server was ready.
+        :return:
+        """
+        self.supervisor.set_state(SERVER, STOPPED)
+
+    def connect_tunnel(self, backend: str) -> bool:
+        """
+        Starts tunnel and waits until it reports its public address or its start timeout passes. The address is
+        published to bot, which updates it without restart.
+        :param backend: ZROK_BACKEND or NGROK_BACKEND.
+        :return: True if tunnel is ready.
+        """
         # https://blog.openziti.io/minecraft-over-zrok
-        run_zrok_command = ["zrok", "share", "reserved", "--headless", ZROK_TOKEN]
-        self.tcp_process = subprocess.Popen(run_zrok_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                                            stderr=subprocess.PIPE)
-        zrok_start_time = time.time()
-        while True:
-            line = self.tcp_process.stderr.readline().decode('utf-8')
-            line_dict = {"msg": "default Zrok message"}
-            try:
-                line_dict = json.loads(line)
-            except json.JSONDecodeError as e:
-                print("Error decoding Zrok output line:", e)
-            self.log_file_message(line_dict["msg"], mess_prefix=ZROK_PREFIX)
-            if ZROK_TOKEN in line:
-                self.extracted_address = ZROK_TOKEN
-                self.tcp_address_found = True
-                break
-            elif int(time.time() - zrok_start_time) > ZROK_START_TIMEOUT_S:
-                break
+        # https://www.sitepoint.com/use-ngrok-test-local-site/
+        prefix = self.tunnel_manager.backends[backend].prefix
+        self.log_file_message(f"Starting {backend} subprocess.", mess_prefix=prefix)
+        self.supervisor.set_state(TUNNEL, STARTING)
+        start_time = time.perf_counter()
+        address = self.tunnel_manager.start(backend, self.free_port)
+        self.tcp_process = self.tunnel_manager.process
+        if address is None:
+            self.log_file_message(f"Server tcp address not found, {backend} did not report it in time.",
+                                  mess_prefix=prefix)
+            self.supervisor.terminate_process(TUNNEL, self.tcp_process, PROCESS_EXIT_TIMEOUT_S)
+            return False
+        self.log_file_message(f"Extracted server tcp address: {address} in "
+                              f"{(time.perf_counter() - start_time) * 1000:.0f}ms.", mess_prefix=prefix)
+        self.extracted_address = address
+        self.tcp_address_found = True
+        self.supervisor.set_state(TUNNEL, READY)
+        if USE_TUNNEL_MONITOR and self.tunnel_manager.backend.probe_address(address) is None:
+            self.log_file_message(f"Latency of {backend} tunnel is not probed, latency failover is disabled and tunnel "
+                                  f"is switched only when its process ends. Set ZROK_PROBE_ADDRESS in constants.py "
+                                  f"to enable it.", mess_prefix="WARNING")
+        self.send_bot_frame(STATUS_MESSAGE, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                                            f"[Server control/INFO]: Server address {address}.", address=address)
+        return True
+
+    def connect_ngrok(self) -> bool:
+        return self.connect_tunnel(NGROK_BACKEND)
 
+    def connect_zrok(self) -> bool:
+        return self.connect_tunnel(ZROK_BACKEND)
+
+    @traced("tunnel_connect")
+    def connect_tunnels(self, backends: list = TUNNEL_BACKENDS) -> bool:
+        """
+        Starts the first backend which becomes ready.
+        :param backends: Names of backends in order of preference.
+        :return: True if any tunnel is ready.
+        """
+        for backend in backends:
+            if self.connect_tunnel(backend):
+                return True
+        return False
+
+    def schedule_tunnel_monitor(self):
+        """
+        Probes tunnel every TUNNEL_PROBE_PERIOD_S until server starts stopping and switches tunnel when it is
+        unhealthy.
+        :return:
+        """
+        while self.supervisor.wait_for(SERVER, STOPPING, timeout=TUNNEL_PROBE_PERIOD_S) is None:
+            problem = self.probe_tunnel()
+            with self.tunnel_lock:
+                if self.tunnel_stopping:
+                    break
+                if problem:
+                    self.failover_tunnel(problem)
+
+    def probe_tunnel(self):
+        """
+        Pings server with server list ping through tunnel's public address and records latency.
+        :return: Description of tunnel's problem or None if it is healthy.
+        """
+        if not self.tunnel_manager.running:
+            return "tunnel process is not running"
+        probe_address = self.tunnel_manager.backend.probe_address(self.tunnel_manager.address)
+        if probe_address is None:
+            return None
+        try:
+            latency_ms, _ = status_ping(probe_address)
+            self.tunnel_monitor.record(latency_ms)
+        except (OSError, ValueError) as exception:
+            self.log_file_message(f"Tunnel probe failed: {exception}", mess_prefix="WARNING")
+            self.tunnel_monitor.record(None)
+        return self.tunnel_monitor.problem()
+
+    def failover_tunnel(self, problem: str):
+        """
+        Stops unhealthy tunnel and starts the other backend, or the same one again if the other does not start.
+        New address is posted to users.
+        :param problem: Description of tunnel's problem.
+        :return:
+        """
+        current = self.tunnel_manager.backend.name if self.tunnel_manager.backend else None
+        self.log_file_message(f"Tunnel {current} is unhealthy, {problem}. {self.tunnel_monitor.summary()}",
+                              mess_prefix="WARNING")
+        self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [Server control/WARNING]: "
+                              f"Tunnel {current} is unhealthy, {problem}. Switching tunnel.", send_to_admin=True)
+        self.supervisor.terminate_process(TUNNEL, self.tcp_process, PROCESS_EXIT_TIMEOUT_S)
+        self.tcp_address_found = False
+        self.tunnel_monitor.reset()
+        backends = [backend for backend in TUNNEL_BACKENDS if backend != current]
+        if current in TUNNEL_BACKENDS:
+            backends.append(current)
+        if self.connect_tunnels(backends):
+            self.send_bot_message(f"Server address changed, new address: {self.extracted_address}")
+        else:
+            self.log_file_message("No tunnel started, next try after probe period.", mess_prefix="ERROR")
+
+    @traced("bot_start")
     def run_discord_bot(self):
         """
-        Runs bots subprocess and redirects its output to current console with Bot prefix.
+        Runs bots subprocess on process hub, messages from it are handled by on_bot_message.
         :return:
         """
         # https://www.geeksforgeeks.org/discord-bot-in-python/
         self.log_file_message("Starting discord bot subprocess.")
         run_bot_command = [PYTHON_DIR, "discord_bot.py", f"{self.extracted_address}"]
-        self.discord_bot_process = subprocess.Popen(run_bot_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        for line in iter(self.discord_bot_process.stdout.readline, ""):
-            line_text = line.decode('utf-8', errors='ignore')
-            if not line_text:
-                self.log_file_message(line_text, mess_prefix=BOT_PREFIX)
-            if line_text.lower().startswith(ADMIN_PREFIX) and EXTERNAL_SAVE_PATTERN in line_text.lower():
-                self.log_file_message(f" Admin save command received.")
-                self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-                                      f"[Server control/INFO]:Admin save command received.", send_to_admin=True)
-                self.external_stop = True
-                self.stop_app(update_saves=True)
-                break
-            if line_text.lower().startswith(ADMIN_PREFIX) and EXTERNAL_STOP_PATTERN in line_text.lower():
-                self.log_file_message(f" Admin stop command received.")
-                self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-                                      f"[Server control/INFO]:Admin stop command received.", send_to_admin=True)
-                self.external_stop = True
-                self.stop_app()
-                break
-            if self.server_stopped:
-                break
+        self.discord_bot_process = self.process_hub.spawn(BOT, run_bot_command, on_line=self.on_bot_message,
+                                                          framed=True)
+        self.supervisor.set_state(BOT, READY)
+
+    def on_bot_message(self, message: dict):
+        """
+        Called by process hub with every message from bot, reacts on admin commands from discord.
+        Stopping blocks until server ends, so it runs in its own thread instead of the hub's loop.
+        :param message: Decoded protocol message.
+        :return:
+        """
+        self.bot_logger.debug(f"{message['type']}: {message.get('text', '')}")
+        if self.external_stop or self.server_stopped or message["type"] != ADMIN_MESSAGE:
+            return
+        line_text = message["text"]
+        # Query can contain any words, so it is recognized before other commands
+        if line_text.lower().startswith(f"{ADMIN_PREFIX} {EXTERNAL_LOGS_PATTERN}"):
+            self.send_bot_message(self.query_logs(line_text[len(f"{ADMIN_PREFIX} {EXTERNAL_LOGS_PATTERN}"):]),
+                                  send_to_admin=True)
+        elif line_text.lower().startswith(ADMIN_PREFIX) and EXTERNAL_SAVE_PATTERN in line_text.lower():
+            self.log_file_message(f" Admin save command received.")
+            self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                                  f"[Server control/INFO]:Admin save command received.", send_to_admin=True)
+            self.external_stop = True
+            threading.Thread(target=self.stop_app, kwargs={"update_saves": True}).start()
+        elif line_text.lower().startswith(ADMIN_PREFIX) and EXTERNAL_STOP_PATTERN in line_text.lower():
+            self.log_file_message(f" Admin stop command received.")
+            self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                                  f"[Server control/INFO]:Admin stop command received.", send_to_admin=True)
+            self.external_stop = True
+            threading.Thread(target=self.stop_app).start()
+        elif line_text.lower().startswith(ADMIN_PREFIX) and EXTERNAL_METRICS_PATTERN in line_text.lower():
+            self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                                  f"[Server control/INFO]: {self.metrics.summary()}", send_to_admin=True)
 
     def console_interface(self):
         """
@@ -346,18 +539,38 @@ class ManageServer:
             self.stop_app(update_saves=True)
         elif command.lower() == "reset":
             self.reset_app = True
-            self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-                                  f"[Server control/INFO]: Server status reset.", send_to_admin=True)
+            self.send_bot_status("reset")
             self.stop_app(update_saves=True)
         elif command.startswith("/s "):
             self.send_server_command(command[3:])
         elif command.startswith("/b "):
             self.send_bot_message(command[3:])
+        elif command.lower() == "backup":
+            self.job_executor.submit(self.run_hot_backup)
+        elif command.lower() == "metrics":
+            self.log_file_message(self.metrics.summary())
+        elif command.lower() == "tunnel":
+            self.log_file_message(f"Tunnel {self.tunnel_manager.backend.name if self.tunnel_manager.backend else None}"
+                                  f" at {self.extracted_address or 'unknown address'}. "
+                                  f"{self.tunnel_monitor.summary()}")
+        elif command.lower().split(" ")[0] == "logs":
+            print(self.query_logs(command[len("logs"):]))
         elif command.lower() == "help":
             self.log_file_message(HELP_MESSAGE)
         else:
             self.log_file_message(f"Command: '{command}' not recognized.")
 
+    def query_logs(self, query: str) -> str:
+        """
+        Searches log index, see log_index.parse_query for syntax of query.
+        :param query: Query text.
+        :return: Found records or information about disabled index.
+        """
+        if self.log_index is None:
+            return "Log index is disabled."
+        return self.log_index.query_text(query)
+
+    @traced()
     def stop_app(self, update_saves: bool = False):
         """
         Stops app is a safety way. Especially sends /stop command to server. And make server save to drive.
@@ -365,64 +578,165 @@ class ManageServer:
         :return:
         """
         # Disconnect players
-        if self.tcp_address_found:
-            self.log_file_message("Stopping tcp subprocess.")
-            self.tcp_process.terminate()
+        with self.tunnel_lock, self.tracer.span("stop_tunnel"):
+            self.tunnel_stopping = True
+            if self.tcp_address_found:
+                self.log_file_message("Stopping tcp subprocess.")
+                self.supervisor.terminate_process(TUNNEL, self.tcp_process, PROCESS_EXIT_TIMEOUT_S)
         # Safely stop server
         self.log_file_message("Stopping server subprocess.")
-        self.send_server_command("/stop")
-        self.log_file_message("Waiting for server to stop.")
-        while not self.server_stopped:
-            pass
-        self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-                              f"[Server control/INFO]: Server status stopped.", send_to_admin=True)
+        self.supervisor.set_state(SERVER, STOPPING)
+        # Hot backup waiting for saved world gives up
+        self.game_saved.set()
+        with self.tracer.span("stop_server"):
+            self.send_server_command("/stop")
+            self.log_file_message("Waiting for server to stop.")
+            if self.supervisor.wait_for(SERVER, STOPPED, timeout=SERVER_STOP_TIMEOUT_S) is None:
+                self.log_file_message(f"Server stopping time out exceeded: {SERVER_STOP_TIMEOUT_S} limit.")
+        # World files can be copied only after server process released them
+        with self.tracer.span("server_exit"):
+            self.supervisor.stop_process(SERVER, self.server_process, PROCESS_EXIT_TIMEOUT_S)
+        self.send_bot_status("stopped")
         # If yes send world folder to drive
         if update_saves:
             self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
                                   f"[Server control/INFO]: Saving to Google Drive.", send_to_admin=True)
-            self.save_server_to_drive()
+            if not self.backup_lock.acquire(blocking=False):
+                self.log_file_message("Waiting for hot backup in progress before saving to drive.")
+                # Running hot backup finishes at full speed
+                self.job_executor.unthrottle()
+                with self.tracer.span("wait_hot_backup"):
+                    self.backup_lock.acquire()
+            try:
+                self.save_server_to_drive()
+            finally:
+                self.backup_lock.release()
             self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
                                   f"[Server control/INFO]: New save made on Google Drive.", send_to_admin=True)
         # Stop bot
         self.log_file_message("Stopping bot subprocess.")
-        self.send_bot_message(DISCORD_BOT_STOP_SIGNAL, send_to_admin=True)
-        self.discord_bot_process.terminate()
+        with self.tracer.span("stop_bot"):
+            self.send_bot_frame(STOP_MESSAGE)
+            # Bot sends queued messages and closes itself after stop message
+            self.supervisor.set_state(BOT, STOPPING)
+            self.supervisor.stop_process(BOT, self.discord_bot_process, PROCESS_EXIT_TIMEOUT_S)
+        if USE_TRACING:
+            self.log_file_message(f"Stop phases: {self.tracer.summary(self.tracer.current())}.")
         if self.external_stop:
             sys.exit(0)
 
+    def schedule_hot_backups(self):
+        """
+        Makes hot backup periodically until server starts stopping.
+        :return:
+        """
+        while self.supervisor.wait_for(SERVER, STOPPING, timeout=HOT_BACKUP_PERIOD_S) is None:
+            self.job_executor.submit(self.run_hot_backup).result()
+
+    def schedule_metrics(self):
+        """
+        Samples server's health every SERVER_STATUS_CHECK_PERIOD_S until server starts stopping. Tick timing is asked
+        for with TPS command, its answer is parsed from server's output and lands in the next sample.
+        :return:
+        """
+        if USE_METRICS_EXPORTER:
+            try:
+                self.metrics_exporter.start()
+                self.log_file_message(f"Metrics exported on http://{METRICS_EXPORTER_HOST}:{METRICS_EXPORTER_PORT}"
+                                      f"/metrics.")
+            except OSError as exception:
+                self.log_file_message(f"Metrics exporter not started: {exception}", mess_prefix="WARNING")
+        while True:
+            self.send_server_command(METRICS_TPS_COMMAND, log_command=False)
+            self.metrics.sample()
+            if self.supervisor.wait_for(SERVER, STOPPING, timeout=SERVER_STATUS_CHECK_PERIOD_S) is not None:
+                break
+
+    def run_hot_backup(self):
+        """
+        Saves world to drive while server runs. World is copied in advance, then saving is turned off and flushed,
+        files changed since the copy are copied again and saving is turned back on. Upload runs from the snapshot.
+        :return:
+        """
+        if not self.backup_lock.acquire(blocking=False):
+            self.log_file_message("Backup already in progress.")
+            return
+        try:
+            snapshot = HotSnapshot(throttle=self.job_executor.throttle)
+            self.log_file_message("Preparing hot backup snapshot.")
+            snapshot.prepare()
+            self.game_saved.clear()
+            pause_start_time = time.perf_counter()
+            self.send_server_command("save-off")
+            self.send_server_command("save-all flush")
+            try:
+                saved = self.game_saved.wait(HOT_BACKUP_SAVE_TIMEOUT_S) and \
+                    self.supervisor.state(SERVER) == READY
+                copied = snapshot.finalize() if saved else 0
+            finally:
+                self.send_server_command("save-on")
+            if not saved:
+                snapshot.discard()
+                self.log_file_message("World was not saved in time, hot backup canceled.", mess_prefix="WARNING")
+                return
+            self.log_file_message(f"Hot backup snapshot taken with saving paused for "
+                                  f"{(time.perf_counter() - pause_start_time) * 1000:.0f}ms: {snapshot.linked} files "
+                                  f"linked, {snapshot.copied - copied} copied in advance, {copied} during pause.")
+            self.save_server_to_drive(snapshot.snapshot_entries(), self.job_executor.throttle)
+            self.send_bot_message(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                                  f"[Server control/INFO]: Hot backup saved on Google Drive.", send_to_admin=True)
+        except Exception as exception:
+            self.log_file_message(f"Hot backup failed: {exception}", mess_prefix="ERROR")
+        finally:
+            self.backup_lock.release()
+
     """
     ****** Send Info To Sub-process Functions ******
     """
 
-    def send_server_command(self, serv_command: str):
+    def send_server_command(self, serv_command: str, log_command: bool = True):
         """
-        Sends command to server and waits some constant time to avoid mess in console.
+        Queues command for server's input, it is written by process hub without blocking the caller.
         :param serv_command: Input command without newline at the end only content.
+        :param log_command: Logs redirected command, periodic commands are not logged.
         :return:
         """
-        self.log_file_message(f"Server command '{serv_command}' redirected.")
-        # Send a command to the subprocess (replace with your actual command)
-        command_to_send = f"{serv_command}\n"
-        self.server_process.stdin.write(command_to_send.encode('utf-8'))
-        self.server_process.stdin.flush()
+        if log_command:
+            self.log_file_message(f"Server command '{serv_command}' redirected.")
+        self.server_process.write_line(serv_command)
 
     def send_bot_message(self, bot_message: str, send_to_admin: bool = False):
         """
         Send string via bot to specific channel.
-        :param send_to_admin: Indicates adding specific channel's prefix.
-        :param bot_message: Input message without newline at the end only content. Prefix is a name of channel.
+        :param send_to_admin: Indicates sending to admin channel instead of chatting one.
+        :param bot_message: Message content.
         :return:
         """
-        if not bot_message == DISCORD_BOT_STOP_SIGNAL:
-            self.log_file_message(f"Bots message '{bot_message}' redirected.")
-        # Send a command to the subprocess (replace with your actual command)
-        if send_to_admin:
-            command_to_send = f"{ADMIN_CHANNEL_NAME}{bot_message}\n"
-        else:
-            command_to_send = f"{USERS_CHANNEL_NAME}{bot_message}\n"
-        self.discord_bot_process.stdin.write(command_to_send.encode('utf-8'))
-        self.discord_bot_process.stdin.flush()
-        time.sleep(1)
+        self.log_file_message(f"Bots message '{bot_message}' redirected.")
+        self.send_bot_frame(ADMIN_MESSAGE if send_to_admin else CHAT_MESSAGE, bot_message)
+
+    def send_bot_status(self, status: str, **fields):
+        """
+        Sends server status to admin channel.
+        :param status: Status name, for example stopped.
+        :param fields: Additional fields of status message.
+        :return:
+        """
+        self.log_file_message(f"Bots status '{status}' redirected.")
+        self.send_bot_frame(STATUS_MESSAGE, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                                            f"[Server control/INFO]: Server status {status}.", **fields)
+
+    def send_bot_frame(self, message_type: str, text: str = "", **fields):
+        """
+        Queues protocol message for bot's input.
+        :param message_type: One of protocol message types.
+        :param text: Message content.
+        :param fields: Additional fields of message.
+        :return:
+        """
+        if self.discord_bot_process is None:
+            return
+        self.discord_bot_process.write_bytes(encode_message(message_type, text, **fields))
 
     """
     ****** Google Drive Functions ******
@@ -446,26 +760,64 @@ class ManageServer:
                 break
             else:
                 self.log_file_message("Please provide correct input:")
-        self.log_file_message("Removing current save from device.")
+        self.restore_last_save()
+
+    @traced("download_last_save")
+    def restore_last_save(self):
+        """
+        Downloads last save to staged restore and replaces current save with it, traced without waiting for user.
+        :return:
+        """
+        self.log_file_message("Preparing staged restore of the save.")
         # shutil.rmtree(SAVE_DIR, ignore_errors=True)
         self.log_file_message("Getting access to drive.")
-        service = self.get_gdrive_service(SCOPES)
-        # Call the Drive v3 API
-        items = self.drive_list_files(service)
-        self.translate_files(items)
-        self.find_save_and_download()
-        self.remove_directories_and_files(DIRECTORIES_TO_ZIP)
-        self.unzip_folder(f"{SERVER_DIR}/{SAVE_FILE_NAME}", SERVER_DIR)
+        self.save_catalog = self.get_save_catalog()
+        if USE_INCREMENTAL_BACKUPS:
+            self.restore_incremental_chain()
+            return
+        # Save is built next to the current one, which is replaced only after successful download
+        staged_restore = StagedRestore(self.incremental_backup.known_crc)
+        staged_restore.prepare()
+        try:
+            self.find_save_and_download(staged_restore)
+        except BaseException:
+            staged_restore.discard()
+            raise
+        self.swap_staged_save(staged_restore)
         self.remove_directories_and_files([f"{SERVER_DIR}/{SAVE_FILE_NAME}"])
         self.log_file_message("Current server was updated with the latest save.")
 
-    @staticmethod
-    def get_gdrive_service(scopes: list):
+    def get_gdrive_service(self, scopes: list):
         """
         Function taken from: https://thepythoncode.com/article/using-google-drive--api-in-python?utm_content=cmp-true
+        Service is built once, later calls return the same object.
         :param scopes: list of scopes
         :return:
         """
+        # return Google Drive API service
+        if self.drive_service is None:
+            self.drive_service = build('drive', 'v3', credentials=self.get_gdrive_credentials(scopes))
+        return self.drive_service
+
+    def get_gdrive_session(self) -> AuthorizedSession:
+        """
+        Authorized HTTP session used by parallel download and streaming upload, its connection pool is shared by all
+        requests of the app.
+        :return: Session object.
+        """
+        if self.drive_session is None:
+            self.drive_session = AuthorizedSession(self.get_gdrive_credentials(SCOPES))
+            self.drive_session.mount("https://", HTTPAdapter(pool_connections=DOWNLOAD_CONCURRENCY,
+                                                             pool_maxsize=DOWNLOAD_CONCURRENCY))
+        return self.drive_session
+
+    @staticmethod
+    def get_gdrive_credentials(scopes: list):
+        """
+        Loads, refreshes or creates Google Drive credentials.
+        :param scopes: list of scopes
+        :return: Credentials object.
+        """
         creds = None
         # The file token.pickle stores the user's access and refresh tokens, and is
         # created automatically when the authorization flow completes for the first
@@ -484,112 +836,53 @@ class ManageServer:
             # Save the credentials for the next run
             with open('token.pickle', 'wb') as token:
                 pickle.dump(creds, token)
-        # return Google Drive API service
-        return build('drive', 'v3', credentials=creds)
-
-    def drive_list_files(self, service):
-        """
-        Retrieves all files from Google Drive excluding files from the trash, using pagination.
-        :param service: Google Drive API service object.
-        """
-        self.log_file_message("Listing all files names from drive.")
-        page_token = None
-        all_files = []
-
-        while True:
-            results = service.files().list(
-                pageSize=100,
-                fields="nextPageToken, files(id, name, mimeType, size, parents, modifiedTime)",
-                pageToken=page_token,
-                q="trashed=false"  # Exclude files from the trash
-            ).execute()
-
-            items = results.get('files', [])
-            all_files.extend(items)
-
-            page_token = results.get('nextPageToken')
-            if not page_token:
-                break
-
-        return all_files
+        return creds
 
-    def translate_files(self, items: list):
+    @traced("list_saves")
+    def get_save_catalog(self) -> SaveCatalog:
         """
-        Function taken from: https://thepythoncode.com/article/using-google-drive--api-in-python?utm_content=cmp-true
-        given items returned by Google Drive API, prints them in a tabular way
-        :param items:
-        :return:
+        Gives catalog of saves, answered from local index updated with drive's changes or by filtered drive queries.
+        :return: Save catalog.
         """
-        self.log_file_message("Files names translation.")
-        if not items:
-            # empty drive
-            self.log_file_message('No files found.')
+        if not USE_DRIVE_INDEX:
+            return SaveCatalog(self.get_gdrive_service(SCOPES))
+        self.log_file_message("Synchronizing index of saves with drive.")
+        applied = self.drive_index.sync(self.get_gdrive_service(SCOPES))
+        if applied < 0:
+            self.log_file_message(f"Index of saves rebuilt, {len(self.drive_index.files)} saves found.")
         else:
-            rows = []
-            for item in items:
-                # get the File ID
-                id = item["id"]
-                # get the name of file
-                name = item["name"]
-                try:
-                    # parent directory ID
-                    parents = item["parents"]
-                except:
-                    # has no parrents
-                    parents = "N/A"
-                try:
-                    # get the size
-                    size = int(item["size"])
-                except:
-                    # not a file, may be a folder
-                    size = "N/A"
-                # get the Google Drive type of file
-                mime_type = item["mimeType"]
-                # get last modified date time
-                modified_time = item["modifiedTime"]
-                # append everything to the list
-                rows.append((id, name, parents, size, mime_type, modified_time))
-            self.drive_files_list = rows
-
-    def find_save_and_download(self):
+            self.log_file_message(f"Index of saves updated with {applied} drive changes.")
+        return IndexedSaveCatalog(self.drive_index)
+
+    def find_save_and_download(self, staged_restore: StagedRestore = None):
         """
         Finds the newest .zip save file and downloads it to server location.
+        :param staged_restore: Staged restore where save should be extracted.
         :return:
         """
         self.log_file_message("Searching from newest save file.")
-        youngest_folder_id = None
-        youngest_folder_name = ""
-        youngest_folder_date = ""
-        youngest_folder_date_time = datetime.min
-        worlds = []
-        for item in self.drive_files_list:
-            if item[4] == "application/zip" or item[4] == "application/x-zip-compressed":
-                if item[1] == SAVE_FILE_NAME:
-                    worlds.append(item)
-                    self.log_file_message(f"Found folder with name: {item[1]} and date {item[5]}.")
-                    # Parse date-time string into datetime object
-                    item_datetime = datetime.strptime(item[5], "%Y-%m-%dT%H:%M:%S.%fZ")
-                    if item_datetime > youngest_folder_date_time:
-                        youngest_folder_id = item[0]
-                        youngest_folder_name = item[1]
-                        youngest_folder_date = item[5]
-                        youngest_folder_date_time = item_datetime
-
-        if youngest_folder_id:
-            self.log_file_message(f"Downloading last save: {youngest_folder_name}, from: {youngest_folder_date}.")
-            self.download_file(youngest_folder_id, youngest_folder_name, SERVER_DIR)
+        save = self.save_catalog.latest_save()
+        if save:
+            self.log_file_message(f"Downloading last save: {save.name}, from: {save.modified_time}.")
+            self.download_file(save.id, save.name, SERVER_DIR, staged_restore)
         else:
             self.log_file_message(f"No save found. Stop app.")
             sys.exit()
 
-    def download_file(self, file_id, file_name, output_dir):
+    @traced("download")
+    def download_file(self, file_id, file_name, output_dir, staged_restore=None, skip_members=()):
         """
         Downloads a file from Google Drive to a specific directory.
         :param file_id: ID of the file to download.
         :param file_name: Name to give the downloaded file.
         :param output_dir: Directory to save the downloaded file.
+        :param staged_restore: Staged restore where downloaded .zip should be extracted.
+        :param skip_members: Names of .zip members which should not be extracted.
         """
         service = self.get_gdrive_service(SCOPES)
+        if USE_PARALLEL_DOWNLOAD:
+            self.download_file_parallel(service, file_id, file_name, output_dir, staged_restore, skip_members)
+            return
         request = service.files().get_media(fileId=file_id)
         fh = io.FileIO(os.path.join(output_dir, file_name), 'wb')
         downloader = MediaIoBaseDownload(fh, request)
@@ -599,78 +892,182 @@ class ManageServer:
             status, done = downloader.next_chunk()
             self.log_file_message(f"Download {int(status.progress() * 100)}%.")
 
+        fh.close()
+        self.tracer.add_bytes(os.path.getsize(os.path.join(output_dir, file_name)))
         self.log_file_message(f"File '{file_name}' downloaded successfully to '{output_dir}'.")
+        if staged_restore:
+            with self.tracer.span("unzip"):
+                staged_restore.extract_archive(os.path.join(output_dir, file_name), skip_members)
+
+    def download_file_parallel(self, service, file_id, file_name, output_dir, staged_restore=None,
+                               skip_members=()):
+        """
+        Downloads a file with parallel range requests, verifies its md5Checksum and extracts it during download.
+        :param service: Google Drive API service object.
+        :param file_id: ID of the file to download.
+        :param file_name: Name to give the downloaded file.
+        :param output_dir: Directory to save the downloaded file.
+        :param staged_restore: Staged restore where downloaded .zip should be extracted.
+        :param skip_members: Names of .zip members which should not be extracted.
+        """
+        file_metadata = service.files().get(fileId=file_id, fields="size, md5Checksum").execute()
+        downloader = ParallelDownloader(self.get_gdrive_session())
+        logged_progress = [-1]
+
+        def log_progress(downloaded: int, size: int):
+            progress = int(downloaded * 10 / size) * 10
+            if progress > logged_progress[0]:
+                logged_progress[0] = progress
+                self.log_file_message(f"Download {progress}%.")
+
+        downloader.download(file_id, os.path.join(output_dir, file_name), int(file_metadata["size"]),
+                            file_metadata.get("md5Checksum"),
+                            staged_restore.staging_dir if staged_restore else None, skip_members, log_progress,
+                            staged_restore.extract_member if staged_restore else None)
+        self.tracer.add_bytes(int(file_metadata["size"]))
+        self.log_file_message(f"File '{file_name}' downloaded and verified successfully to '{output_dir}'.")
 
     @staticmethod
-    def unzip_folder(zip_file: str, destination: str):
+    def unzip_folder(zip_file: str, destination: str, skip_members=()):
         """
         Unzips downloaded save to the specific directory.
         :param zip_file: Directory to file which should be unzipped.
         :param destination: Directory where this file should be unzipped.
+        :param skip_members: Names of members which should not be unzipped.
         :return:
         """
         with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-            zip_ref.extractall(destination)
+            zip_ref.extractall(destination, [name for name in zip_ref.namelist() if name not in skip_members])
 
-    def save_server_to_drive(self):
+    @traced("swap_save")
+    def swap_staged_save(self, staged_restore: StagedRestore):
         """
-        Calls functions which removes the eldest world folder from drive and saves the current one.
+        Replaces current save with completely downloaded and extracted one.
+        :param staged_restore: Staged restore with extracted save.
+        :return:
+        """
+        self.log_file_message(f"Replacing current save with the downloaded one: {staged_restore.linked} unchanged "
+                              f"files reused, {staged_restore.extracted} files extracted.")
+        staged_restore.swap()
+
+    @traced()
+    def save_server_to_drive(self, directory_list: list = DIRECTORIES_TO_ZIP, throttle=None):
+        """
+        Calls functions which saves the current world to drive and removes world folders out of retention policy.
+        :param directory_list: Saved directories and files, live ones or their copy in hot backup snapshot.
+        :param throttle: JobThrottle when saving runs as background job next to running server.
         :return:
         """
         # https://thepythoncode.com/article/using-google-drive--api-in-python?utm_content=cmp-true
         self.log_file_message("Getting access to drive.")
-        service = self.get_gdrive_service(SCOPES)
-        # Call the Drive v3 API
-        items = self.drive_list_files(service)
-        self.translate_files(items)
-        self.remove_eldest_folder()
-        self.log_file_message(f"Sending world folder to drive.")
-        self.zip_directories(DIRECTORIES_TO_ZIP, SAVE_FILE_NAME)
-        self.upload_zip_file(SAVE_FILE_NAME, SAVE_FOLDER_NAME)
-        self.remove_directories_and_files([f"{CURRENT_DIR}/{SAVE_FILE_NAME}"])
-
-    def remove_eldest_folder(self):
-        """
-        Removes the eldest world folder from drive's main directory.
-        :return:
-        """
-        self.log_file_message("Removing eldest world folder from the drive.")
-        self.drive_files_list.sort(key=lambda x: datetime.fromisoformat(x[-1].replace("Z", "")), reverse=True)
-        eldest_folder_id = None
-        eldest_folder_name = ""
-        eldest_folder_date = ""
-        eldest_folder_date_time = datetime.now()
-        worlds = []
-        for item in self.drive_files_list:
-            if item[4] == "application/vnd.google-apps.folder":
-                if item[1] == SAVE_FOLDER_NAME:
-                    worlds.append(item)
-                    self.log_file_message(f"Found folder with name: {item[1]} and date {item[5]}.")
-                    # Parse date-time string into datetime object
-                    item_datetime = datetime.strptime(item[5], "%Y-%m-%dT%H:%M:%S.%fZ")
-                    if item_datetime < eldest_folder_date_time:
-                        eldest_folder_id = item[0]
-                        eldest_folder_name = item[1]
-                        eldest_folder_date = item[5]
-                        eldest_folder_date_time = item_datetime
-
-        if eldest_folder_id:
-            service = self.get_gdrive_service(SCOPES)
-            service.files().delete(fileId=eldest_folder_id).execute()
-            self.log_file_message(f"Eldest folder with name: {eldest_folder_name} and modified-date "
-                                  f"{eldest_folder_date} has been removed.")
+        if USE_INCREMENTAL_BACKUPS:
+            self.save_incremental_to_drive(directory_list, throttle)
+        elif USE_STREAMING_UPLOAD:
+            self.log_file_message(f"Sending world folder to drive.")
+            self.stream_archive_to_drive(lambda output: self.zip_directories(directory_list, output, throttle),
+                                         SAVE_FILE_NAME, throttle=throttle)
         else:
-            self.log_file_message("No folders found.")
+            self.log_file_message(f"Sending world folder to drive.")
+            with self.tracer.span("zip"):
+                self.zip_directories(directory_list, SAVE_FILE_NAME, throttle)
+            self.upload_zip_file(SAVE_FILE_NAME, SAVE_FOLDER_NAME)
+            self.remove_directories_and_files([f"{CURRENT_DIR}/{SAVE_FILE_NAME}"])
+        # Old saves are removed only after the new one is safely on drive
+        self.prune_drive_saves()
+
+    def save_incremental_to_drive(self, directory_list: list = DIRECTORIES_TO_ZIP, throttle=None):
+        """
+        Packs only files changed since the last snapshot. Full base starts new world folder on drive, deltas are
+        uploaded next to their base.
+        :param directory_list: Saved directories and files.
+        :param throttle: JobThrottle of background job or None.
+        :return:
+        """
+        self.log_file_message("Comparing world with local backup manifest.")
+        zip_path = f"{CURRENT_DIR}/{SAVE_FILE_NAME}"
+        with self.tracer.span("scan_world"):
+            snapshot = self.incremental_backup.prepare_snapshot(directory_list, throttle)
+        if snapshot is None:
+            self.log_file_message("No changes since the last snapshot, nothing to upload.")
+            return
+        self.log_file_message(f"Sending {snapshot['kind']} snapshot {snapshot['sequence']} to drive: "
+                              f"{snapshot['changed']} changed and {snapshot['removed']} removed files.")
+        folder_id = None
+        if snapshot["kind"] != "base":
+            folder_id = self.incremental_backup.manifest["folder_id"]
+        if USE_STREAMING_UPLOAD:
+            folder_id = self.stream_archive_to_drive(self.incremental_backup.write_snapshot, snapshot["file_name"],
+                                                     folder_id=folder_id, throttle=throttle)
+            self.incremental_backup.commit(folder_id)
+            return
+        with self.tracer.span("zip"):
+            self.incremental_backup.write_snapshot(zip_path)
+        folder_id = self.upload_zip_file(zip_path, SAVE_FOLDER_NAME, folder_id=folder_id,
+                                         upload_name=snapshot["file_name"])
+        self.incremental_backup.commit(folder_id)
+        self.remove_directories_and_files([zip_path])
+
+    def restore_incremental_chain(self):
+        """
+        Finds the newest base or delta on drive and rebuilds world from base and all deltas stored in its folder.
+        :return:
+        """
+        self.log_file_message("Searching for newest snapshot chain.")
+        newest = self.save_catalog.latest_snapshot()
+        if newest is None:
+            self.log_file_message(f"No save found. Stop app.")
+            sys.exit()
+        folder_id = newest.parents[0] if newest.parents else None
+        chain = self.save_catalog.snapshot_chain(folder_id) if folder_id else [newest]
+        self.log_file_message(f"Downloading chain of {len(chain)} snapshots from: {newest.modified_time}.")
+        staged_restore = StagedRestore(self.incremental_backup.known_crc)
+        staged_restore.prepare()
+        metadata = None
+        try:
+            for record in chain:
+                archive = f"{SERVER_DIR}/{record.name}"
+                self.download_file(record.id, record.name, SERVER_DIR, staged_restore, [BACKUP_METADATA_NAME])
+                # Removals of each delta have to be applied before the next delta is extracted
+                with self.tracer.span("apply_removals"):
+                    metadata = self.incremental_backup.apply_archive(archive, staged_restore.staging_dir,
+                                                                     extract=False)
+                self.remove_directories_and_files([archive])
+        except BaseException:
+            staged_restore.discard()
+            raise
+        self.swap_staged_save(staged_restore)
+        self.incremental_backup.reset_manifest(metadata, folder_id)
+        self.log_file_message("Current server was updated with the latest save.")
+
+    @traced("prune_saves")
+    def prune_drive_saves(self):
+        """
+        Removes world folders which are out of retention policy, with one listing and batched deletes.
+        :return:
+        """
+        self.save_catalog = self.get_save_catalog()
+        kept, removed = RetentionPolicy().select(self.save_catalog.generations())
+        self.log_file_message(f"Retention keeps {len(kept)} world folders with "
+                              f"{sum(generation.size for generation in kept)} bytes.")
+        if not removed:
+            return
+        failed = batch_delete(self.get_gdrive_service(SCOPES), [generation.folder.id for generation in removed])
+        for generation in removed:
+            self.log_file_message(f"World folder from {generation.modified_time} with {len(generation.files)} "
+                                  f"saves removed by retention.")
+        for folder_id, exception in failed:
+            self.log_file_message(f"World folder {folder_id} could not be removed: {exception}", mess_prefix="ERROR")
 
     @staticmethod
-    def zip_directories(directory_list: list, output_zip_name: str):
+    def zip_directories(directory_list: list, output_zip_name, throttle=None):
         """
         Zips directories from given list to one file in working directory.
         :param directory_list: List of directories which should be zipped.
-        :param output_zip_name: Name of output zip.
+        :param output_zip_name: Name of output zip or writable file object.
+        :param throttle: JobThrottle of background job or None.
         :return:
         """
-        with zipfile.ZipFile(output_zip_name, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        with ParallelZipWriter(output_zip_name, throttle=throttle) as zipf:
             for item in directory_list:
                 if os.path.isfile(item):
                     zipf.write(item, os.path.basename(item))
@@ -681,29 +1078,76 @@ class ManageServer:
                             file_path = os.path.join(root, file)
                             zipf.write(file_path, os.path.join(base_name, os.path.relpath(file_path, item)))
 
-    def upload_zip_file(self, zip_file_path, folder_name):
+    @traced("upload")
+    def upload_zip_file(self, zip_file_path, folder_name, folder_id=None, upload_name=None):
         """
         Uploads a specific .zip file to Google Drive inside a folder.
+        :param zip_file_path: Path to local .zip file.
+        :param folder_name: Name of new folder created on drive when folder_id is not given.
+        :param folder_id: ID of existing drive folder, used by incremental deltas.
+        :param upload_name: Name of file on drive, defaults to local file name.
+        :return: ID of drive folder which holds uploaded file.
         """
         # Authenticate account
         service = self.get_gdrive_service(SCOPES)
 
         # Create folder if not exists
-        folder_metadata = {
-            "name": folder_name,
-            "mimeType": "application/vnd.google-apps.folder"
-        }
-        file = service.files().create(body=folder_metadata, fields="id").execute()
-        folder_id = file.get("id")
+        if folder_id is None:
+            folder_id = self.create_drive_folder(service, folder_name)
 
         # Upload the zip file
         file_metadata = {
-            "name": os.path.basename(zip_file_path),
+            "name": upload_name or os.path.basename(zip_file_path),
             "parents": [folder_id]
         }
         media = MediaFileUpload(zip_file_path, resumable=True)
         file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+        self.tracer.add_bytes(os.path.getsize(zip_file_path))
         self.log_file_message(f"Zip file uploaded successfully, id: {file.get('id')}")
+        return folder_id
+
+    @staticmethod
+    def create_drive_folder(service, folder_name: str) -> str:
+        """
+        Creates folder in drive's main directory.
+        :param service: Google Drive API service object.
+        :param folder_name: Name of new folder.
+        :return: ID of created folder.
+        """
+        folder_metadata = {
+            "name": folder_name,
+            "mimeType": "application/vnd.google-apps.folder"
+        }
+        file = service.files().create(body=folder_metadata, fields="id").execute()
+        return file.get("id")
+
+    @traced("upload")
+    def stream_archive_to_drive(self, write_archive, upload_name: str, folder_id=None,
+                                folder_name: str = SAVE_FOLDER_NAME, throttle=None):
+        """
+        Uploads archive in resumable chunks while it is still being written, no temporary .zip is stored on disk.
+        :param write_archive: Function which writes archive into given writable file object.
+        :param upload_name: Name of file on drive.
+        :param folder_id: ID of existing drive folder, new one is created when not given.
+        :param folder_name: Name of new folder.
+        :param throttle: JobThrottle limiting upload rate or None.
+        :return: ID of drive folder which holds uploaded file.
+        """
+        service = self.get_gdrive_service(SCOPES)
+        created_folder_id = None
+        if folder_id is None:
+            folder_id = created_folder_id = self.create_drive_folder(service, folder_name)
+        uploader = ResumableUploader(self.get_gdrive_session(), throttle=throttle)
+        try:
+            file = upload_while_writing(uploader, {"name": upload_name, "parents": [folder_id]}, write_archive)
+        except Exception:
+            # Do not leave empty world folder which would be taken as the newest save
+            if created_folder_id:
+                service.files().delete(fileId=created_folder_id).execute()
+            raise
+        self.tracer.add_bytes(uploader.confirmed)
+        self.log_file_message(f"Zip file streamed to drive successfully, id: {file.get('id')}")
+        return folder_id
 
     def remove_directories_and_files(self, directory_list):
         """
@@ -0,0 +1,126 @@
+import asyncio
+import collections
+import sys
+import time
+
+from constants import *
+
+
+class RateLimitBucket:
+    def __init__(self, limit: int = DISCORD_RATE_LIMIT_MESSAGES, period_s: float = DISCORD_RATE_LIMIT_PERIOD_S):
+        """
+        Sliding window rate limit of one discord channel.
+        :param limit: Number of messages allowed in period.
+        :param period_s: Length of period in seconds.
+        """
+        self.limit = limit
+        self.period_s = period_s
+        self.sent_times = collections.deque()
+
+    async def acquire(self) -> None:
+        """
+        Waits until next message can be sent without hitting the limit.
+        :return:
+        """
+        while True:
+            now = time.monotonic()
+            while self.sent_times and now - self.sent_times[0] >= self.period_s:
+                self.sent_times.popleft()
+            if len(self.sent_times) < self.limit:
+                self.sent_times.append(now)
+                return
+            await asyncio.sleep(self.period_s - (now - self.sent_times[0]))
+
+
+class OutboundMessageQueue:
+    def __init__(self, loop: asyncio.AbstractEventLoop, flush_window_s: float = DISCORD_FLUSH_WINDOW_S,
+                 max_length: int = DISCORD_MESSAGE_LIMIT, rate_limit: int = DISCORD_RATE_LIMIT_MESSAGES,
+                 rate_period_s: float = DISCORD_RATE_LIMIT_PERIOD_S):
+        """
+        Queue of outgoing discord messages. Lines put in short time window to one channel are coalesced into as few
+        messages as the length limit allows, and every channel is sent at most at its rate limit.
+        :param loop: Event loop of discord client.
+        :param flush_window_s: Time for which lines are collected before sending.
+        :param max_length: Maximal length of one discord message.
+        :param rate_limit: Number of messages allowed to one channel in rate period.
+        :param rate_period_s: Length of rate period in seconds.
+        """
+        self.loop = loop
+        self.flush_window_s = flush_window_s
+        self.max_length = max_length
+        self.rate_limit = rate_limit
+        self.rate_period_s = rate_period_s
+        # Channel id -> (channel, waiting lines)
+        self.pending = {}
+        self.workers = {}
+        self.buckets = {}
+        self.flushing = False
+
+    def put(self, channel, text: str) -> None:
+        """
+        Queues line for channel, can be called from any thread and never blocks.
+        :param channel: Discord channel or any object with async send(text) and id.
+        :param text: Line content.
+        :return:
+        """
+        self.loop.call_soon_threadsafe(self.put_in_loop, channel, text)
+
+    def put_in_loop(self, channel, text: str) -> None:
+        """
+        Queues line, must be called in loop's thread.
+        :param channel: Discord channel.
+        :param text: Line content.
+        :return:
+        """
+        self.pending.setdefault(channel.id, (channel, []))[1].append(text)
+        if channel.id not in self.workers:
+            self.workers[channel.id] = self.loop.create_task(self.send_pending(channel.id))
+
+    def pack(self, lines: list) -> list:
+        """
+        Joins lines into messages not longer than limit, too long lines are split.
+        :param lines: Lines.
+        :return: Messages.
+        """
+        messages = []
+        current = ""
+        for line in lines:
+            for start in range(0, max(len(line), 1), self.max_length):
+                piece = line[start:start + self.max_length]
+                if current and len(current) + 1 + len(piece) > self.max_length:
+                    messages.append(current)
+                    current = piece
+                else:
+                    current = f"{current}\n{piece}" if current else piece
+        messages.append(current)
+        return [message for message in messages if message.strip()]
+
+    async def send_pending(self, channel_id) -> None:
+        """
+        Worker of one channel, waits for flush window and sends all lines collected till then.
+        :param channel_id: ID of channel.
+        :return:
+        """
+        if not self.flushing:
+            await asyncio.sleep(self.flush_window_s)
+        bucket = self.buckets.setdefault(channel_id, RateLimitBucket(self.rate_limit, self.rate_period_s))
+        channel, lines = self.pending[channel_id]
+        while lines:
+            batch = lines[:]
+            lines.clear()
+            for message in self.pack(batch):
+                await bucket.acquire()
+                try:
+                    await channel.send(message)
+                except Exception as exception:
+                    print(f"Discord message not sent: {exception}", file=sys.stderr)
+        del self.workers[channel_id]
+
+    async def flush(self) -> None:
+        """
+        Sends all queued lines without waiting for flush window.
+        :return:
+        """
+        self.flushing = True
+        while self.workers:
+            await asyncio.gather(*self.workers.values())
@@ -0,0 +1,264 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constants import *
+
+# One sample of server's health, fields which could not be read are None
+MetricsSample = namedtuple("MetricsSample", ["time", "cpu_percent", "rss_bytes", "threads", "open_fds", "players",
+                                             "tps", "mspt"])
+# Sample field -> (prometheus name, help)
+PROMETHEUS_METRICS = {
+    "cpu_percent": ("minecraft_server_cpu_percent", "CPU usage of server process, 100 is one core."),
+    "rss_bytes": ("minecraft_server_resident_memory_bytes", "Resident memory of server process."),
+    "threads": ("minecraft_server_threads", "Number of threads of server process."),
+    "open_fds": ("minecraft_server_open_fds", "Number of open file descriptors of server process."),
+    "players": ("minecraft_server_players", "Number of players online."),
+    "tps": ("minecraft_server_tps", "Mean ticks per second reported by server."),
+    "mspt": ("minecraft_server_mspt", "Mean tick time in milliseconds reported by server."),
+}
+PROC_DIR = "/proc"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# Number of samples which look for JVM started by script, then the started process itself is sampled
+SERVER_PID_SEARCHES = 5
+
+
+def read_proc_stat(pid: int):
+    """
+    :param pid: Process id.
+    :return: Tuple of (name, parent pid, fields after parent pid) of /proc/<pid>/stat or None.
+    """
+    try:
+        with open(f"{PROC_DIR}/{pid}/stat", "rb") as stat_file:
+            content = stat_file.read()
+    except OSError:
+        return None
+    # Name is in brackets and can contain spaces
+    name_end = content.rfind(b")")
+    fields = content[name_end + 2:].split()
+    return content[content.find(b"(") + 1:name_end].decode(errors="replace"), int(fields[1]), fields[2:]
+
+
+def find_server_pid(root_pid: int):
+    """
+    Server is started directly as JVM or by script, then JVM is found among its descendants.
+    :param root_pid: Process id of started command.
+    :return: Process id of JVM, root one without /proc, None when JVM was not found.
+    """
+    if not os.path.isdir(PROC_DIR):
+        return root_pid
+    root_stat = read_proc_stat(root_pid)
+    if root_stat is not None and root_stat[0].startswith("java"):
+        return root_pid
+    children = {}
+    for entry in os.listdir(PROC_DIR):
+        if entry.isdigit() and (stat := read_proc_stat(int(entry))) is not None:
+            children.setdefault(stat[1], []).append((int(entry), stat[0]))
+    pending = [root_pid]
+    while pending:
+        for pid, name in children.get(pending.pop(0), []):
+            if name.startswith("java"):
+                return pid
+            pending.append(pid)
+    return None
+
+
+class MetricsRing:
+    def __init__(self, capacity: int = METRICS_RING_SIZE):
+        """
+        Fixed size buffer of the latest samples, the oldest one is overwritten when it is full.
+        :param capacity: Maximal number of samples.
+        """
+        self.buffer = [None] * capacity
+        self.next_index = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, sample: MetricsSample) -> None:
+        with self.lock:
+            self.buffer[self.next_index] = sample
+            self.next_index = (self.next_index + 1) % len(self.buffer)
+            self.count = min(self.count + 1, len(self.buffer))
+
+    def latest(self):
+        """
+        :return: The newest sample or None.
+        """
+        with self.lock:
+            return self.buffer[self.next_index - 1] if self.count else None
+
+    def samples(self) -> list:
+        """
+        :return: Stored samples from the oldest.
+        """
+        with self.lock:
+            start = self.next_index - self.count
+            return [self.buffer[index] for index in range(start, self.next_index)]
+
+
+class MetricsSampler:
+    def __init__(self, ring: MetricsRing = None):
+        """
+        Samples server's process from /proc (not available on Windows, where process fields stay None) together with
+        players online and the last tick timing parsed from server's output.
+        :param ring: Buffer of samples.
+        """
+        self.ring = ring or MetricsRing()
+        self.root_pid = None
+        self.pid = None
+        self.pid_searches = 0
+        self.players = set()
+        self.tps = None
+        self.mspt = None
+        # CPU time in ticks and wall time of previous sample
+        self.last_cpu_ticks = None
+        self.last_time = None
+
+    def attach(self, root_pid: int) -> None:
+        """
+        Starts sampling of new server's process.
+        :param root_pid: Process id of started server command.
+        :return:
+        """
+        self.root_pid = root_pid
+        self.pid = None
+        self.pid_searches = 0
+        self.players = set()
+        self.tps = None
+        self.mspt = None
+        self.last_cpu_ticks = None
+
+    def player_joined(self, name: str) -> None:
+        self.players.add(name)
+
+    def player_left(self, name: str) -> None:
+        self.players.discard(name)
+
+    def tick_timing(self, mspt: float, tps: float) -> None:
+        """
+        :param mspt: Mean tick time in milliseconds.
+        :param tps: Mean ticks per second.
+        :return:
+        """
+        self.mspt = mspt
+        self.tps = tps
+
+    def sample(self) -> MetricsSample:
+        """
+        Takes sample and stores it in ring. CPU usage is measured since the previous sample.
+        :return: New sample.
+        """
+        now = time.monotonic()
+        cpu_percent = rss_bytes = threads = open_fds = None
+        if self.root_pid is not None:
+            # Found JVM is kept, whole /proc is walked only until it is found
+            if self.pid is None and self.pid_searches < SERVER_PID_SEARCHES:
+                self.pid_searches += 1
+                self.pid = find_server_pid(self.root_pid)
+            pid = self.pid or self.root_pid
+            stat = read_proc_stat(pid)
+            if stat is not None:
+                fields = stat[2]
+                # utime and stime, then num_threads and rss in pages
+                cpu_ticks = int(fields[9]) + int(fields[10])
+                if self.last_cpu_ticks is not None and now > self.last_time:
+                    cpu_percent = (cpu_ticks - self.last_cpu_ticks) / CLOCK_TICKS / (now - self.last_time) * 100
+                self.last_cpu_ticks = cpu_ticks
+                threads = int(fields[15])
+                rss_bytes = int(fields[19]) * PAGE_SIZE
+                try:
+                    open_fds = len(os.listdir(f"{PROC_DIR}/{pid}/fd"))
+                except OSError:
+                    pass
+        self.last_time = now
+        sample = MetricsSample(time.time(), cpu_percent, rss_bytes, threads, open_fds, len(self.players), self.tps,
+                               self.mspt)
+        self.ring.append(sample)
+        return sample
+
+    def summary(self) -> str:
+        """
+        :return: Latest sample with minimal TPS and maximal memory of stored samples, as text for user.
+        """
+        latest = self.ring.latest()
+        if latest is None:
+            return "No metrics sampled yet."
+        samples = self.ring.samples()
+        tps_values = [sample.tps for sample in samples if sample.tps is not None]
+        rss_values = [sample.rss_bytes for sample in samples if sample.rss_bytes is not None]
+        parts = [f"players: {latest.players}",
+                 f"TPS: {format_value(latest.tps, '.2f')}", f"MSPT: {format_value(latest.mspt, '.2f')}ms",
+                 f"CPU: {format_value(latest.cpu_percent, '.1f')}%",
+                 f"RSS: {format_value(latest.rss_bytes and latest.rss_bytes / 1024 ** 2, '.0f')}MiB",
+                 f"threads: {format_value(latest.threads, 'd')}", f"open files: {format_value(latest.open_fds, 'd')}"]
+        if tps_values:
+            parts.append(f"min TPS: {min(tps_values):.2f}")
+        if rss_values:
+            parts.append(f"max RSS: {max(rss_values) / 1024 ** 2:.0f}MiB")
+        return f"Server metrics ({len(samples)} samples): " + ", ".join(parts) + "."
+
+
+def format_value(value, format_spec: str) -> str:
+    """
+    :param value: Number or None.
+    :param format_spec: Format of number.
+    :return: Formatted value or "n/a".
+    """
+    return "n/a" if value is None else format(value, format_spec)
+
+
+def prometheus_text(sample) -> str:
+    """
+    :param sample: MetricsSample or None.
+    :return: Sample in Prometheus text exposition format, fields which are None are left out.
+    """
+    lines = []
+    for field, (name, description) in PROMETHEUS_METRICS.items():
+        value = getattr(sample, field) if sample is not None else None
+        if value is not None:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    def __init__(self, ring: MetricsRing, host: str = METRICS_EXPORTER_HOST, port: int = METRICS_EXPORTER_PORT):
+        """
+        Serves the latest sample at /metrics for Prometheus, in daemon thread.
+        :param ring: Buffer of samples.
+        :param host: Address of listening socket, local only by default.
+        :param port: Port of listening socket.
+        """
+        self.ring = ring
+        self.address = (host, port)
+        self.server = None
+
+    def start(self) -> None:
+        ring = self.ring
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = prometheus_text(ring.latest()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(self.address, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
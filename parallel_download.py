@@ -0,0 +1,261 @@
+import collections
+import hashlib
+import struct
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import *
+
+# Zip end of central directory records
+EOCD_SIGNATURE = b"PK\x05\x06"
+EOCD_SIZE = 22
+ZIP64_LOCATOR_SIZE = 20
+ZIP64_EOCD_SIZE = 56
+# Maximal size of end record with zip comment
+ZIP_TAIL_SIZE = EOCD_SIZE + ZIP64_LOCATOR_SIZE + 0xFFFF
+
+
+class DownloadError(Exception):
+    pass
+
+
+class StreamingExtractor:
+    def __init__(self, zip_path: str, destination: str, skip_members=(), extract_member=None):
+        """
+        Extracts members of zip file which is still being downloaded. File has its central directory written in
+        advance, so each member can be extracted as soon as downloaded prefix of file covers it.
+        :param zip_path: Path to partially downloaded zip with already written central directory.
+        :param destination: Directory where members should be extracted.
+        :param skip_members: Names of members which should not be extracted.
+        :param extract_member: Function (zip file, member) used instead of plain extraction into destination.
+        """
+        self.zip_path = zip_path
+        self.destination = destination
+        self.skip_members = set(skip_members)
+        self.extract_member = extract_member or (lambda zip_ref, member: zip_ref.extract(member, destination))
+        self.condition = threading.Condition()
+        self.watermark = 0
+        self.finished = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def advance(self, watermark: int) -> None:
+        """
+        Informs extractor that file is complete up to given offset.
+        :param watermark: Size of downloaded prefix.
+        :return:
+        """
+        with self.condition:
+            self.watermark = watermark
+            self.condition.notify_all()
+
+    def abort(self) -> None:
+        """
+        Stops extraction of members which are not downloaded yet.
+        :return:
+        """
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+
+    def wait_for(self, offset: int) -> bool:
+        """
+        Waits until downloaded prefix reaches offset.
+        :param offset: Offset in file.
+        :return: False if extraction was aborted.
+        """
+        with self.condition:
+            while self.watermark < offset and not self.finished:
+                self.condition.wait()
+            return self.watermark >= offset
+
+    def run(self) -> None:
+        """
+        Extracts members in order of their position in file.
+        :return:
+        """
+        try:
+            with zipfile.ZipFile(self.zip_path, 'r') as zip_ref:
+                members = sorted(zip_ref.infolist(), key=lambda x: x.header_offset)
+                ends = [member.header_offset for member in members[1:]] + [zip_ref.start_dir]
+                for member, end in zip(members, ends):
+                    if not self.wait_for(end):
+                        return
+                    if member.filename not in self.skip_members:
+                        self.extract_member(zip_ref, member)
+        except Exception as exception:
+            self.error = exception
+
+    def join(self, raise_error: bool = True) -> None:
+        """
+        Waits for extraction end and raises its error.
+        :param raise_error: False when extraction was aborted because of other error, which is raised instead.
+        :return:
+        """
+        self.thread.join()
+        if raise_error and self.error is not None:
+            raise DownloadError(f"Extraction failed: {self.error}")
+
+
+class ParallelDownloader:
+    def __init__(self, session, files_url: str = DRIVE_FILES_URL, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                 concurrency: int = DOWNLOAD_CONCURRENCY, max_retries: int = DOWNLOAD_MAX_RETRIES):
+        """
+        Downloads Google Drive file with parallel range requests, verifies its md5 and optionally extracts zip
+        members while download is still running.
+        :param session: Authorized requests like session (google.auth.transport.requests.AuthorizedSession).
+        :param files_url: Drive files endpoint, can point to local fake endpoint.
+        :param chunk_size: Size of one range request.
+        :param concurrency: Number of parallel requests.
+        :param max_retries: Number of retries of one range.
+        """
+        self.session = session
+        self.files_url = files_url
+        self.chunk_size = chunk_size
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+
+    def fetch_range(self, file_id: str, start: int, end: int) -> bytes:
+        """
+        Downloads range of file, retries connection and server errors with exponential backoff.
+        :param file_id: ID of drive file.
+        :param start: First byte.
+        :param end: Last byte (inclusive).
+        :return: Bytes of range.
+        """
+        retries = 0
+        while True:
+            try:
+                response = self.session.request("GET", f"{self.files_url}/{file_id}?alt=media",
+                                                headers={"Range": f"bytes={start}-{end}"})
+            except OSError:
+                response = None
+            if response is not None:
+                if response.status_code in (200, 206) and len(response.content) == end - start + 1:
+                    return response.content
+                if response.status_code < 500 and response.status_code not in (200, 206, 429):
+                    raise DownloadError(f"Download of range {start}-{end} failed, status: {response.status_code}.")
+            retries += 1
+            if retries > self.max_retries:
+                raise DownloadError(f"Download of range {start}-{end} failed after {self.max_retries} retries.")
+            time.sleep(min(2 ** retries, 32))
+
+    def write_central_directory(self, file_id: str, output, size: int) -> bool:
+        """
+        Downloads and writes end of zip (central directory) in advance, needed by streaming extraction.
+        :param file_id: ID of drive file.
+        :param output: Opened output file with final size.
+        :param size: Size of file.
+        :return: False if file does not look like zip.
+        """
+        tail_start = max(0, size - ZIP_TAIL_SIZE)
+        tail = self.fetch_range(file_id, tail_start, size - 1)
+        eocd_index = tail.rfind(EOCD_SIGNATURE)
+        if eocd_index < 0 or eocd_index + EOCD_SIZE > len(tail):
+            return False
+        cd_size, cd_offset = struct.unpack("<LL", tail[eocd_index + 12:eocd_index + 20])
+        if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF:
+            locator_index = eocd_index - ZIP64_LOCATOR_SIZE
+            if locator_index < 0:
+                return False
+            zip64_eocd_offset = struct.unpack("<Q", tail[locator_index + 8:locator_index + 16])[0]
+            if zip64_eocd_offset >= tail_start:
+                record = tail[zip64_eocd_offset - tail_start:zip64_eocd_offset - tail_start + ZIP64_EOCD_SIZE]
+            else:
+                record = self.fetch_range(file_id, zip64_eocd_offset, zip64_eocd_offset + ZIP64_EOCD_SIZE - 1)
+            cd_size, cd_offset = struct.unpack("<QQ", record[40:56])
+        output.seek(tail_start)
+        output.write(tail)
+        if cd_offset < tail_start:
+            output.seek(cd_offset)
+            output.write(self.fetch_range(file_id, cd_offset, tail_start - 1))
+        output.flush()
+        return True
+
+    def ranges(self, size: int):
+        """
+        Splits file into chunk ranges.
+        :param size: Size of file.
+        :return: Generator of (start, end) with inclusive end.
+        """
+        for start in range(0, size, self.chunk_size):
+            yield start, min(start + self.chunk_size, size) - 1
+
+    def download(self, file_id: str, output_path: str, size: int, md5_checksum: str = None, extract_to: str = None,
+                 skip_members=(), progress_callback=None, extract_member=None) -> None:
+        """
+        Downloads file with parallel range requests. Chunks are written and hashed in order, so md5 is calculated
+        during download and zip members can be extracted as soon as they are complete.
+        :param file_id: ID of drive file.
+        :param output_path: Path of output file.
+        :param size: Size of file from drive metadata.
+        :param md5_checksum: Expected md5 from drive metadata, verification is skipped if not given.
+        :param extract_to: Directory where zip members should be extracted during download.
+        :param skip_members: Names of members which should not be extracted.
+        :param progress_callback: Function called with (downloaded bytes, size) after each chunk.
+        :param extract_member: Function (zip file, member) used instead of plain extraction into extract_to.
+        :return:
+        """
+        md5 = hashlib.md5()
+        extractor = None
+        with open(output_path, "wb+") as output:
+            output.truncate(size)
+            if extract_to and size and self.write_central_directory(file_id, output, size):
+                extractor = StreamingExtractor(output_path, extract_to, skip_members, extract_member)
+                extractor.start()
+            try:
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    in_flight = collections.deque()
+                    for start, end in self.ranges(size):
+                        in_flight.append((start, executor.submit(self.fetch_range, file_id, start, end)))
+                        if len(in_flight) >= self.concurrency * 2:
+                            self.write_chunk(output, md5, extractor, progress_callback, *in_flight.popleft(), size)
+                    while in_flight:
+                        self.write_chunk(output, md5, extractor, progress_callback, *in_flight.popleft(), size)
+            except BaseException:
+                # Member being extracted is finished before caller discards staging directory
+                if extractor:
+                    extractor.abort()
+                    extractor.join(raise_error=False)
+                raise
+        if md5_checksum and md5.hexdigest() != md5_checksum:
+            if extractor:
+                extractor.abort()
+                extractor.join(raise_error=False)
+            raise DownloadError(f"Md5 mismatch of downloaded file: {md5.hexdigest()} != {md5_checksum}.")
+        if extractor:
+            extractor.join()
+        elif extract_to:
+            extractor = StreamingExtractor(output_path, extract_to, skip_members, extract_member)
+            extractor.advance(size)
+            extractor.start()
+            extractor.join()
+
+    @staticmethod
+    def write_chunk(output, md5, extractor, progress_callback, start: int, future, size: int) -> None:
+        """
+        Writes downloaded chunk in order and moves extraction watermark.
+        :param output: Output file.
+        :param md5: Running md5 hash.
+        :param extractor: Streaming extractor or None.
+        :param progress_callback: Function called with (downloaded bytes, size) or None.
+        :param start: Offset of chunk.
+        :param future: Future with chunk bytes.
+        :param size: Size of file.
+        :return:
+        """
+        data = future.result()
+        md5.update(data)
+        output.seek(start)
+        output.write(data)
+        downloaded = start + len(data)
+        if extractor:
+            output.flush()
+            extractor.advance(downloaded)
+        if progress_callback:
+            progress_callback(downloaded, size)
@@ -0,0 +1,363 @@
+import collections
+import functools
+import os
+import struct
+import sys
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import *
+from job_executor import lower_process_priority
+
+# Size of deflate window, last bytes of previous chunk are used as dictionary for the next one
+DEFLATE_WINDOW_SIZE = 32 * 1024
+# Private attributes of zipfile.ZipFile needed for writing compressed members, the same ones which zipfile's own
+# streamed members use, they exist since Python 3.6
+ZIPFILE_INTERNALS = ("fp", "start_dir", "filelist", "NameToInfo", "_seekable", "_didModify")
+ZIPFILE_INTERNALS_VERSION = (3, 6)
+# Deflate output can be a bit larger than its input, same margin as zipfile uses
+ZIP64_MARGIN = 1.05
+
+
+def compress_data(data: bytes, level: int, store: bool, is_last: bool, zdict: bytes = b""):
+    """
+    Compresses one chunk of member into raw deflate stream. Not last chunks are ended with sync flush, so compressed
+    chunks can be simply concatenated into one valid deflate stream.
+    :param data: Uncompressed chunk.
+    :param level: Compression level from 0 to 9.
+    :param store: Flag which indicates that data is already compressed and should be stored as it is.
+    :param is_last: Indicates the last chunk of member.
+    :param zdict: Uncompressed tail of previous chunk used as compression dictionary.
+    :return: Tuple of (output bytes, crc32 of chunk, length of chunk).
+    """
+    crc = zlib.crc32(data)
+    if store:
+        return data, crc, len(data)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict) if zdict else \
+        zlib.compressobj(level, zlib.DEFLATED, -15)
+    output = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if is_last else zlib.Z_SYNC_FLUSH)
+    return output, crc, len(data)
+
+
+def compress_file_chunk(file_path: str, offset: int, length: int, level: int, store: bool, is_last: bool):
+    """
+    Worker function, reads chunk of file and compresses it.
+    :param file_path: Path to file.
+    :param offset: Offset of chunk in file.
+    :param length: Length of chunk.
+    :param level: Compression level.
+    :param store: Flag which indicates that chunk should not be compressed.
+    :param is_last: Indicates the last chunk of file.
+    :return: Result of compress_data.
+    """
+    with open(file_path, "rb") as file:
+        zdict = b""
+        if offset and not store:
+            dict_offset = max(0, offset - DEFLATE_WINDOW_SIZE)
+            file.seek(dict_offset)
+            zdict = file.read(offset - dict_offset)
+        file.seek(offset)
+        data = file.read(length)
+    return compress_data(data, level, store, is_last, zdict)
+
+
+def gf2_matrix_times(matrix, vector: int) -> int:
+    """
+    Multiplies GF(2) matrix by vector, used for combining crc32 checksums.
+    :param matrix: List of 32 matrix columns.
+    :param vector: 32 bit vector.
+    :return: 32 bit vector.
+    """
+    result = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return result
+
+
+def gf2_matrix_square(matrix) -> list:
+    """
+    Squares GF(2) matrix.
+    :param matrix: List of 32 matrix columns.
+    :return: Squared matrix.
+    """
+    return [gf2_matrix_times(matrix, column) for column in matrix]
+
+
+@functools.lru_cache(maxsize=8)
+def crc32_zeros_operator(length: int) -> tuple:
+    """
+    Builds operator which moves crc32 over given number of zero bytes. Port of zlib's crc32_combine, cached because
+    almost all chunks have the same length.
+    :param length: Number of bytes.
+    :return: Operator matrix.
+    """
+    # Operator for one zero bit, then squared three times for one zero byte
+    operator = [0xedb88320] + [1 << n for n in range(31)]
+    for _ in range(3):
+        operator = gf2_matrix_square(operator)
+    result = [1 << n for n in range(32)]
+    while length:
+        if length & 1:
+            result = [gf2_matrix_times(operator, column) for column in result]
+        length >>= 1
+        if length:
+            operator = gf2_matrix_square(operator)
+    return tuple(result)
+
+
+def crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    """
+    Combines crc32 of two consecutive blocks of data.
+    :param crc1: Crc32 of first block.
+    :param crc2: Crc32 of second block.
+    :param length2: Length of second block.
+    :return: Crc32 of both blocks.
+    """
+    if not length2:
+        return crc1
+    return gf2_matrix_times(crc32_zeros_operator(length2), crc1) ^ crc2
+
+
+class RawMemberWriter:
+    def __init__(self, zipf: zipfile.ZipFile):
+        """
+        Writes members whose data is already compressed into zip file. It is the only place which touches private
+        attributes of zipfile, check supported before use.
+        :param zipf: Zip file opened for writing.
+        """
+        self.zipf = zipf
+
+    @staticmethod
+    def supported(zipf: zipfile.ZipFile) -> bool:
+        """
+        :param zipf: Zip file opened for writing.
+        :return: True if zipfile of this Python has all needed attributes.
+        """
+        return sys.version_info >= ZIPFILE_INTERNALS_VERSION and all(hasattr(zipf, name) for name in ZIPFILE_INTERNALS)
+
+    def start(self, zinfo: zipfile.ZipInfo, zip64: bool) -> None:
+        """
+        Writes local header of member, same way as zipfile does for its own streamed members.
+        :param zinfo: Zip info of member.
+        :param zip64: Flag which indicates usage of zip64 extensions, header cannot change its size later.
+        :return:
+        """
+        zinfo.compress_size = 0
+        zinfo.CRC = 0
+        # Data descriptor is needed when header cannot be rewritten
+        zinfo.flag_bits = 0x00 if self.zipf._seekable else 0x08
+        zinfo.header_offset = self.zipf.fp.tell()
+        self.zipf._didModify = True
+        self.zipf.fp.write(zinfo.FileHeader(zip64))
+
+    def write(self, data: bytes) -> None:
+        self.zipf.fp.write(data)
+
+    def finish(self, zinfo: zipfile.ZipInfo, zip64: bool) -> None:
+        """
+        Writes correct crc and sizes of member and registers it in central directory.
+        :param zinfo: Zip info with final crc and sizes.
+        :param zip64: Flag which indicates usage of zip64 extensions.
+        :return:
+        """
+        if not zip64 and max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(f"Member {zinfo.filename} exceeded zip64 limit after its header was written")
+        file_pointer = self.zipf.fp
+        if zinfo.flag_bits & 0x08:
+            file_pointer.write(struct.pack('<LLQQ' if zip64 else '<LLLL', 0x08074b50, zinfo.CRC,
+                                           zinfo.compress_size, zinfo.file_size))
+            self.zipf.start_dir = file_pointer.tell()
+        else:
+            self.zipf.start_dir = file_pointer.tell()
+            file_pointer.seek(zinfo.header_offset)
+            file_pointer.write(zinfo.FileHeader(zip64))
+            file_pointer.seek(self.zipf.start_dir)
+        self.zipf.filelist.append(zinfo)
+        self.zipf.NameToInfo[zinfo.filename] = zinfo
+
+
+class ParallelZipWriter:
+    def __init__(self, output, compress_level: int = ZIP_COMPRESSION_LEVEL, workers: int = ZIP_WORKERS,
+                 chunk_size: int = ZIP_CHUNK_SIZE, throttle=None):
+        """
+        Writes standard zip archive whose members (and chunks of large members) are compressed in process pool, while
+        the only writer puts them in order into output. Already compressed files are stored without recompression.
+        When zipfile of this Python lacks attributes needed for that, members are written by zipfile one by one.
+        :param output: Path or file object of output zip, non-seekable streams are supported with data descriptors.
+        :param compress_level: Deflate compression level.
+        :param workers: Number of compressing processes, 1 compresses in current process.
+        :param chunk_size: Size of chunk compressed by one task.
+        :param throttle: JobThrottle of background job, its workers run with low priority and data written to output
+        is limited by its rates.
+        """
+        self.zipf = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
+        self.raw_writer = RawMemberWriter(self.zipf) if RawMemberWriter.supported(self.zipf) else None
+        self.compress_level = compress_level
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.throttle = throttle
+        # Queued members (file path or bytes, archive name)
+        self.members = []
+        # Member id -> the most bytes its tasks can read, file can grow after its size was checked
+        self.max_sizes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.zipf.close()
+
+    def write(self, file_path: str, arc_name: str) -> None:
+        """
+        Queues file to be added to archive.
+        :param file_path: Path to file.
+        :param arc_name: Name of member in archive.
+        :return:
+        """
+        self.members.append((file_path, arc_name))
+
+    def writestr(self, arc_name: str, data) -> None:
+        """
+        Queues bytes to be added to archive.
+        :param arc_name: Name of member in archive.
+        :param data: Content of member, str is encoded as UTF-8 like in zipfile.
+        :return:
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.members.append((data, arc_name))
+
+    @staticmethod
+    def is_compressed(arc_name: str) -> bool:
+        """
+        Checks if member content is already compressed, basing on its extension.
+        :param arc_name: Name of member.
+        :return: True if member should be stored.
+        """
+        return os.path.splitext(arc_name)[1].lower() in ALREADY_COMPRESSED_EXTENSIONS
+
+    def member_tasks(self, member_id: int, source, arc_name: str):
+        """
+        Splits member into compressing tasks.
+        :param member_id: Index of member.
+        :param source: File path or bytes.
+        :param arc_name: Name of member.
+        :return: Generator of (member id, chunk index, is last, function, arguments).
+        """
+        store = self.is_compressed(arc_name)
+        if isinstance(source, bytes):
+            self.max_sizes[member_id] = len(source)
+            yield member_id, 0, True, compress_data, (source, self.compress_level, store, True)
+            return
+        size = os.path.getsize(source)
+        offsets = range(0, size, self.chunk_size) if size else [0]
+        self.max_sizes[member_id] = len(offsets) * self.chunk_size
+        for chunk_index, offset in enumerate(offsets):
+            is_last = offset + self.chunk_size >= size
+            yield member_id, chunk_index, is_last, compress_file_chunk, \
+                (source, offset, self.chunk_size, self.compress_level, store, is_last)
+
+    def all_tasks(self):
+        """
+        Generates tasks of all queued members in order.
+        :return: Generator of tasks.
+        """
+        for member_id, (source, arc_name) in enumerate(self.members):
+            yield from self.member_tasks(member_id, source, arc_name)
+
+    def results(self):
+        """
+        Runs tasks in process pool keeping limited number of them in flight, so memory usage stays bounded.
+        :return: Generator of (member id, chunk index, is last, (output, crc, length)) in archive order.
+        """
+        if self.workers == 1:
+            for member_id, chunk_index, is_last, function, arguments in self.all_tasks():
+                yield member_id, chunk_index, is_last, function(*arguments)
+            return
+        initializer = lower_process_priority if self.throttle else None
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=initializer) as executor:
+            in_flight = collections.deque()
+            for member_id, chunk_index, is_last, function, arguments in self.all_tasks():
+                in_flight.append((member_id, chunk_index, is_last, executor.submit(function, *arguments)))
+                if len(in_flight) >= self.workers * 2:
+                    member_id, chunk_index, is_last, future = in_flight.popleft()
+                    yield member_id, chunk_index, is_last, future.result()
+            while in_flight:
+                member_id, chunk_index, is_last, future = in_flight.popleft()
+                yield member_id, chunk_index, is_last, future.result()
+
+    def member_info(self, source, arc_name: str) -> zipfile.ZipInfo:
+        """
+        Creates zip info of member.
+        :param source: File path or bytes.
+        :param arc_name: Name of member.
+        :return: Zip info.
+        """
+        if isinstance(source, bytes):
+            zinfo = zipfile.ZipInfo(arc_name, date_time=time.localtime(time.time())[:6])
+            zinfo.external_attr = 0o600 << 16
+            zinfo.file_size = len(source)
+        else:
+            zinfo = zipfile.ZipInfo.from_file(source, arc_name)
+        zinfo.compress_type = zipfile.ZIP_STORED if self.is_compressed(arc_name) else zipfile.ZIP_DEFLATED
+        return zinfo
+
+    def close_plain(self) -> None:
+        """
+        Writes queued members with zipfile itself, in current process.
+        :return:
+        """
+        for source, arc_name in self.members:
+            zinfo = self.member_info(source, arc_name)
+            if self.throttle:
+                self.throttle.read(zinfo.file_size)
+                self.throttle.write(zinfo.file_size)
+            if isinstance(source, bytes):
+                self.zipf.writestr(zinfo, source, compresslevel=self.compress_level)
+            else:
+                self.zipf.write(source, arc_name, zinfo.compress_type, self.compress_level)
+        self.members = []
+        self.zipf.close()
+
+    def close(self) -> None:
+        """
+        Compresses all queued members and writes archive.
+        :return:
+        """
+        if self.raw_writer is None:
+            self.close_plain()
+            return
+        zinfo = None
+        zip64 = False
+        for member_id, chunk_index, is_last, (output, crc, length) in self.results():
+            if chunk_index == 0:
+                source, arc_name = self.members[member_id]
+                zinfo = self.member_info(source, arc_name)
+                # Decided by the most data tasks can read, header of member cannot grow later
+                zip64 = max(self.max_sizes[member_id], zinfo.file_size) * ZIP64_MARGIN > zipfile.ZIP64_LIMIT
+                self.raw_writer.start(zinfo, zip64)
+                file_size = 0
+            zinfo.CRC = crc32_combine(zinfo.CRC, crc, length) if chunk_index else crc
+            zinfo.compress_size += len(output)
+            file_size += length
+            if self.throttle:
+                # Workers read ahead only a few chunks, so limiting written chunks limits reading as well
+                self.throttle.read(length)
+                self.throttle.write(len(output))
+            self.raw_writer.write(output)
+            if is_last:
+                # File could change during compression, sizes in header must describe written data
+                zinfo.file_size = file_size
+                self.raw_writer.finish(zinfo, zip64)
+        self.members = []
+        self.max_sizes = {}
+        self.zipf.close()
@@ -0,0 +1,77 @@
+import json
+import socket
+import time
+
+from constants import *
+
+
+class PortAllocator:
+    def __init__(self, state_file: str = PORT_STATE_FILE, host: str = ""):
+        """
+        Finds free TCP port for server by binding to it. Last port which worked is tried first, otherwise system
+        gives any free port from its dynamic range. Bound socket reserves the port until server is about to start.
+        :param state_file: Json file with last working port.
+        :param host: Interface on which port must be free, all by default.
+        """
+        self.state_file = state_file
+        self.host = host
+        self.reservation = None
+        self.port = None
+        self.allocation_time_s = None
+
+    def load_last_port(self):
+        """
+        :return: Last working port or None.
+        """
+        try:
+            with open(self.state_file, "r") as file:
+                return json.load(file).get("port")
+        except (OSError, ValueError):
+            return None
+
+    def save_last_port(self) -> None:
+        """
+        Remembers allocated port as working, called after server started on it.
+        :return:
+        """
+        with open(self.state_file, "w") as file:
+            json.dump({"port": self.port}, file)
+
+    def bind(self, port: int):
+        """
+        Binds socket to port without allowing other sockets to share it.
+        :param port: Port number, 0 lets system choose.
+        :return: Bound socket or None if port is taken.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        try:
+            sock.bind((self.host, port))
+        except OSError:
+            sock.close()
+            return None
+        return sock
+
+    def allocate(self):
+        """
+        Reserves free port, previous one if it is still free.
+        :return: Port number or None if no port could be bound.
+        """
+        start_time = time.perf_counter()
+        last_port = self.load_last_port()
+        self.reservation = self.bind(last_port) if last_port else None
+        if self.reservation is None:
+            self.reservation = self.bind(0)
+        self.port = self.reservation.getsockname()[1] if self.reservation else None
+        self.allocation_time_s = time.perf_counter() - start_time
+        return self.port
+
+    def release(self) -> None:
+        """
+        Frees reserved port, should be called just before server binds it.
+        :return:
+        """
+        if self.reservation:
+            self.reservation.close()
+            self.reservation = None
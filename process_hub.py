@@ -0,0 +1,196 @@
+import asyncio
+import subprocess
+import threading
+
+from bot_protocol import read_message_async
+from constants import *
+from stream_reader import read_lines_async
+
+
+class HubProcess:
+    def __init__(self, hub, name: str, process: asyncio.subprocess.Process):
+        """
+        Handle of subprocess running on hub's event loop, usable from any thread. Its wait, terminate and kill
+        methods behave like subprocess.Popen ones.
+        :param hub: Process hub which owns the event loop.
+        :param name: Name of process used in logs.
+        :param process: Asyncio process.
+        """
+        self.hub = hub
+        self.name = name
+        self.process = process
+        self.write_queue = asyncio.Queue()
+        self.tasks = []
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def returncode(self):
+        return self.process.returncode
+
+    def write_line(self, text: str) -> None:
+        """
+        Queues line for process stdin, never blocks the caller.
+        :param text: Line content without newline.
+        :return:
+        """
+        self.write_bytes(f"{text}\n".encode('utf-8'))
+
+    def write_bytes(self, data: bytes) -> None:
+        """
+        Queues raw data, for example protocol frame, for process stdin, never blocks the caller.
+        :param data: Data.
+        :return:
+        """
+        self.hub.loop.call_soon_threadsafe(self.write_queue.put_nowait, data)
+
+    async def write_stdin(self) -> None:
+        """
+        Writes queued lines to stdin, drain gives back-pressure when process does not read its input.
+        :return:
+        """
+        try:
+            while True:
+                data = await self.write_queue.get()
+                try:
+                    self.process.stdin.write(data)
+                    await self.process.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+        finally:
+            # Process transport is finished only after all its pipes are closed
+            self.process.stdin.close()
+
+    async def read_stream(self, stream: asyncio.StreamReader, on_line, on_close) -> None:
+        """
+        Reads stream in chunks and passes decoded lines to callback, too long lines are truncated.
+        :param stream: Stdout or stderr of process.
+        :param on_line: Function called with every line.
+        :param on_close: Function called when stream ends.
+        :return:
+        """
+        await read_lines_async(stream, on_line)
+        if on_close:
+            on_close()
+
+    async def read_frames(self, stream: asyncio.StreamReader, on_message, on_close) -> None:
+        """
+        Reads stream as protocol frames and passes decoded messages to callback.
+        :param stream: Stdout of process.
+        :param on_message: Function called with every message dictionary.
+        :param on_close: Function called when stream ends.
+        :return:
+        """
+        while (message := await read_message_async(stream)) is not None:
+            on_message(message)
+        if on_close:
+            on_close()
+
+    def wait(self, timeout: float = None) -> int:
+        """
+        Waits for process exit.
+        :param timeout: Timeout in seconds.
+        :return: Return code of process.
+        """
+        try:
+            return self.hub.run(asyncio.wait_for(self.process.wait(), timeout))
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(self.name, timeout)
+
+    def terminate(self) -> None:
+        self.hub.loop.call_soon_threadsafe(self.signal_process, self.process.terminate)
+
+    def kill(self) -> None:
+        self.hub.loop.call_soon_threadsafe(self.signal_process, self.process.kill)
+
+    def signal_process(self, function) -> None:
+        """
+        Sends signal to process if it still runs.
+        :param function: Terminate or kill method of process.
+        :return:
+        """
+        if self.process.returncode is None:
+            try:
+                function()
+            except ProcessLookupError:
+                pass
+
+
+class ProcessHub:
+    def __init__(self):
+        """
+        One asyncio event loop in background thread which handles reads and writes of all subprocesses (server,
+        tunnel and bot) instead of separate blocking thread per stream.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self, timeout: float = PROCESS_EXIT_TIMEOUT_S) -> None:
+        """
+        Cancels remaining tasks of processes, then stops and closes event loop.
+        :param timeout: Timeout of cancellation and of loop's end.
+        :return:
+        """
+        if self.thread.is_alive():
+            self.run(self.cancel_tasks(), timeout)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
+        if not self.loop.is_running():
+            self.loop.close()
+
+    @staticmethod
+    async def cancel_tasks() -> None:
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self, coroutine, timeout: float = None):
+        """
+        Runs coroutine on hub's loop and waits for its result from calling thread.
+        :param coroutine: Coroutine.
+        :param timeout: Timeout in seconds.
+        :return: Result of coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def spawn(self, name: str, command: list, on_line=None, on_close=None, read_stderr: bool = False,
+              cwd: str = None, quiet: bool = False, framed: bool = False) -> HubProcess:
+        """
+        Starts subprocess on hub's loop.
+        :param name: Name of process used in logs.
+        :param command: Command with arguments.
+        :param on_line: Function called in loop thread with every output line, None discards output.
+        :param on_close: Function called in loop thread when output ends.
+        :param read_stderr: Reads stderr instead of stdout.
+        :param cwd: Working directory of process.
+        :param quiet: Discards not read output instead of passing it to current console.
+        :param framed: Output is read as protocol frames and on_line gets decoded messages instead of lines.
+        :return: Process handle.
+        """
+        return self.run(self.spawn_async(name, command, on_line, on_close, read_stderr, cwd, quiet, framed))
+
+    async def spawn_async(self, name: str, command: list, on_line, on_close, read_stderr: bool, cwd: str,
+                          quiet: bool, framed: bool) -> HubProcess:
+        """
+        Coroutine part of spawn.
+        :return: Process handle.
+        """
+        not_read = subprocess.DEVNULL if quiet else None
+        read = subprocess.PIPE if on_line else not_read
+        process = await asyncio.create_subprocess_exec(*command, cwd=cwd, stdin=subprocess.PIPE,
+                                                       stdout=not_read if read_stderr else read,
+                                                       stderr=read if read_stderr else not_read,
+                                                       limit=STREAM_READ_SIZE)
+        hub_process = HubProcess(self, name, process)
+        hub_process.tasks.append(self.loop.create_task(hub_process.write_stdin()))
+        if on_line:
+            stream = process.stderr if read_stderr else process.stdout
+            read = hub_process.read_frames if framed else hub_process.read_stream
+            hub_process.tasks.append(self.loop.create_task(read(stream, on_line, on_close)))
+        return hub_process
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+
+from constants import *
+
+
+def parse_drive_time(value: str) -> datetime:
+    """
+    :param value: RFC 3339 time returned by drive, for example 2024-01-01T12:00:00.000Z.
+    :return: Aware datetime.
+    """
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class RetentionPolicy:
+    def __init__(self, keep_last: int = RETENTION_KEEP_LAST, keep_daily_days: int = RETENTION_KEEP_DAILY_DAYS,
+                 keep_weekly_weeks: int = RETENTION_KEEP_WEEKLY_WEEKS,
+                 max_total_bytes: int = RETENTION_MAX_TOTAL_BYTES):
+        """
+        Decides which save generations stay on drive. Generation is kept if it is one of the last ones, the newest
+        of its day within daily tier or the newest of its week within weekly tier. Kept generations over the bytes
+        quota are removed from the eldest. The newest generation is always kept.
+        :param keep_last: Number of the newest generations kept.
+        :param keep_daily_days: Number of days for which one generation per day is kept.
+        :param keep_weekly_weeks: Number of weeks for which one generation per week is kept.
+        :param max_total_bytes: Quota of all kept generations, None for no quota.
+        """
+        self.keep_last = keep_last
+        self.keep_daily_days = keep_daily_days
+        self.keep_weekly_weeks = keep_weekly_weeks
+        self.max_total_bytes = max_total_bytes
+
+    def select(self, generations: list, now: datetime = None) -> tuple:
+        """
+        Splits generations into kept and removed ones.
+        :param generations: List of SaveGeneration.
+        :param now: Current time, aware datetime.
+        :return: Tuple of (kept, removed) lists, both from the newest.
+        """
+        now = now or datetime.now(timezone.utc)
+        generations = sorted(generations, key=lambda generation: generation.modified_time, reverse=True)
+        keep = set(range(min(max(self.keep_last, 1), len(generations))))
+        days = set()
+        weeks = set()
+        for index, generation in enumerate(generations):
+            modified_time = parse_drive_time(generation.modified_time)
+            age = now - modified_time
+            if age < timedelta(days=self.keep_daily_days) and modified_time.date() not in days:
+                days.add(modified_time.date())
+                keep.add(index)
+            week = modified_time.isocalendar()[:2]
+            if age < timedelta(weeks=self.keep_weekly_weeks) and week not in weeks:
+                weeks.add(week)
+                keep.add(index)
+        kept = []
+        removed = []
+        total_bytes = 0
+        over_quota = False
+        for index, generation in enumerate(generations):
+            if index in keep and not over_quota:
+                over_quota = self.max_total_bytes is not None and index > 0 and \
+                    total_bytes + generation.size > self.max_total_bytes
+            if index in keep and not over_quota:
+                kept.append(generation)
+                total_bytes += generation.size
+            else:
+                removed.append(generation)
+        return kept, removed
+
+
+def batch_delete(service, file_ids: list, batch_size: int = DRIVE_BATCH_SIZE) -> list:
+    """
+    Deletes files with drive's batch endpoint, many deletes are sent in one HTTP request.
+    :param service: Google Drive API service object.
+    :param file_ids: IDs of files or folders, folders are deleted with their content.
+    :param batch_size: Maximal number of deletes in one batch request.
+    :return: List of (file id, exception) of failed deletes.
+    """
+    failed = []
+
+    def on_response(request_id, response, exception):
+        if exception:
+            failed.append((request_id, exception))
+
+    for start in range(0, len(file_ids), batch_size):
+        batch = service.new_batch_http_request()
+        for file_id in file_ids[start:start + batch_size]:
+            batch.add(service.files().delete(fileId=file_id), callback=on_response, request_id=file_id)
+        batch.execute()
+    return failed
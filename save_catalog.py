@@ -0,0 +1,164 @@
+from collections import namedtuple
+
+from constants import *
+from drive_index import FOLDER_MIME_TYPE, ZIP_MIME_TYPES
+
+SaveRecord = namedtuple("SaveRecord", ["id", "name", "parents", "size", "mime_type", "modified_time"])
+RECORD_FIELDS = "id, name, parents, size, mimeType, modifiedTime"
+# World folder with all saves stored in it, modified time is the newest one of the folder and its files
+SaveGeneration = namedtuple("SaveGeneration", ["folder", "files", "size", "modified_time"])
+
+
+def record_from_item(item: dict) -> SaveRecord:
+    """
+    :param item: Drive file resource.
+    :return: Record of file, size is None for folders.
+    """
+    return SaveRecord(item["id"], item["name"], item.get("parents", []),
+                      int(item["size"]) if "size" in item else None, item["mimeType"], item["modifiedTime"])
+
+
+def quote(value: str) -> str:
+    """
+    :param value: String value.
+    :return: Value as string literal of drive query.
+    """
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+class SaveCatalog:
+    def __init__(self, service, page_size: int = SAVE_CATALOG_PAGE_SIZE):
+        """
+        Finds saves on drive with queries filtered and ordered by drive itself, so the number of requests does not
+        depend on how many other files drive holds.
+        :param service: Google Drive API service object.
+        :param page_size: Maximal number of records in one response.
+        """
+        self.service = service
+        self.page_size = page_size
+
+    @staticmethod
+    def matches(record: SaveRecord, names: tuple, name_prefixes: tuple, mime_types: tuple, parent) -> bool:
+        """
+        Checks record against query conditions, drive's "contains" on names is only a hint for prefixes.
+        :return: True if record fulfils all conditions.
+        """
+        return (record.name in names or record.name.startswith(name_prefixes)) and \
+            (not mime_types or record.mime_type in mime_types) and (parent is None or parent in record.parents)
+
+    def query(self, names: tuple = (), name_prefixes: tuple = (), mime_types: tuple = (), parent: str = None,
+              limit: int = None, newest_first: bool = True, page_size: int = None) -> list:
+        """
+        Lists records with given names or name prefixes, ordered by modification time.
+        :param names: Exact names.
+        :param name_prefixes: Name prefixes.
+        :param mime_types: Allowed mime types, any when empty.
+        :param parent: ID of folder which must contain the file.
+        :param limit: Maximal number of records, all when None.
+        :param newest_first: Order from the newest record.
+        :param page_size: Page size overriding catalog's one, for listings which are expected to be long.
+        :return: List of SaveRecord.
+        """
+        page_size = page_size or self.page_size
+        name_conditions = [f"name={quote(name)}" for name in names] + \
+                          [f"name contains {quote(prefix)}" for prefix in name_prefixes]
+        conditions = ["trashed=false", f"({' or '.join(name_conditions)})"]
+        if mime_types:
+            conditions.append(f"({' or '.join(f'mimeType={quote(mime_type)}' for mime_type in mime_types)})")
+        if parent is not None:
+            conditions.append(f"{quote(parent)} in parents")
+        records = []
+        page_token = None
+        while limit is None or len(records) < limit:
+            results = self.service.files().list(
+                q=" and ".join(conditions), orderBy="modifiedTime desc" if newest_first else "modifiedTime",
+                pageSize=page_size if limit is None else min(page_size, limit - len(records)),
+                pageToken=page_token, fields=f"nextPageToken, files({RECORD_FIELDS})").execute()
+            records.extend(record for record in map(record_from_item, results.get("files", []))
+                           if self.matches(record, names, name_prefixes, mime_types, parent))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+        return records if limit is None else records[:limit]
+
+    def first(self, **conditions):
+        """
+        :param conditions: Arguments of query.
+        :return: First record of query or None.
+        """
+        records = self.query(limit=1, **conditions)
+        return records[0] if records else None
+
+    def latest_save(self):
+        """
+        :return: Newest full save or None.
+        """
+        return self.first(names=(SAVE_FILE_NAME,), mime_types=ZIP_MIME_TYPES)
+
+    def latest_snapshot(self):
+        """
+        :return: Newest full save or incremental delta, or None.
+        """
+        return self.first(names=(SAVE_FILE_NAME,), name_prefixes=(INCREMENTAL_DELTA_PREFIX,),
+                          mime_types=ZIP_MIME_TYPES)
+
+    def snapshot_chain(self, folder_id: str) -> list:
+        """
+        :param folder_id: ID of world folder.
+        :return: Base and deltas stored in folder, in order of applying.
+        """
+        chain = self.query(names=(SAVE_FILE_NAME,), name_prefixes=(INCREMENTAL_DELTA_PREFIX,),
+                           mime_types=ZIP_MIME_TYPES, parent=folder_id)
+        # Base name sorts before delta names, deltas are ordered by zero padded sequence
+        return sorted(chain, key=lambda record: (record.name != SAVE_FILE_NAME, record.name))
+
+    def world_folders(self, newest_first: bool = True, limit: int = None) -> list:
+        """
+        :param newest_first: Order from the newest folder.
+        :param limit: Maximal number of folders, all when None.
+        :return: World folders ordered by modification time.
+        """
+        return self.query(names=(SAVE_FOLDER_NAME,), mime_types=(FOLDER_MIME_TYPE,), limit=limit,
+                          newest_first=newest_first)
+
+    def generations(self) -> list:
+        """
+        Lists world folders together with saves stored in them with one listing.
+        :return: List of SaveGeneration from the newest.
+        """
+        records = self.query(names=(SAVE_FILE_NAME, SAVE_FOLDER_NAME), name_prefixes=(INCREMENTAL_DELTA_PREFIX,),
+                             mime_types=ZIP_MIME_TYPES + (FOLDER_MIME_TYPE,), page_size=1000)
+        folders = {record.id: [] for record in records
+                   if record.mime_type == FOLDER_MIME_TYPE and record.name == SAVE_FOLDER_NAME}
+        for record in records:
+            for parent in record.parents:
+                if record.mime_type != FOLDER_MIME_TYPE and parent in folders:
+                    folders[parent].append(record)
+        generations = []
+        for folder in records:
+            if folder.id in folders:
+                files = folders[folder.id]
+                generations.append(SaveGeneration(folder, files, sum(file.size or 0 for file in files),
+                                                  max([folder.modified_time] + [file.modified_time for file in files])))
+        return sorted(generations, key=lambda generation: generation.modified_time, reverse=True)
+
+
+class IndexedSaveCatalog(SaveCatalog):
+    def __init__(self, drive_index):
+        """
+        Save catalog answered from synchronized local index, without any drive request.
+        :param drive_index: Synchronized DriveIndex.
+        """
+        super().__init__(None)
+        self.drive_index = drive_index
+
+    def query(self, names: tuple = (), name_prefixes: tuple = (), mime_types: tuple = (), parent: str = None,
+              limit: int = None, newest_first: bool = True, page_size: int = None) -> list:
+        """
+        Same as SaveCatalog.query. RFC 3339 times of drive sort correctly as strings.
+        :return: List of SaveRecord.
+        """
+        records = [record for record in map(record_from_item, self.drive_index.items())
+                   if self.matches(record, names, name_prefixes, mime_types, parent)]
+        records.sort(key=lambda record: record.modified_time, reverse=newest_first)
+        return records if limit is None else records[:limit]
@@ -0,0 +1,161 @@
+import glob
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+
+from constants import *
+
+
+def java_executable(java_dir: str = JAVA_DIR) -> str:
+    """
+    :param java_dir: Directory with java binaries.
+    :return: Path to java executable.
+    """
+    return os.path.join(java_dir, "java.exe" if os.name == "nt" else "java")
+
+
+def launch_args_file(server_dir: str = SERVER_DIR, pattern: str = SERVER_LAUNCH_ARGS_GLOB):
+    """
+    Forge keeps its launch arguments in file whose path contains forge version.
+    :param server_dir: Server's directory.
+    :param pattern: Glob pattern relative to server's directory.
+    :return: Path relative to server's directory or None.
+    """
+    files = sorted(glob.glob(os.path.join(server_dir, pattern)))
+    return os.path.relpath(files[-1], server_dir) if files else None
+
+
+def file_fingerprint(paths: list) -> list:
+    """
+    :param paths: Paths to files.
+    :return: List of [path, size, modification time in ns], None for missing files.
+    """
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            fingerprint.append([path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            fingerprint.append([path, None, None])
+    return fingerprint
+
+
+def cds_options(java: str, args_files: list, archive_file: str = APP_CDS_ARCHIVE_FILE) -> list:
+    """
+    Chooses Class Data Sharing options. Archive of loaded classes is dumped at the first clean exit of server and
+    mapped by later runs. Archive is recreated when java or argument files changed, because JVM ignores archive
+    with different class path.
+    :param java: Path to java executable.
+    :param args_files: Paths to argument files.
+    :param archive_file: Path to archive.
+    :return: JVM options.
+    """
+    fingerprint_file = f"{archive_file}.json"
+    fingerprint = file_fingerprint([java] + args_files)
+    try:
+        with open(fingerprint_file, "r") as file:
+            valid = json.load(file) == fingerprint
+    except (OSError, ValueError):
+        valid = False
+    if valid and os.path.exists(archive_file):
+        return [f"-XX:SharedArchiveFile={archive_file}"]
+    if os.path.exists(archive_file):
+        os.remove(archive_file)
+    with open(fingerprint_file, "w") as file:
+        json.dump(fingerprint, file)
+    return [f"-XX:ArchiveClassesAtExit={archive_file}"]
+
+
+def server_command(server_dir: str = SERVER_DIR) -> tuple:
+    """
+    Builds command which starts server's JVM directly, without script and shell in between.
+    Falls back to RUN_SERVER_COMMAND when java or argument files are missing.
+    :param server_dir: Server's directory, working directory of server.
+    :return: Tuple of (command, description for logs).
+    """
+    if not USE_DIRECT_JVM_LAUNCH:
+        return RUN_SERVER_COMMAND, "start script"
+    java = java_executable()
+    jvm_args_file = os.path.join(server_dir, SERVER_JVM_ARGS_FILE)
+    launch_file = launch_args_file(server_dir)
+    if not os.path.isfile(java) or not os.path.isfile(jvm_args_file) or launch_file is None:
+        return RUN_SERVER_COMMAND, "start script, java or argument files not found"
+    options = []
+    if USE_APP_CDS:
+        options = cds_options(java, [jvm_args_file, os.path.join(server_dir, launch_file)])
+    description = "java directly"
+    if options:
+        description += ", mapping class data archive" if options[0].startswith("-XX:SharedArchiveFile") else \
+            ", dumping class data archive at exit"
+    return [java] + options + [f"@{SERVER_JVM_ARGS_FILE}", f"@{launch_file}"] + SERVER_EXTRA_ARGS, description
+
+
+class BootTimer:
+    def __init__(self, history_file: str = BOOT_HISTORY_FILE):
+        """
+        Measures time from start of server's process to phases of boot recognized in its output and keeps history
+        of boots, so slower boot is noticed.
+        :param history_file: Json lines file with previous boots.
+        """
+        self.history_file = history_file
+        self.start_time = None
+        self.phases = {}
+
+    def start(self) -> None:
+        self.start_time = time.monotonic()
+        self.phases = {}
+
+    def mark(self, phase: str) -> None:
+        """
+        Records time of phase, only the first occurrence counts.
+        :param phase: Name of phase.
+        :return:
+        """
+        if self.start_time is not None and phase not in self.phases:
+            self.phases[phase] = time.monotonic() - self.start_time
+
+    def report(self) -> str:
+        """
+        :return: Phases with their time since start and duration.
+        """
+        parts = []
+        previous_time = 0
+        for phase, phase_time in self.phases.items():
+            parts.append(f"{phase} at {phase_time:.1f}s (+{phase_time - previous_time:.1f}s)")
+            previous_time = phase_time
+        return ", ".join(parts)
+
+    def history(self) -> list:
+        """
+        :return: Previous boots, list of dictionaries with time, command and phases.
+        """
+        try:
+            with open(self.history_file, "r") as file:
+                return [json.loads(line) for line in file if line.strip()]
+        except (OSError, ValueError):
+            return []
+
+    def finish(self, command_description: str) -> str:
+        """
+        Appends boot to history and compares its total time with median of previous boots.
+        :param command_description: How server was started.
+        :return: Warning about slow boot or empty string.
+        """
+        history = self.history()[-BOOT_HISTORY_LENGTH + 1:]
+        boot = {"time": datetime.now().isoformat(timespec="seconds"), "command": command_description,
+                "phases": self.phases}
+        with open(self.history_file, "w") as file:
+            for entry in history + [boot]:
+                file.write(json.dumps(entry) + "\n")
+        total_time = self.phases.get(BOOT_DONE_PHASE)
+        previous_times = [entry["phases"][BOOT_DONE_PHASE] for entry in history
+                          if BOOT_DONE_PHASE in entry.get("phases", {})]
+        if total_time is None or not previous_times:
+            return ""
+        median_time = statistics.median(previous_times)
+        if total_time > median_time * BOOT_REGRESSION_FACTOR:
+            return f"Server boot took {total_time:.1f}s ({command_description}), median of previous " \
+                   f"{len(previous_times)} boots is {median_time:.1f}s."
+        return ""
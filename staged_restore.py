@@ -0,0 +1,150 @@
+import os
+import shutil
+import zipfile
+import zlib
+
+from constants import *
+
+
+class StagedRestore:
+    def __init__(self, known_crc=None, live_dir: str = SERVER_DIR, staging_dir: str = RESTORE_STAGING_DIR,
+                 entries: list = DIRECTORIES_TO_ZIP):
+        """
+        Builds restored save in staging directory next to the live one and swaps them with renames at the end, so
+        failed download or extraction never touches the live world. Files whose content already matches the live
+        world are hard linked instead of extracted.
+        :param known_crc: Function (archive name, path) -> crc32 or None, gives checksums of live files without reading.
+        :param live_dir: Directory with live save.
+        :param staging_dir: Directory where new save is built, must be on the same drive as live_dir.
+        :param entries: Live directories and files which are replaced by restore.
+        """
+        self.known_crc = known_crc
+        self.live_dir = live_dir
+        self.staging_dir = staging_dir
+        self.previous_dir = f"{staging_dir}_previous"
+        self.entries = entries
+        # Statistics
+        self.linked = 0
+        self.extracted = 0
+
+    def prepare(self) -> None:
+        """
+        Removes leftovers of interrupted restore and creates empty staging directory.
+        :return:
+        """
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        shutil.rmtree(self.previous_dir, ignore_errors=True)
+        os.makedirs(self.staging_dir)
+
+    def discard(self) -> None:
+        """
+        Removes staging directory after failed restore, live save stays untouched.
+        :return:
+        """
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    @staticmethod
+    def member_path(member: zipfile.ZipInfo) -> str:
+        """
+        Gives relative path of member, names which would land outside of directory are rejected like by zip extract.
+        :param member: Zip member.
+        :return: Relative path with separators of system.
+        """
+        parts = member.filename.replace("\\", "/").split("/")
+        if member.filename.startswith(("/", "\\")) or ":" in parts[0] or ".." in parts:
+            raise zipfile.BadZipFile(f"Unsafe name of archive member: {member.filename}")
+        return os.path.join(*[part for part in parts if part not in ("", ".")] or ["."])
+
+    def live_crc(self, member: zipfile.ZipInfo, live_path: str):
+        """
+        Gives crc32 of live file, from manifest if possible, otherwise by reading it.
+        :param member: Zip member with the same name.
+        :param live_path: Path to live file.
+        :return: Crc32.
+        """
+        crc = self.known_crc(member.filename, live_path) if self.known_crc else None
+        if crc is not None:
+            return crc
+        crc = 0
+        with open(live_path, "rb") as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+        return crc
+
+    def link_live_file(self, member: zipfile.ZipInfo, staged_path: str) -> bool:
+        """
+        Hard links live file into staging directory if its content equals the member.
+        :param member: Zip member.
+        :param staged_path: Target path in staging directory.
+        :return: True if file was linked.
+        """
+        live_path = os.path.join(self.live_dir, self.member_path(member))
+        if not os.path.isfile(live_path) or os.path.getsize(live_path) != member.file_size:
+            return False
+        if self.live_crc(member, live_path) != member.CRC:
+            return False
+        try:
+            os.link(live_path, staged_path)
+        except OSError:
+            return False
+        return True
+
+    def extract_member(self, zip_ref: zipfile.ZipFile, member: zipfile.ZipInfo) -> None:
+        """
+        Puts member into staging directory, by hard link when possible.
+        :param zip_ref: Opened zip file.
+        :param member: Zip member.
+        :return:
+        """
+        staged_path = os.path.join(self.staging_dir, self.member_path(member))
+        if member.is_dir():
+            os.makedirs(staged_path, exist_ok=True)
+            return
+        # Staged file can be a hard link to live file, it must not be overwritten in place
+        if os.path.lexists(staged_path):
+            os.remove(staged_path)
+        os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+        if self.link_live_file(member, staged_path):
+            self.linked += 1
+        else:
+            zip_ref.extract(member, self.staging_dir)
+            self.extracted += 1
+
+    def extract_archive(self, zip_file: str, skip_members=()) -> None:
+        """
+        Extracts whole archive into staging directory.
+        :param zip_file: Path to archive.
+        :param skip_members: Names of members which should not be extracted.
+        :return:
+        """
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            for member in zip_ref.infolist():
+                if member.filename not in skip_members:
+                    self.extract_member(zip_ref, member)
+
+    def swap(self) -> None:
+        """
+        Moves live entries aside and staged ones in their place with renames. If any rename fails, already moved
+        entries are moved back, so live save is either completely old or completely new.
+        :return:
+        """
+        os.makedirs(self.previous_dir)
+        names = {os.path.basename(entry) for entry in self.entries} | set(os.listdir(self.staging_dir))
+        moved = []
+        try:
+            for name in names:
+                live_path = os.path.join(self.live_dir, name)
+                previous_path = os.path.join(self.previous_dir, name)
+                staged_path = os.path.join(self.staging_dir, name)
+                if os.path.lexists(live_path):
+                    os.replace(live_path, previous_path)
+                    moved.append((live_path, previous_path))
+                if os.path.lexists(staged_path):
+                    os.replace(staged_path, live_path)
+                    moved.append((staged_path, live_path))
+        except OSError:
+            for source, target in reversed(moved):
+                os.replace(target, source)
+            raise
+        shutil.rmtree(self.previous_dir, ignore_errors=True)
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
@@ -0,0 +1,121 @@
+import codecs
+
+from constants import *
+
+
+class LineSplitter:
+    def __init__(self, max_line_length: int = STREAM_LINE_LIMIT, encoding: str = "utf-8"):
+        """
+        Splits output of process into lines. Data is decoded incrementally, so characters split between reads are
+        decoded properly, and one trailing carriage return is removed, so both LF and CRLF endings work. Line longer
+        than max_line_length is truncated and the rest of it is dropped as it comes, so memory stays bounded even
+        for output without newlines.
+        :param max_line_length: Maximal number of characters of line.
+        :param encoding: Encoding of output, invalid bytes are replaced.
+        """
+        self.max_line_length = max_line_length
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        # Pieces of not finished line
+        self.pieces = []
+        self.length = 0
+        self.dropped = 0
+        # Dropped part ends with carriage return, which is part of CRLF ending if line ends after it
+        self.dropped_cr = False
+
+    def feed(self, data) -> list:
+        """
+        :param data: Next bytes of output.
+        :return: List of finished lines without endings.
+        """
+        pieces = self.decoder.decode(data).split("\n")
+        if len(pieces) == 1:
+            self.append(pieces[0])
+            return []
+        self.append(pieces[0])
+        lines = [self.take_line()]
+        # Lines inside of data are whole, only too long ones go through pieces
+        for piece in pieces[1:-1]:
+            if len(piece) > self.max_line_length:
+                self.append(piece)
+                lines.append(self.take_line())
+            else:
+                lines.append(piece[:-1] if piece.endswith("\r") else piece)
+        self.append(pieces[-1])
+        return lines
+
+    def finish(self) -> list:
+        """
+        :return: List with the last line if output did not end with newline.
+        """
+        self.append(self.decoder.decode(b"", final=True))
+        return [self.take_line()] if self.length or self.dropped else []
+
+    def append(self, piece: str) -> None:
+        """
+        Adds piece to not finished line, characters over limit are only counted.
+        :param piece: Decoded text without newline.
+        :return:
+        """
+        free = self.max_line_length - self.length
+        if len(piece) > free:
+            self.dropped += len(piece) - free
+            self.dropped_cr = piece.endswith("\r")
+            piece = piece[:free]
+        if piece:
+            self.pieces.append(piece)
+            self.length += len(piece)
+
+    def take_line(self) -> str:
+        """
+        :return: Finished line, truncated one ends with number of dropped characters.
+        """
+        line = self.pieces[0] if len(self.pieces) == 1 else "".join(self.pieces)
+        if self.dropped_cr:
+            # Carriage return of CRLF ending is not truncated text
+            self.dropped -= 1
+        elif not self.dropped and line.endswith("\r"):
+            line = line[:-1]
+        if self.dropped:
+            line = f"{line}... [{self.dropped} characters truncated]"
+        self.pieces = []
+        self.length = 0
+        self.dropped = 0
+        self.dropped_cr = False
+        return line
+
+
+def read_lines(stream, on_line, read_size: int = STREAM_READ_SIZE, max_line_length: int = STREAM_LINE_LIMIT) -> None:
+    """
+    Blocking variant for binary file objects, reads into one reusable buffer until end of stream.
+    :param stream: Binary stream, for example stdout of subprocess.Popen.
+    :param on_line: Function called with every line.
+    :param read_size: Size of one read.
+    :param max_line_length: Maximal number of characters of line.
+    :return:
+    """
+    splitter = LineSplitter(max_line_length)
+    buffer = bytearray(read_size)
+    view = memoryview(buffer)
+    while length := stream.readinto(buffer):
+        for line in splitter.feed(view[:length]):
+            on_line(line)
+    for line in splitter.finish():
+        on_line(line)
+
+
+async def read_lines_async(reader, on_line, read_size: int = STREAM_READ_SIZE,
+                           max_line_length: int = STREAM_LINE_LIMIT) -> None:
+    """
+    Asyncio variant, reads chunks of stream reader until end of stream.
+    :param reader: Asyncio stream reader.
+    :param on_line: Function called with every line.
+    :param read_size: Maximal size of one read.
+    :param max_line_length: Maximal number of characters of line.
+    :return:
+    """
+    splitter = LineSplitter(max_line_length)
+    while data := await reader.read(read_size):
+        for line in splitter.feed(data):
+            on_line(line)
+    for line in splitter.finish():
+        on_line(line)
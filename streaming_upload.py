@@ -0,0 +1,244 @@
+import io
+import json
+import threading
+import time
+
+from constants import *
+
+
+class UploadError(Exception):
+    pass
+
+
+class ChunkPipe:
+    def __init__(self, chunk_size: int = UPLOAD_CHUNK_SIZE, max_chunks: int = STREAM_PIPE_MAX_CHUNKS):
+        """
+        Bounded in-memory pipe between archive writer and uploader. Writer is blocked when pipe holds max_chunks of
+        data, so memory usage does not depend on archive size.
+        :param chunk_size: Size of chunk read by uploader.
+        :param max_chunks: Number of chunks which can be buffered.
+        """
+        self.max_bytes = chunk_size * max_chunks
+        self.buffer = bytearray()
+        self.condition = threading.Condition()
+        self.written = 0
+        self.closed = False
+        self.error = None
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self.written
+
+    def seek(self, *args):
+        raise io.UnsupportedOperation("ChunkPipe is not seekable.")
+
+    def flush(self) -> None:
+        pass
+
+    def write(self, data) -> int:
+        """
+        Puts data into pipe, waits while pipe is full.
+        :param data: Bytes like object.
+        :return: Number of written bytes.
+        """
+        with self.condition:
+            while len(self.buffer) >= self.max_bytes and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise UploadError(f"Pipe aborted: {self.error}")
+            self.buffer.extend(data)
+            self.written += len(data)
+            self.condition.notify_all()
+        return len(data)
+
+    def read(self, size: int) -> bytes:
+        """
+        Takes data from pipe, waits until size bytes are available or writer finished.
+        :param size: Number of bytes.
+        :return: Bytes, shorter than size only at the end of stream.
+        """
+        with self.condition:
+            while len(self.buffer) < size and not self.closed and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise UploadError(f"Pipe aborted: {self.error}")
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            self.condition.notify_all()
+        return data
+
+    def close(self) -> None:
+        """
+        Marks end of stream.
+        :return:
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def abort(self, error) -> None:
+        """
+        Wakes up both sides of pipe with error, used when writer or uploader fails.
+        :param error: Reason of abort.
+        :return:
+        """
+        with self.condition:
+            self.error = error
+            self.condition.notify_all()
+
+
+class ResumableUploader:
+    def __init__(self, session, upload_url: str = DRIVE_UPLOAD_URL, chunk_size: int = UPLOAD_CHUNK_SIZE,
+                 max_retries: int = UPLOAD_MAX_RETRIES, throttle=None):
+        """
+        Google Drive resumable upload protocol for streams of unknown size.
+        https://developers.google.com/drive/api/guides/manage-uploads#resumable
+        :param session: Authorized requests like session (google.auth.transport.requests.AuthorizedSession).
+        :param upload_url: Upload endpoint, can point to local fake endpoint.
+        :param chunk_size: Size of uploaded chunk, must be multiple of 256 KiB.
+        :param max_retries: Number of retries of one chunk.
+        :param throttle: JobThrottle limiting upload rate, None for no limit.
+        """
+        if chunk_size % (256 * 1024):
+            raise ValueError("Chunk size must be multiple of 256 KiB.")
+        self.session = session
+        self.upload_url = upload_url
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.throttle = throttle
+        self.session_uri = None
+        # Number of bytes persisted by server
+        self.confirmed = 0
+
+    def start(self, metadata: dict, mime_type: str = "application/zip") -> None:
+        """
+        Opens upload session.
+        :param metadata: Drive file metadata (name, parents).
+        :param mime_type: Mime type of uploaded content.
+        :return:
+        """
+        response = self.session.request("POST", f"{self.upload_url}?uploadType=resumable&fields=id",
+                                        data=json.dumps(metadata),
+                                        headers={"Content-Type": "application/json; charset=UTF-8",
+                                                 "X-Upload-Content-Type": mime_type})
+        if response.status_code != 200 or "Location" not in response.headers:
+            raise UploadError(f"Upload session not started, status: {response.status_code}.")
+        self.session_uri = response.headers["Location"]
+
+    def upload(self, pipe: ChunkPipe) -> dict:
+        """
+        Sends stream chunk by chunk. Data is kept from the last offset persisted by server, so bytes which server did
+        not persist are cut into the next chunks again and every chunk but the last one stays chunk_size long.
+        :param pipe: Source of data.
+        :return: Metadata of created file.
+        """
+        offset = 0
+        buffer = bytearray()
+        finished = False
+        stalls = 0
+        while True:
+            # One byte more than chunk is read to know which chunk is the last one
+            while not finished and len(buffer) <= self.chunk_size:
+                wanted = self.chunk_size + 1 - len(buffer)
+                data = pipe.read(wanted)
+                buffer += data
+                finished = len(data) < wanted
+            if finished and len(buffer) <= self.chunk_size:
+                chunk, total = bytes(buffer), offset + len(buffer)
+            else:
+                chunk, total = bytes(buffer[:self.chunk_size]), None
+            response = self.send_chunk(chunk, offset, total)
+            if response.status_code in (200, 201):
+                self.confirmed = offset + len(buffer)
+                return response.json()
+            confirmed = self.confirmed_bytes(response)
+            if confirmed < offset or confirmed > offset + len(chunk):
+                raise UploadError(f"Server persisted {confirmed} bytes, {offset} to {offset + len(chunk)} expected.")
+            stalls = stalls + 1 if confirmed == offset and chunk else 0
+            if stalls > self.max_retries:
+                raise UploadError(f"Server did not persist data after {self.max_retries} retries.")
+            del buffer[:confirmed - offset]
+            offset = self.confirmed = confirmed
+
+    @staticmethod
+    def confirmed_bytes(response) -> int:
+        """
+        Reads number of bytes persisted by server from 308 response.
+        :param response: Response of upload endpoint.
+        :return: Number of bytes.
+        """
+        received_range = response.headers.get("Range")
+        if not received_range:
+            return 0
+        return int(received_range.split("-")[-1]) + 1
+
+    def send_chunk(self, chunk: bytes, offset: int, total):
+        """
+        Sends chunk and retries server errors with exponential backoff, after failed request server is asked how many
+        bytes it persisted instead of sending chunk again.
+        :param chunk: Data, empty to ask only for persisted bytes.
+        :param offset: Offset of chunk in stream.
+        :param total: Size of whole stream if chunk is the last one, otherwise None.
+        :return: Response 200 or 201 when upload is complete, otherwise 308 with persisted range.
+        """
+        total_text = "*" if total is None else str(total)
+        retries = 0
+        query_status = False
+        while True:
+            if query_status or not chunk:
+                data, content_range = b"", f"bytes */{total_text}"
+            else:
+                data, content_range = chunk, f"bytes {offset}-{offset + len(chunk) - 1}/{total_text}"
+                if self.throttle:
+                    self.throttle.upload(len(data))
+            try:
+                response = self.session.request("PUT", self.session_uri, data=data,
+                                                headers={"Content-Range": content_range})
+            except OSError:
+                response = None
+            if response is not None:
+                if response.status_code in (200, 201, 308):
+                    return response
+                if response.status_code < 500 and response.status_code != 429:
+                    raise UploadError(f"Upload failed, status: {response.status_code}.")
+            retries += 1
+            if retries > self.max_retries:
+                raise UploadError(f"Upload failed after {self.max_retries} retries.")
+            time.sleep(min(2 ** retries, 32))
+            query_status = True
+
+
+def upload_while_writing(uploader: ResumableUploader, metadata: dict, write_archive) -> dict:
+    """
+    Runs archive writer in separate thread and uploads its output at the same time through bounded pipe.
+    :param uploader: Resumable uploader.
+    :param metadata: Drive file metadata.
+    :param write_archive: Function which takes writable file object and writes archive into it.
+    :return: Metadata of created file.
+    """
+    pipe = ChunkPipe(uploader.chunk_size)
+    uploader.start(metadata)
+
+    def produce():
+        try:
+            write_archive(pipe)
+        except BaseException as exception:
+            pipe.abort(exception)
+            return
+        pipe.close()
+
+    writer_thread = threading.Thread(target=produce, daemon=True)
+    writer_thread.start()
+    try:
+        result = uploader.upload(pipe)
+    except BaseException as exception:
+        pipe.abort(exception)
+        writer_thread.join()
+        raise
+    writer_thread.join()
+    return result
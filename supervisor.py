@@ -0,0 +1,117 @@
+import asyncio
+import subprocess
+import threading
+import time
+
+# Supervised processes
+SERVER = "server"
+TUNNEL = "tunnel"
+BOT = "bot"
+# Process states in order of lifecycle
+STARTING = "starting"
+READY = "ready"
+STOPPING = "stopping"
+STOPPED = "stopped"
+STATES_ORDER = {None: -1, STARTING: 0, READY: 1, STOPPING: 2, STOPPED: 3}
+
+
+class Supervisor:
+    def __init__(self):
+        """
+        Keeps lifecycle states of server, tunnel and bot processes. Waiting threads sleep on condition variable and
+        are woken up by state changes or timeout, instead of spinning.
+        """
+        self.condition = threading.Condition()
+        self.states = {}
+        self.reached = {}
+
+    def set_state(self, name: str, state: str) -> None:
+        """
+        Changes state of process and wakes up all waiting threads.
+        :param name: Name of process.
+        :param state: New state.
+        :return:
+        """
+        with self.condition:
+            self.states[name] = state
+            self.reached.setdefault(name, set()).add(state)
+            self.condition.notify_all()
+
+    def state(self, name: str):
+        """
+        :param name: Name of process.
+        :return: Current state of process or None if it was never started.
+        """
+        with self.condition:
+            return self.states.get(name)
+
+    def has_reached(self, name: str, state: str) -> bool:
+        """
+        :param name: Name of process.
+        :param state: State.
+        :return: True if process was in given state at any time.
+        """
+        with self.condition:
+            return state in self.reached.get(name, set())
+
+    def wait_for(self, name: str, state: str, timeout: float = None):
+        """
+        Waits until process reaches given state or any later one (for example stopped when waiting for ready).
+        :param name: Name of process.
+        :param state: Awaited state.
+        :param timeout: Timeout in seconds, None waits forever.
+        :return: Current state or None if timeout was exceeded.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while STATES_ORDER[self.states.get(name)] < STATES_ORDER[state]:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            return self.states[name]
+
+    async def wait_for_async(self, name: str, state: str, timeout: float = None):
+        """
+        Awaitable version of wait_for.
+        :param name: Name of process.
+        :param state: Awaited state.
+        :param timeout: Timeout in seconds, None waits forever.
+        :return: Current state or None if timeout was exceeded.
+        """
+        return await asyncio.to_thread(self.wait_for, name, state, timeout)
+
+    def stop_process(self, name: str, process, timeout: float) -> None:
+        """
+        Waits for process exit, terminates it when timeout is exceeded and kills it if it still runs.
+        :param name: Name of process.
+        :param process: Popen object.
+        :param timeout: Timeout in seconds for process exit and for termination.
+        :return:
+        """
+        if process is None:
+            return
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.terminate()
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.set_state(name, STOPPED)
+
+    def terminate_process(self, name: str, process, timeout: float) -> None:
+        """
+        Terminates process and waits for its exit with timeout.
+        :param name: Name of process.
+        :param process: Popen object.
+        :param timeout: Timeout in seconds.
+        :return:
+        """
+        if process is None:
+            return
+        self.set_state(name, STOPPING)
+        process.terminate()
+        self.stop_process(name, process, timeout)
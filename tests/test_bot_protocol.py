@@ -0,0 +1,88 @@
+import asyncio
+import io
+import unittest
+
+from bot_protocol import (ADMIN_MESSAGE, CHAT_MESSAGE, FRAME_HEADER, STATUS_MESSAGE, STOP_MESSAGE, encode_message,
+                          read_message, read_message_async)
+from constants import BOT_MAX_FRAME_SIZE
+
+
+class SlowStream(io.RawIOBase):
+    def __init__(self, data: bytes):
+        """
+        Stream giving at most one byte per read, like pipe with data arriving slowly.
+        :param data: Content of stream.
+        """
+        self.data = io.BytesIO(data)
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self.data.read(min(size, 1))
+
+
+def read_all_async(data: bytes) -> list:
+    """
+    :param data: Content of stream.
+    :return: Messages read by asyncio variant until end of stream.
+    """
+    async def read() -> list:
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        messages = []
+        while (message := await read_message_async(reader)) is not None:
+            messages.append(message)
+        return messages
+
+    return asyncio.run(read())
+
+
+class BotProtocolTest(unittest.TestCase):
+    def setUp(self):
+        self.frames = [encode_message(CHAT_MESSAGE, "Steve joined the server."),
+                       encode_message(STATUS_MESSAGE, "Zażółć\nnew line", address="1.2.3.4:25565", sequence=7),
+                       encode_message(ADMIN_MESSAGE, "admin exit"),
+                       encode_message(STOP_MESSAGE)]
+        self.messages = [{"type": CHAT_MESSAGE, "text": "Steve joined the server."},
+                         {"type": STATUS_MESSAGE, "text": "Zażółć\nnew line", "address": "1.2.3.4:25565",
+                          "sequence": 7},
+                         {"type": ADMIN_MESSAGE, "text": "admin exit"},
+                         {"type": STOP_MESSAGE, "text": ""}]
+
+    def test_frame_is_length_prefixed(self):
+        frame = self.frames[0]
+        (length,) = FRAME_HEADER.unpack(frame[:FRAME_HEADER.size])
+        self.assertEqual(length, len(frame) - FRAME_HEADER.size)
+
+    def test_round_trip(self):
+        for stream in (io.BytesIO(b"".join(self.frames)), SlowStream(b"".join(self.frames))):
+            messages = []
+            while (message := read_message(stream)) is not None:
+                messages.append(message)
+            self.assertEqual(messages, self.messages)
+
+    def test_async_round_trip(self):
+        self.assertEqual(read_all_async(b"".join(self.frames)), self.messages)
+
+    def test_incomplete_frame_ends_stream(self):
+        data = self.frames[0] + self.frames[1][:-3]
+        stream = io.BytesIO(data)
+        self.assertEqual(read_message(stream), self.messages[0])
+        self.assertIsNone(read_message(stream))
+        self.assertEqual(read_all_async(data), self.messages[:1])
+        self.assertIsNone(read_message(io.BytesIO(self.frames[0][:2])))
+
+    def test_frame_size_limit(self):
+        with self.assertRaises(ValueError):
+            encode_message(CHAT_MESSAGE, "x" * BOT_MAX_FRAME_SIZE)
+        oversized_header = FRAME_HEADER.pack(BOT_MAX_FRAME_SIZE + 1)
+        with self.assertRaises(ValueError):
+            read_message(io.BytesIO(oversized_header + b"{}"))
+        with self.assertRaises(ValueError):
+            read_all_async(oversized_header + b"{}")
+
+
+if __name__ == '__main__':
+    unittest.main()
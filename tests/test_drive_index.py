@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+from constants import INCREMENTAL_DELTA_PREFIX, SAVE_FILE_NAME, SAVE_FOLDER_NAME
+from drive_index import FOLDER_MIME_TYPE, DriveIndex
+from fake_drive import FakeDrive, FakeDriveService
+
+ZIP_MIME_TYPE = "application/zip"
+
+
+class DriveIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # Small pages, so listing and changes feed take several requests
+        self.drive = FakeDrive(os.path.join(self.directory.name, "drive"), max_page_size=2)
+        self.drive.start()
+        self.service = FakeDriveService(self.drive)
+        self.index_file = os.path.join(self.directory.name, "drive_index.json")
+        self.folder = self.add_folder()
+        self.base = self.drive.add_file(SAVE_FILE_NAME, b"base", [self.folder["id"]], ZIP_MIME_TYPE)
+        self.delta = self.drive.add_file(f"{INCREMENTAL_DELTA_PREFIX}0001.zip", b"delta", [self.folder["id"]],
+                                         ZIP_MIME_TYPE)
+        self.old_folder = self.add_folder()
+        self.old_save = self.drive.add_file(SAVE_FILE_NAME, b"old", [self.old_folder["id"]], ZIP_MIME_TYPE)
+        # Not save artifacts
+        self.drive.add_file("notes.txt", b"notes", [self.folder["id"]], "text/plain")
+        self.drive.add_file(SAVE_FOLDER_NAME, b"", mime_type="text/plain")
+        self.drive.add_file("photos", mime_type=FOLDER_MIME_TYPE)
+        self.drive.trash_file(self.drive.add_file(SAVE_FILE_NAME, b"trashed", mime_type=ZIP_MIME_TYPE)["id"])
+
+    def tearDown(self):
+        self.drive.stop()
+        self.directory.cleanup()
+
+    def add_folder(self) -> dict:
+        return self.drive.add_file(SAVE_FOLDER_NAME, mime_type=FOLDER_MIME_TYPE)
+
+    def sync(self, drive_index: DriveIndex = None) -> DriveIndex:
+        """
+        :param drive_index: Index to sync, new index loaded from file if None.
+        :return: Synchronized index.
+        """
+        if drive_index is None:
+            drive_index = DriveIndex(self.index_file)
+            drive_index.load()
+        self.applied = drive_index.sync(self.service)
+        return drive_index
+
+    def assert_indexed(self, drive_index: DriveIndex, files: list) -> None:
+        self.assertEqual(sorted(drive_index.files), sorted(file["id"] for file in files))
+        for file in files:
+            self.assertEqual(drive_index.files[file["id"]]["name"], file["name"])
+
+    def test_first_sync_lists_save_artifacts(self):
+        drive_index = self.sync()
+        self.assertEqual(self.applied, -1)
+        self.assert_indexed(drive_index, [self.folder, self.base, self.delta, self.old_folder, self.old_save])
+        self.assertEqual(drive_index.files[self.base["id"]]["parents"], [self.folder["id"]])
+        self.assertEqual(drive_index.page_token, str(len(self.drive.changes)))
+
+    def test_sync_without_changes(self):
+        self.sync()
+        drive_index = self.sync()
+        self.assertEqual(self.applied, 0)
+        self.assert_indexed(drive_index, [self.folder, self.base, self.delta, self.old_folder, self.old_save])
+
+    def test_changes_are_applied(self):
+        self.sync()
+        new_delta = self.drive.add_file(f"{INCREMENTAL_DELTA_PREFIX}0002.zip", b"delta 2", [self.folder["id"]],
+                                        ZIP_MIME_TYPE)
+        self.drive.add_file("other.zip", b"other", mime_type=ZIP_MIME_TYPE)
+        self.drive.delete_file(self.old_save["id"])
+        self.drive.delete_file(self.old_folder["id"])
+        self.drive.trash_file(self.delta["id"])
+        # Index is loaded from file written by the previous run
+        drive_index = self.sync()
+        self.assertEqual(self.applied, 5)
+        self.assert_indexed(drive_index, [self.folder, self.base, new_delta])
+        self.assertEqual(drive_index.page_token, str(len(self.drive.changes)))
+
+    def test_rebuild_when_page_token_is_invalid(self):
+        drive_index = self.sync()
+        new_folder = self.add_folder()
+        self.drive.delete_file(self.delta["id"])
+        self.drive.expire_page_tokens()
+        drive_index = self.sync(drive_index)
+        self.assertEqual(self.applied, -1)
+        self.assert_indexed(drive_index, [self.folder, self.base, self.old_folder, self.old_save, new_folder])
+        # Fresh token is valid again
+        self.sync(drive_index)
+        self.assertEqual(self.applied, 0)
+
+    def test_damaged_index_file_is_rebuilt(self):
+        self.sync()
+        with open(self.index_file, "w") as file:
+            file.write("{broken")
+        drive_index = self.sync()
+        self.assertEqual(self.applied, -1)
+        self.assert_indexed(drive_index, [self.folder, self.base, self.delta, self.old_folder, self.old_save])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from constants import BACKUP_METADATA_NAME, SAVE_FILE_NAME
+from incremental_backup import IncrementalBackup
+from staged_restore import StagedRestore
+
+
+def write_file(path: str, content: bytes, mtime_s: int = None) -> None:
+    """
+    :param path: Path to file.
+    :param content: Content of file.
+    :param mtime_s: Modification time, current time if None.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(content)
+    if mtime_s is not None:
+        os.utime(path, (mtime_s, mtime_s))
+
+
+def read_files(directory: str) -> dict:
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as file:
+                files[os.path.relpath(path, directory).replace(os.sep, "/")] = file.read()
+    return files
+
+
+class IncrementalBackupTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server_dir = os.path.join(self.directory.name, "server")
+        self.entries = [os.path.join(self.server_dir, "world"), os.path.join(self.server_dir, "server.properties")]
+        self.files = {
+            "world/level.dat": b"level 1",
+            "world/region/r.0.0.mca": os.urandom(5000),
+            "world/region/r.1.0.mca": os.urandom(3000),
+            "world/data/raids.dat": b"raids",
+            "server.properties": b"motd=test",
+        }
+        for arc_name, content in self.files.items():
+            write_file(os.path.join(self.server_dir, arc_name), content, 1_700_000_000)
+        self.backup = IncrementalBackup(self.entries, os.path.join(self.directory.name, "backup_manifest.json"))
+        self.archives = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, arc_name: str) -> str:
+        return os.path.join(self.server_dir, arc_name)
+
+    def world(self) -> dict:
+        return {arc_name: content for arc_name, content in read_files(self.server_dir).items()
+                if arc_name.startswith("world/") or arc_name == "server.properties"}
+
+    def save(self, folder_id: str = "folder") -> dict:
+        """
+        Writes next snapshot like upload does and commits it.
+        :param folder_id: Drive folder of chain.
+        :return: Snapshot info.
+        """
+        snapshot = self.backup.prepare_snapshot()
+        if snapshot is None:
+            return None
+        archive = os.path.join(self.directory.name, f"{len(self.archives)}_{snapshot['file_name']}")
+        self.backup.write_snapshot(archive)
+        self.backup.commit(folder_id)
+        if snapshot["kind"] == "base":
+            self.archives = []
+        self.archives.append(archive)
+        return snapshot
+
+    def restore(self) -> dict:
+        """
+        Restores chain of saved archives into server directory like restore of main app.
+        :return: Metadata of the last archive.
+        """
+        staged_restore = StagedRestore(self.backup.known_crc, self.server_dir,
+                                       os.path.join(self.directory.name, "staging"), self.entries)
+        staged_restore.prepare()
+        metadata = None
+        for archive in self.archives:
+            staged_restore.extract_archive(archive, [BACKUP_METADATA_NAME])
+            metadata = self.backup.apply_archive(archive, staged_restore.staging_dir, extract=False)
+        staged_restore.swap()
+        self.backup.reset_manifest(metadata, "folder")
+        return metadata
+
+    def modify(self) -> dict:
+        """
+        Modifies, adds and deletes files of world.
+        :return: Expected content of world.
+        """
+        expected = dict(self.files)
+        expected["world/level.dat"] = b"level 2"
+        expected["world/region/r.0.0.mca"] = os.urandom(7000)
+        expected["world/region/r.2.0.mca"] = b"new region"
+        del expected["world/data/raids.dat"]
+        for arc_name in ("world/level.dat", "world/region/r.0.0.mca", "world/region/r.2.0.mca"):
+            write_file(self.path(arc_name), expected[arc_name], 1_700_000_100)
+        os.remove(self.path("world/data/raids.dat"))
+        return expected
+
+    def test_base_and_delta_are_restored(self):
+        self.assertEqual(self.save()["kind"], "base")
+        self.assertIsNone(self.save())
+        expected = self.modify()
+        snapshot = self.save()
+        self.assertEqual((snapshot["kind"], snapshot["sequence"], snapshot["changed"], snapshot["removed"]),
+                         ("delta", 1, 3, 1))
+        with zipfile.ZipFile(self.archives[-1]) as zip_ref:
+            self.assertEqual(sorted(zip_ref.namelist()), sorted(["world/level.dat", "world/region/r.0.0.mca",
+                                                                 "world/region/r.2.0.mca", BACKUP_METADATA_NAME]))
+        # Restore on new machine without world
+        for entry in self.entries:
+            shutil.rmtree(entry) if os.path.isdir(entry) else os.remove(entry)
+        metadata = self.restore()
+        self.assertEqual(metadata["kind"], "delta")
+        self.assertEqual(self.world(), expected)
+        # Restored world is the same as the saved one
+        self.assertIsNone(self.save())
+
+    def test_restore_over_changed_world(self):
+        self.save()
+        expected = self.modify()
+        self.save()
+        write_file(self.path("world/level.dat"), b"level 3")
+        write_file(self.path("world/region/r.9.0.mca"), b"unsaved region")
+        self.restore()
+        self.assertEqual(self.world(), expected)
+
+    def test_plain_extraction_of_chain(self):
+        self.save()
+        expected = self.modify()
+        self.save()
+        destination = os.path.join(self.directory.name, "extracted")
+        for archive in self.archives:
+            self.backup.apply_archive(archive, destination)
+        self.assertEqual(read_files(destination), expected)
+
+    def test_chain_limit_starts_new_base(self):
+        with mock.patch("incremental_backup.INCREMENTAL_MAX_CHAIN_LENGTH", 2):
+            kinds = []
+            for index in range(4):
+                write_file(self.path("world/level.dat"), f"level {index}".encode(), 1_700_000_000 + index)
+                kinds.append((self.save(f"folder {index}")["kind"], self.backup.manifest["sequence"]))
+            self.assertEqual(kinds, [("base", 0), ("delta", 1), ("delta", 2), ("base", 0)])
+            self.assertEqual(self.backup.manifest["folder_id"], "folder 3")
+            self.assertEqual(os.path.basename(self.archives[0]), f"3_{SAVE_FILE_NAME}")
+            self.assertEqual(len(self.archives), 1)
+
+    def test_same_size_modification_is_detected(self):
+        self.save()
+        # Same size, newer modification time
+        write_file(self.path("world/level.dat"), b"level 9", 1_700_000_001)
+        snapshot = self.save()
+        self.assertEqual((snapshot["changed"], snapshot["removed"]), (1, 0))
+
+    def test_manifest_after_restore_reuses_only_matching_hashes(self):
+        self.save()
+        self.modify()
+        self.save()
+        with mock.patch.object(IncrementalBackup, "hash_file", wraps=IncrementalBackup.hash_file) as hash_file:
+            self.restore()
+        # Restored files got their saved modification times, nothing is hashed again
+        self.assertEqual(hash_file.call_count, 0)
+        # Files changed after restore, before manifest was reset
+        write_file(self.path("world/level.dat"), b"level X", 1_700_000_555)
+        write_file(self.path("world/region/r.3.0.mca"), b"unsaved region")
+        os.remove(self.path("server.properties"))
+        self.backup.reset_manifest(self.read_last_metadata(), "folder")
+        # Manifest describes drive copy, not the changed file
+        self.assertEqual(self.backup.manifest["files"]["world/level.dat"][2], hashlib.sha1(b"level 2").hexdigest())
+        snapshot = self.save()
+        self.assertEqual((snapshot["kind"], snapshot["changed"], snapshot["removed"]), ("delta", 2, 1))
+        self.assertEqual(self.backup.manifest["files"]["world/level.dat"][2], hashlib.sha1(b"level X").hexdigest())
+
+    def read_last_metadata(self) -> dict:
+        with zipfile.ZipFile(self.archives[-1]) as zip_ref:
+            return IncrementalBackup.read_metadata(zip_ref)
+
+
+if __name__ == '__main__':
+    unittest.main()
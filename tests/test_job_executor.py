@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from job_executor import JobExecutor, JobThrottle, TokenBucket, set_io_priority
+
+
+class FakeClock:
+    def __init__(self):
+        """
+        Monotonic clock which moves only when consumer of bucket sleeps.
+        """
+        self.now = 1000.0
+        self.waits = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def wait(self, timeout: float) -> bool:
+        self.waits.append(round(timeout, 6))
+        self.now += timeout
+        return False
+
+
+class TokenBucketTest(unittest.TestCase):
+    def bucket(self, rate: float, capacity: float = None) -> tuple:
+        clock = FakeClock()
+        with mock.patch("job_executor.time.monotonic", clock.monotonic):
+            bucket = TokenBucket(rate, capacity)
+        bucket.lifted.wait = clock.wait
+        return bucket, clock
+
+    def consume(self, bucket: TokenBucket, clock: FakeClock, *amounts: int) -> None:
+        with mock.patch("job_executor.time.monotonic", clock.monotonic):
+            for amount in amounts:
+                bucket.consume(amount)
+
+    def test_burst_passes_without_waiting(self):
+        bucket, clock = self.bucket(1000, capacity=3000)
+        self.consume(bucket, clock, 1000, 1000, 1000)
+        self.assertEqual(clock.waits, [])
+        # Bucket is empty, next bytes wait for rate
+        self.consume(bucket, clock, 500)
+        self.assertEqual(clock.waits, [0.5])
+
+    def test_rate_is_kept_over_time(self):
+        bucket, clock = self.bucket(1000)
+        start = clock.now
+        self.consume(bucket, clock, *[250] * 40)
+        # Capacity of one second passed at once, the rest took its time
+        self.assertAlmostEqual(clock.now - start, 9)
+        self.assertTrue(all(wait == 0.25 for wait in clock.waits))
+
+    def test_amount_above_capacity_goes_into_debt(self):
+        bucket, clock = self.bucket(1000)
+        self.consume(bucket, clock, 3500)
+        self.assertEqual(clock.waits, [2.5])
+        # Idle time refills bucket only up to capacity
+        clock.now += 60
+        self.consume(bucket, clock, 1000, 1000)
+        self.assertEqual(clock.waits, [2.5, 1.0])
+
+    def test_no_limit(self):
+        bucket, clock = self.bucket(None)
+        self.consume(bucket, clock, 10 ** 12)
+        self.assertEqual(clock.waits, [])
+
+    def test_lift_wakes_waiting_consumer(self):
+        bucket = TokenBucket(1000)
+        bucket.consume(1000)
+        consumer = threading.Thread(target=bucket.consume, args=(60_000,))
+        start_time = time.monotonic()
+        consumer.start()
+        time.sleep(0.1)
+        bucket.lift()
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+        self.assertLess(time.monotonic() - start_time, 5)
+        bucket.consume(10 ** 12)
+
+
+class JobThrottleTest(unittest.TestCase):
+    def start_reader(self, throttle: JobThrottle) -> tuple:
+        """
+        :param throttle: Throttle.
+        :return: Thread reading through throttle and event set when read passed.
+        """
+        done = threading.Event()
+
+        def read():
+            throttle.read(1)
+            done.set()
+
+        thread = threading.Thread(target=read, daemon=True)
+        thread.start()
+        return thread, done
+
+    def test_pause_blocks_until_resume(self):
+        throttle = JobThrottle(None, None, None)
+        throttle.pause(60)
+        self.assertTrue(throttle.paused)
+        thread, done = self.start_reader(throttle)
+        self.assertFalse(done.wait(0.2))
+        throttle.resume()
+        self.assertTrue(done.wait(5))
+        self.assertFalse(throttle.paused)
+        thread.join(5)
+
+    def test_pause_ends_by_itself(self):
+        throttle = JobThrottle(None, None, None)
+        throttle.pause(0.2)
+        # Shorter pause does not shorten the running one
+        throttle.pause(0.01)
+        start_time = time.monotonic()
+        thread, done = self.start_reader(throttle)
+        self.assertTrue(done.wait(5))
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.15)
+        thread.join(5)
+
+    def test_lift_ends_pause_for_good(self):
+        throttle = JobThrottle(1, 1, 1)
+        throttle.pause(60)
+        thread, done = self.start_reader(throttle)
+        self.assertFalse(done.wait(0.2))
+        throttle.lift()
+        self.assertTrue(done.wait(5))
+        throttle.pause(60)
+        self.assertFalse(throttle.paused)
+        # Caps are gone too
+        throttle.upload(10 ** 9)
+        thread.join(5)
+
+
+class JobExecutorTest(unittest.TestCase):
+    def test_jobs_run_in_order_on_one_thread(self):
+        executor = JobExecutor(JobThrottle(None, None, None))
+        threads = []
+        futures = [executor.submit(lambda index: threads.append((index, threading.get_ident())) or index, index)
+                   for index in range(3)]
+        self.assertEqual([future.result(5) for future in futures], [0, 1, 2])
+        executor.shutdown()
+        self.assertEqual([index for index, _ in threads], [0, 1, 2])
+        self.assertEqual(len({thread for _, thread in threads}), 1)
+        self.assertNotEqual(threads[0][1], threading.get_ident())
+
+    @unittest.skipUnless(hasattr(os, "getpriority"), "nice values are not supported")
+    def test_job_thread_has_lower_priority(self):
+        niceness = min(os.getpriority(os.PRIO_PROCESS, 0) + 5, 19)
+        executor = JobExecutor(JobThrottle(None, None, None), niceness=niceness)
+        future = executor.submit(lambda: os.getpriority(os.PRIO_PROCESS, threading.get_native_id()))
+        self.assertEqual(future.result(5), niceness)
+        executor.shutdown()
+        # Caller's priority is not changed
+        self.assertLess(os.getpriority(os.PRIO_PROCESS, 0), niceness)
+
+    def test_unknown_machine_has_no_io_priority(self):
+        with mock.patch("job_executor.platform.machine", return_value="sparc"):
+            self.assertFalse(set_io_priority(0, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
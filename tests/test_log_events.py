@@ -0,0 +1,102 @@
+import re
+import unittest
+
+from log_events import LogEventMatcher, required_literal, server_log_matcher
+
+# Lines of modded server which match no event
+NOISE_LINES = [f"[12:00:00] [Server thread/WARN] [minecraft/ServerGamePacketListenerImpl]: Player{n} moved wrongly!"
+               for n in range(100)] + \
+              [f"[12:00:00] [Worker-Main-{n % 8}/INFO] [create/]: Loaded contraption {n} at chunk [{n * 16}, {n * 7}]"
+               for n in range(100)]
+SERVER_LINES = [
+    '[12:00:00] [Server thread/INFO] [minecraft/DedicatedServer]: Done (12.345s)! For help, type "help"',
+    "[12:00:00] [Server thread/INFO] [minecraft/ChunkMap]: ThreadedAnvilChunkStorage: All dimensions are saved",
+    "[12:00:00] [Server thread/INFO] [minecraft/MinecraftServer]: Steve joined the game",
+    "[12:00:00] [Server thread/INFO] [minecraft/MinecraftServer]: Alex_123 left the game",
+    "[12:00:00] [Server thread/INFO] [minecraft/MinecraftServer]: Al left the game",
+    "[12:00:00] [Server thread/INFO] [forge/ForgeCommand]: Overall : Mean tick time: 12.5 ms. Mean TPS: 20.0",
+    "[12:00:00] [Server thread/WARN] [minecraft/MinecraftServer]: Can't keep up! Is the server overloaded? "
+    "Running 2500ms or 50 ticks behind",
+    "[12:00:00] [Server thread/ERROR] [minecraft/MinecraftServer]: This crash report has been saved to: crash.txt",
+    "[12:00:00] [Server thread/INFO] [minecraft/MinecraftServer]: Saved the game",
+    "[12:00:00] [main/INFO] [cpw.mods.modlauncher.Launcher/MODLAUNCHER]: ModLauncher running: args []",
+    "[12:00:00] [Server thread/INFO] [minecraft/DedicatedServer]: Starting minecraft server version 1.20.1",
+    '[12:00:00] [Server thread/INFO] [minecraft/MinecraftServer]: Preparing level "world"',
+    "",
+] + NOISE_LINES
+# Patterns with quantifiers in braces, classes, escapes and alternation, with lines which match them or nearly
+EDGE_CASES = {
+    r"ab{2,3}cd": ["abbcd", "abbbcd", "abcd", "ab{2,3}cd"],
+    r"x{10}": ["x" * 10, "x" * 9, "10"],
+    r"x{0,1}yz": ["yz", "xyz", "x{0,1}yz"],
+    r"a{,2}bcd": ["bcd", "aabcd", "a{,2}bcd"],
+    r"a{b}c": ["a{b}c", "abc"],
+    r"a{}c": ["a{}c", "ac"],
+    r"\{\d+\}done": ["{12}done", "12done"],
+    r"[{}]ab|cd": ["{ab", "cd", "ab"],
+    r"[]x]yz": ["]yz", "xyz", "yz"],
+    r"[^]]qq": ["aqq", "]qq"],
+    r"(foo|bar)baz": ["foobaz", "barbaz", "baz"],
+    r"\x41BC": ["ABC", "x41BC", "BC"],
+    r"(a)\1zz": ["aazz", "1zz", "azz"],
+    r"\N{DIGIT ONE}qq": ["1qq", "qq"],
+    r"colou?r": ["color", "colour", "colo"],
+    r"(?i)done": ["DONE", "done"],
+    r"ends\.$": ["line ends.", "ends.!"],
+}
+
+
+class RequiredLiteralTest(unittest.TestCase):
+    def test_quantifier_braces_are_not_literal(self):
+        self.assertEqual(required_literal(r"ab{2,3}cd"), "cd")
+        self.assertEqual(required_literal(r"x{10}"), "")
+        self.assertEqual(required_literal(r"x{0,1}yz"), "yz")
+
+    def test_other_braces_are_literal(self):
+        self.assertEqual(required_literal(r"a{b}c"), "a{b}c")
+
+    def test_top_level_alternation_has_no_literal(self):
+        self.assertEqual(required_literal(r"[{}]ab|cd"), "")
+
+    def test_literal_is_in_every_match(self):
+        for pattern, lines in EDGE_CASES.items():
+            literal = required_literal(pattern)
+            for line in lines:
+                if re.search(pattern, line):
+                    self.assertIn(literal, line, pattern)
+
+
+class LogEventMatcherTest(unittest.TestCase):
+    def assert_same_as_search(self, matcher: LogEventMatcher, lines: list):
+        for line in lines:
+            expected = next(((event, pattern.search(line)) for event, pattern in matcher.patterns.items()
+                             if pattern.search(line)), None)
+            matched = matcher.match(line)
+            if expected is None:
+                self.assertIsNone(matched, line)
+            else:
+                self.assertIsNotNone(matched, line)
+                self.assertEqual(matched[0], expected[0], line)
+                self.assertEqual(matched[1].span(), expected[1].span(), line)
+                self.assertEqual(matched[1].groups(), expected[1].groups(), line)
+
+    def test_server_patterns(self):
+        matcher = server_log_matcher()
+        self.assert_same_as_search(matcher, SERVER_LINES)
+        self.assertEqual(len({matcher.match(line)[0] for line in SERVER_LINES if matcher.match(line)}),
+                         len(matcher.patterns))
+
+    def test_edge_case_patterns(self):
+        for pattern, lines in EDGE_CASES.items():
+            self.assert_same_as_search(LogEventMatcher({"event": pattern}), lines)
+
+    def test_bounded_quantifier_is_dispatched(self):
+        matcher = LogEventMatcher({"event": r"ab{2,3}cd"})
+        matches = []
+        matcher.subscribe("event", matches.append)
+        self.assertEqual(matcher.dispatch("abbcd"), "event")
+        self.assertEqual(matches[0][0], "abbcd")
+
+
+if __name__ == '__main__':
+    unittest.main()
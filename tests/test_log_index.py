@@ -0,0 +1,125 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from log_index import LogIndex, parse_query, parse_time
+from log_pipeline import CONTROL_SOURCE, SERVER_SOURCE
+
+JOIN_LINE = "[12:00:00] [Server thread/INFO] [minecraft/MinecraftServer]: Steve joined the game"
+
+
+def json_line(record_time: str, source: str, message: str) -> str:
+    return json.dumps({"time": record_time, "source": source, "level": "INFO", "message": message}) + "\n"
+
+
+class ParseQueryTest(unittest.TestCase):
+    def test_conditions_and_text(self):
+        self.assertEqual(parse_query("event=player_joined source=server limit=5 Steve joined"),
+                         {"event": "player_joined", "source": "server", "limit": 5, "text": "Steve joined"})
+        # Unknown keys are searched as text
+        self.assertEqual(parse_query("level=ERROR"), {"text": "level=ERROR"})
+        self.assertEqual(parse_query(""), {})
+
+    def test_times(self):
+        now = datetime(2024, 5, 10, 12, 0)
+        self.assertEqual(parse_time("7d", now), "2024-05-03T12:00:00.000")
+        self.assertEqual(parse_time("12h", now), "2024-05-10T00:00:00.000")
+        self.assertEqual(parse_time("30m", now), "2024-05-10T11:30:00.000")
+        self.assertEqual(parse_query("since=2024-05-01 until=2024-05-02T10:00")["until"], "2024-05-02T10:00:00.000")
+
+    def test_wrong_values(self):
+        for query in ("limit=many", "since=yesterday"):
+            with self.assertRaises(ValueError, msg=query):
+                parse_query(query)
+
+
+class LogIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.logs_dir = os.path.join(self.directory.name, "logs")
+        os.makedirs(self.logs_dir)
+        self.index = LogIndex(os.path.join(self.directory.name, "index.sqlite"), batch_size=3, commit_period_s=60)
+
+    def tearDown(self):
+        self.index.close()
+        self.directory.cleanup()
+
+    def add_records(self) -> None:
+        self.index.add("2024-05-01T10:00:00.000", CONTROL_SOURCE, "Starting server subprocess.")
+        self.index.add("2024-05-01T10:00:05.000", SERVER_SOURCE, JOIN_LINE)
+        self.index.add("2024-05-02T10:00:00.000", SERVER_SOURCE, "[12:00:10] [Server thread/INFO]: <Steve> hello")
+        self.index.add("2024-05-03T10:00:00.000", CONTROL_SOURCE, "Saving to Google Drive.")
+
+    def test_search_by_conditions(self):
+        self.add_records()
+        self.assertEqual(self.index.search(event="player_joined"),
+                         [("2024-05-01T10:00:05.000", SERVER_SOURCE, "player_joined", JOIN_LINE)])
+        self.assertEqual([record[0] for record in self.index.search(source=CONTROL_SOURCE)],
+                         ["2024-05-03T10:00:00.000", "2024-05-01T10:00:00.000"])
+        self.assertEqual([record[0] for record in self.index.search(since="2024-05-01T12:00:00.000",
+                                                                    until="2024-05-02T23:00:00.000")],
+                         ["2024-05-02T10:00:00.000"])
+        # The newest first
+        self.assertEqual([record[0] for record in self.index.search(limit=2)],
+                         ["2024-05-03T10:00:00.000", "2024-05-02T10:00:00.000"])
+
+    def test_search_by_text(self):
+        self.add_records()
+        # Words are prefixes, special characters of full text syntax are plain text
+        self.assertEqual(len(self.index.search(text="Ste")), 2)
+        self.assertEqual(len(self.index.search(text="Steve join")), 1)
+        self.assertEqual(self.index.search(text='"<Steve>" OR'), [])
+        self.assertEqual(len(self.index.search(text="steve", source=SERVER_SOURCE, event="player_joined")), 1)
+
+    def test_query_text(self):
+        self.add_records()
+        lines = self.index.query_text("source=control").splitlines()
+        self.assertTrue(lines[0].startswith("Found 2 log records"))
+        # The oldest first
+        self.assertEqual(lines[1:], [f"[2024-05-01T10:00:00.000] [{CONTROL_SOURCE}]: Starting server subprocess.",
+                                     f"[2024-05-03T10:00:00.000] [{CONTROL_SOURCE}]: Saving to Google Drive."])
+        self.assertIn(f"[{SERVER_SOURCE}/player_joined]", self.index.query_text("event=player_joined"))
+        self.assertTrue(self.index.query_text("limit=x").startswith("Wrong log query"))
+
+    def test_backfill_of_archives(self):
+        # Record indexed live before file was rotated
+        self.index.add("2024-05-01T10:00:05.000", SERVER_SOURCE, JOIN_LINE)
+        with open(os.path.join(self.logs_dir, "old.jsonl"), "w") as file:
+            file.write(json_line("2024-04-01T10:00:00.000", CONTROL_SOURCE, "Old run"))
+            file.write("{broken line\n")
+        with gzip.open(os.path.join(self.logs_dir, "previous.jsonl.1.gz"), "wt") as file:
+            for second in range(5):
+                file.write(json_line(f"2024-05-01T10:00:0{second}.000", SERVER_SOURCE, f"line {second}"))
+            file.write(json_line("2024-05-01T10:00:05.000", SERVER_SOURCE, JOIN_LINE))
+        live_file = os.path.join(self.logs_dir, "live.jsonl")
+        with open(live_file, "w") as file:
+            file.write(json_line("2024-05-03T10:00:00.000", CONTROL_SOURCE, "Live run"))
+        self.assertEqual(self.index.backfill(self.logs_dir, live_file), 6)
+        self.assertEqual(len(self.index.search(text="Old run")), 1)
+        self.assertEqual(self.index.search(text="Live run"), [])
+        self.assertEqual(len(self.index.search(event="player_joined")), 1)
+        self.assertEqual(len(self.index.search(source=SERVER_SOURCE)), 6)
+        # Files are read once, also after rotation renamed them
+        os.rename(os.path.join(self.logs_dir, "previous.jsonl.1.gz"),
+                  os.path.join(self.logs_dir, "previous.jsonl.2.gz"))
+        self.assertEqual(self.index.backfill(self.logs_dir, live_file), 0)
+
+    def test_close_commits_pending_records(self):
+        database = os.path.join(self.directory.name, "closed.sqlite")
+        index = LogIndex(database, batch_size=100, commit_period_s=60)
+        index.add("2024-05-01T10:00:00.000", CONTROL_SOURCE, "Last record")
+        index.close()
+        index.close()
+        # Records logged during exit are dropped
+        index.add("2024-05-01T10:00:01.000", CONTROL_SOURCE, "Too late")
+        index.handler().flush()
+        index = LogIndex(database)
+        self.assertEqual([record[3] for record in index.search()], ["Last record"])
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
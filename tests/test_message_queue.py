@@ -0,0 +1,128 @@
+import asyncio
+import time
+import unittest
+
+from fake_discord import FakeChannel
+from message_queue import OutboundMessageQueue, RateLimitBucket
+
+# Tolerance of sleep wake-ups in timing assertions
+TIMING_SLACK_S = 0.02
+
+
+def run_queue(lines: dict, **queue_options) -> float:
+    """
+    Puts lines to queue at once and waits till they are sent.
+    :param lines: Channel -> lines put to it.
+    :param queue_options: Options of OutboundMessageQueue.
+    :return: Time of flush in seconds.
+    """
+    async def run() -> float:
+        outbound = OutboundMessageQueue(asyncio.get_running_loop(), **queue_options)
+        for channel, channel_lines in lines.items():
+            for line in channel_lines:
+                outbound.put(channel, line)
+        # Puts from other threads are scheduled with call_soon_threadsafe
+        await asyncio.sleep(0)
+        start_time = time.monotonic()
+        await outbound.flush()
+        return time.monotonic() - start_time
+
+    return asyncio.run(run())
+
+
+class PackTest(unittest.TestCase):
+    def setUp(self):
+        self.outbound = OutboundMessageQueue(None)
+
+    def test_messages_keep_limit_and_order(self):
+        lines = [f"line {index} " + "x" * (index * 37 % 300) for index in range(200)]
+        messages = self.outbound.pack(lines)
+        self.assertLess(len(messages), len(lines))
+        self.assertTrue(all(len(message) <= 2000 for message in messages))
+        self.assertEqual("\n".join(messages).split("\n"), lines)
+
+    def test_long_line_is_split(self):
+        line = "".join(str(index % 10) for index in range(4500))
+        messages = self.outbound.pack(["first", line, "last"])
+        self.assertEqual([len(message) for message in messages], [5, 2000, 2000, 500 + 1 + 4])
+        self.assertEqual("".join(messages[1:])[:-5], line)
+        self.assertEqual(messages[-1][-4:], "last")
+
+    def test_empty_lines_only(self):
+        self.assertEqual(self.outbound.pack([]), [])
+        self.assertEqual(self.outbound.pack(["", " "]), [])
+
+
+class RateLimitBucketTest(unittest.TestCase):
+    def test_sliding_window(self):
+        async def acquire_times() -> list:
+            bucket = RateLimitBucket(3, 0.2)
+            times = []
+            for _ in range(8):
+                await bucket.acquire()
+                times.append(time.monotonic())
+            return times
+
+        times = asyncio.run(acquire_times())
+        for first, fourth in zip(times, times[3:]):
+            self.assertGreaterEqual(fourth - first, 0.2 - TIMING_SLACK_S)
+        self.assertLess(times[2] - times[0], 0.05)
+
+
+class OutboundMessageQueueTest(unittest.TestCase):
+    def test_lines_are_coalesced_in_order(self):
+        channel = FakeChannel(1)
+        lines = [f"status line {index}" for index in range(500)]
+        run_queue({channel: lines}, flush_window_s=0.01)
+        self.assertLess(len(channel.messages), 10)
+        self.assertTrue(all(len(message) <= 2000 for message in channel.messages))
+        self.assertEqual("\n".join(channel.messages).split("\n"), lines)
+
+    def test_rate_limit_per_channel(self):
+        channels = [FakeChannel(1), FakeChannel(2, latency_ms=5)]
+        # Every line is full message, so nothing can be coalesced
+        lines = {channel: [f"{channel.id}-{index}".ljust(10, ".") for index in range(7)] for channel in channels}
+        flush_time = run_queue(lines, flush_window_s=0, max_length=10, rate_limit=2, rate_period_s=0.2)
+        for channel in channels:
+            self.assertEqual(channel.messages, lines[channel])
+            for first, third in zip(channel.send_times, channel.send_times[2:]):
+                self.assertGreaterEqual(third - first, 0.2 - TIMING_SLACK_S)
+        # Channels have separate buckets and are sent concurrently
+        self.assertLess(flush_time, 0.2 * 4)
+
+    def test_flush_drains_everything(self):
+        channel = FakeChannel(1, latency_ms=1)
+
+        async def put_and_flush() -> tuple:
+            outbound = OutboundMessageQueue(asyncio.get_running_loop(), flush_window_s=0.05)
+            for index in range(50):
+                outbound.put(channel, f"first {index}")
+            await asyncio.sleep(0.1)
+            # Lines put while previous batch is being sent
+            for index in range(50):
+                outbound.put(channel, f"second {index}")
+            await asyncio.sleep(0)
+            await outbound.flush()
+            return outbound.workers, outbound.pending[channel.id][1]
+
+        workers, waiting_lines = asyncio.run(put_and_flush())
+        self.assertEqual(workers, {})
+        self.assertEqual(waiting_lines, [])
+        self.assertEqual("\n".join(channel.messages).split("\n"),
+                         [f"first {index}" for index in range(50)] + [f"second {index}" for index in range(50)])
+
+    def test_failed_send_does_not_stop_channel(self):
+        class FailingChannel(FakeChannel):
+            async def send(self, content: str) -> None:
+                if not self.sent and content.startswith("fail"):
+                    self.sent.append((time.monotonic(), None))
+                    raise ConnectionError("discord unavailable")
+                await super().send(content)
+
+        channel = FailingChannel(1)
+        run_queue({channel: ["fail", "next"]}, flush_window_s=0, max_length=4)
+        self.assertEqual(channel.messages, [None, "next"])
+
+
+if __name__ == '__main__':
+    unittest.main()
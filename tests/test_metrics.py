@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import metrics
+from metrics import SERVER_PID_SEARCHES, MetricsRing, MetricsSampler, find_server_pid, prometheus_text
+
+
+class FakeProc:
+    def __init__(self, directory: str):
+        """
+        Directory with layout of /proc.
+        :param directory: Root of fake /proc.
+        """
+        self.directory = directory
+
+    def add(self, pid: int, name: str, parent_pid: int, cpu_ticks: int = 0, threads: int = 1, rss_pages: int = 0,
+            fds: int = 0) -> None:
+        # pid (comm) state ppid, then fields from pgrp on, utime and stime are 14th and 15th field of stat
+        fields = ["0"] * 48
+        fields[9], fields[10], fields[15], fields[19] = str(cpu_ticks), "0", str(threads), str(rss_pages)
+        os.makedirs(os.path.join(self.directory, str(pid), "fd"), exist_ok=True)
+        with open(os.path.join(self.directory, str(pid), "stat"), "w") as stat_file:
+            stat_file.write(f"{pid} ({name}) S {parent_pid} {' '.join(fields)}\n")
+        for fd in range(fds):
+            open(os.path.join(self.directory, str(pid), "fd", str(fd)), "w").close()
+
+
+class MetricsSamplerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.proc = FakeProc(self.directory.name)
+        patcher = mock.patch("metrics.PROC_DIR", self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.proc.add(1, "init", 0)
+        self.proc.add(50, "bash", 1)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def count_scans(self, sampler: MetricsSampler, samples: int) -> int:
+        """
+        :param sampler: Sampler.
+        :param samples: Number of samples to take.
+        :return: Number of listings of whole /proc.
+        """
+        with mock.patch("metrics.os.listdir", wraps=os.listdir) as listdir:
+            for _ in range(samples):
+                sampler.sample()
+        return sum(1 for call in listdir.call_args_list if call.args == (self.directory.name,))
+
+    def test_java_started_directly(self):
+        self.proc.add(100, "java", 50, threads=40, rss_pages=1000, fds=3)
+        self.assertEqual(find_server_pid(100), 100)
+        sampler = MetricsSampler()
+        sampler.attach(100)
+        self.assertEqual(self.count_scans(sampler, 10), 0)
+        sample = sampler.ring.latest()
+        self.assertEqual((sample.threads, sample.rss_bytes, sample.open_fds), (40, 1000 * metrics.PAGE_SIZE, 3))
+
+    def test_java_started_by_script(self):
+        self.proc.add(100, "sh", 50)
+        self.proc.add(101, "sh", 100)
+        self.proc.add(102, "java", 101, threads=30)
+        self.proc.add(103, "java", 50)
+        self.assertEqual(find_server_pid(100), 102)
+        sampler = MetricsSampler()
+        sampler.attach(100)
+        self.assertEqual(self.count_scans(sampler, 10), 1)
+        self.assertEqual(sampler.pid, 102)
+        self.assertEqual(sampler.ring.latest().threads, 30)
+
+    def test_search_for_java_is_limited(self):
+        self.proc.add(100, "python", 50, threads=2)
+        self.assertIsNone(find_server_pid(100))
+        sampler = MetricsSampler()
+        sampler.attach(100)
+        self.assertEqual(self.count_scans(sampler, SERVER_PID_SEARCHES + 10), SERVER_PID_SEARCHES)
+        # Started process is sampled instead
+        self.assertEqual(sampler.ring.latest().threads, 2)
+        # New server process is searched again
+        self.proc.add(200, "sh", 50)
+        self.proc.add(201, "java", 200)
+        sampler.attach(200)
+        self.assertEqual(self.count_scans(sampler, 3), 1)
+        self.assertEqual(sampler.pid, 201)
+
+    def test_cpu_percent_between_samples(self):
+        self.proc.add(100, "java", 50, cpu_ticks=100)
+        sampler = MetricsSampler()
+        sampler.attach(100)
+        with mock.patch("metrics.time.monotonic", side_effect=[10.0, 12.0]):
+            self.assertIsNone(sampler.sample().cpu_percent)
+            self.proc.add(100, "java", 50, cpu_ticks=100 + metrics.CLOCK_TICKS * 3)
+            self.assertAlmostEqual(sampler.sample().cpu_percent, 150)
+
+    def test_players_and_tick_timing(self):
+        sampler = MetricsSampler(MetricsRing(capacity=2))
+        sampler.player_joined("Steve")
+        sampler.player_joined("Alex")
+        sampler.player_left("Steve")
+        sampler.tick_timing(48.5, 19.5)
+        sample = sampler.sample()
+        self.assertEqual((sample.players, sample.tps, sample.mspt, sample.cpu_percent), (1, 19.5, 48.5, None))
+        for _ in range(3):
+            sampler.sample()
+        self.assertEqual(len(sampler.ring.samples()), 2)
+        text = prometheus_text(sample)
+        self.assertIn("minecraft_server_tps 19.5\n", text)
+        self.assertNotIn("minecraft_server_cpu_percent", text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from fake_drive import FakeDrive
+from parallel_download import DownloadError, ParallelDownloader, StreamingExtractor
+from staged_restore import StagedRestore
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FailingSession:
+    def __init__(self, session, failing_start: int, status_code: int = 403):
+        """
+        Session whose requests of one range fail.
+        :param session: Real session.
+        :param failing_start: First byte of failing range.
+        :param status_code: Status of failing response.
+        """
+        self.session = session
+        self.failing_range = f"bytes={failing_start}-"
+        self.status_code = status_code
+
+    def request(self, method: str, url: str, **kwargs):
+        response = self.session.request(method, url, **kwargs)
+        if kwargs.get("headers", {}).get("Range", "").startswith(self.failing_range):
+            response.status_code = self.status_code
+        return response
+
+
+class RecordingExtractor(StreamingExtractor):
+    instances = []
+
+    def start(self) -> None:
+        self.instances.append(self)
+        super().start()
+
+
+@unittest.skipIf(requests is None, "requests is not installed")
+class ParallelDownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.drive = FakeDrive(os.path.join(self.directory.name, "drive"))
+        self.drive.start()
+        self.session = requests.Session()
+        self.files = {f"world/region/r.{index}.0.mca": os.urandom(40000 + index * 9000) for index in range(12)}
+        self.files["world/level.dat"] = b"level data" * 1000
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zipf:
+            for name, content in self.files.items():
+                zipf.writestr(name, content)
+        self.archive = archive.getvalue()
+        self.record = self.drive.add_file("world_save.zip", self.archive)
+        self.live_dir = os.path.join(self.directory.name, "server")
+        os.makedirs(os.path.join(self.live_dir, "world"))
+        with open(os.path.join(self.live_dir, "world", "level.dat"), "wb") as file:
+            file.write(b"old level")
+        self.output_path = os.path.join(self.directory.name, "world_save.zip")
+        RecordingExtractor.instances = []
+
+    def tearDown(self):
+        self.session.close()
+        self.drive.stop()
+        self.directory.cleanup()
+
+    def download(self, session=None, md5_checksum: str = None, extract_to: str = None, **options) -> list:
+        """
+        :param session: Session used instead of plain one.
+        :param md5_checksum: Expected md5, md5 from drive if None.
+        :param extract_to: Directory of extraction.
+        :param options: Options of download.
+        :return: Progress reported during download.
+        """
+        downloader = ParallelDownloader(session or self.session, self.drive.files_url, chunk_size=CHUNK_SIZE,
+                                        concurrency=4, max_retries=0)
+        progress = []
+        downloader.download(self.record["id"], self.output_path, int(self.record["size"]),
+                            md5_checksum or self.record["md5Checksum"], extract_to,
+                            progress_callback=lambda downloaded, size: progress.append(downloaded), **options)
+        return progress
+
+    def read_world(self, directory: str) -> dict:
+        world = {}
+        for name in self.files:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as file:
+                    world[name] = file.read()
+        return world
+
+    def staged_download(self, **options) -> StagedRestore:
+        """
+        Downloads archive into staging directory like restore of main app, staging is discarded on failure.
+        :param options: Options of download.
+        :return: Staged restore with extracted archive.
+        """
+        staged_restore = StagedRestore(None, self.live_dir, os.path.join(self.directory.name, "staging"), ["world"])
+        staged_restore.prepare()
+        try:
+            with mock.patch("parallel_download.StreamingExtractor", RecordingExtractor):
+                self.download(extract_to=staged_restore.staging_dir, extract_member=staged_restore.extract_member,
+                              **options)
+        except BaseException:
+            staged_restore.discard()
+            raise
+        return staged_restore
+
+    def assert_extraction_ended(self) -> None:
+        # Extractor thread ended before error was raised
+        self.assertEqual(len(RecordingExtractor.instances), 1)
+        self.assertFalse(RecordingExtractor.instances[0].thread.is_alive())
+
+    def assert_live_world_untouched(self) -> None:
+        self.assertEqual(os.listdir(os.path.join(self.live_dir, "world")), ["level.dat"])
+        with open(os.path.join(self.live_dir, "world", "level.dat"), "rb") as file:
+            self.assertEqual(file.read(), b"old level")
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, "staging")))
+
+    def test_download_without_extraction(self):
+        progress = self.download()
+        with open(self.output_path, "rb") as file:
+            self.assertEqual(file.read(), self.archive)
+        self.assertEqual(progress, list(range(CHUNK_SIZE, len(self.archive), CHUNK_SIZE)) + [len(self.archive)])
+
+    def test_download_with_extraction(self):
+        extract_to = os.path.join(self.directory.name, "extracted")
+        self.download(extract_to=extract_to)
+        self.assertEqual(self.read_world(extract_to), self.files)
+
+    def test_staged_download_and_swap(self):
+        staged_restore = self.staged_download()
+        self.assertEqual(staged_restore.extracted, len(self.files))
+        staged_restore.swap()
+        self.assertEqual(self.read_world(self.live_dir), self.files)
+
+    def test_md5_mismatch_aborts_extraction(self):
+        with self.assertRaisesRegex(DownloadError, "Md5 mismatch"):
+            self.staged_download(md5_checksum=hashlib.md5(b"other").hexdigest())
+        self.assert_extraction_ended()
+        self.assert_live_world_untouched()
+
+    def test_corrupted_file_on_drive(self):
+        with open(self.drive.file_path(self.record["id"]), "r+b") as file:
+            file.seek(len(self.archive) // 2)
+            file.write(b"corrupted")
+        with self.assertRaisesRegex(DownloadError, "Md5 mismatch"):
+            self.staged_download()
+        self.assert_live_world_untouched()
+
+    def test_failure_of_range_worker(self):
+        with self.assertRaisesRegex(DownloadError, f"range {3 * CHUNK_SIZE}-"):
+            self.staged_download(session=FailingSession(self.session, 3 * CHUNK_SIZE))
+        self.assert_extraction_ended()
+        self.assert_live_world_untouched()
+
+
+if __name__ == '__main__':
+    unittest.main()
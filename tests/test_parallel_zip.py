@@ -0,0 +1,137 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+import zlib
+from unittest import mock
+
+from parallel_zip import ZIPFILE_INTERNALS, ParallelZipWriter, crc32_combine
+
+CHUNK_SIZE = 64 * 1024
+
+
+class NonSeekableOutput(io.RawIOBase):
+    def __init__(self):
+        """
+        Stream which can be only written, like pipe to uploader.
+        """
+        self.output = io.BytesIO()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        return self.output.write(data)
+
+
+class GrowingThrottle:
+    def __init__(self, file_path: str, added: bytes):
+        """
+        Throttle which appends to file after its first chunk was compressed, like world file saved during backup.
+        :param file_path: Path to file.
+        :param added: Appended bytes.
+        """
+        self.file_path = file_path
+        self.added = added
+
+    def read(self, amount: int) -> None:
+        if self.added:
+            with open(self.file_path, "ab") as file:
+                file.write(self.added)
+            self.added = b""
+
+    def write(self, amount: int) -> None:
+        pass
+
+
+class Crc32CombineTest(unittest.TestCase):
+    def test_combine_equals_crc_of_joined_data(self):
+        for first_size, second_size in [(0, 0), (1, 0), (0, 1), (100, 1), (CHUNK_SIZE, CHUNK_SIZE), (3, 100001)]:
+            first, second = os.urandom(first_size), os.urandom(second_size)
+            self.assertEqual(crc32_combine(zlib.crc32(first), zlib.crc32(second), len(second)),
+                             zlib.crc32(first + second), (first_size, second_size))
+
+    def test_combine_of_many_chunks(self):
+        data = os.urandom(10 * CHUNK_SIZE + 17)
+        crc = 0
+        for start in range(0, len(data), CHUNK_SIZE):
+            chunk = data[start:start + CHUNK_SIZE]
+            crc = crc32_combine(crc, zlib.crc32(chunk), len(chunk)) if start else zlib.crc32(chunk)
+        self.assertEqual(crc, zlib.crc32(data))
+
+
+class ParallelZipWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = {
+            # Large compressible file is split into several chunks
+            "world/level.dat": b"minecraft level data " * 20000,
+            "world/region/r.0.0.mca": os.urandom(3 * CHUNK_SIZE + 5),
+            "world/empty.txt": b"",
+            "world/exact.bin": os.urandom(2 * CHUNK_SIZE),
+        }
+        for arc_name, content in self.files.items():
+            path = os.path.join(self.directory.name, arc_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(content)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_archive(self, output, workers: int) -> None:
+        with ParallelZipWriter(output, workers=workers, chunk_size=CHUNK_SIZE) as zipf:
+            for arc_name in self.files:
+                zipf.write(os.path.join(self.directory.name, arc_name), arc_name)
+            zipf.writestr("meta/bytes.json", b'{"kind": "base"}')
+            zipf.writestr("meta/text.json", '{"kind": "delta", "name": "świat"}')
+
+    def assert_archive(self, archive) -> None:
+        expected = dict(self.files, **{"meta/bytes.json": b'{"kind": "base"}',
+                                       "meta/text.json": '{"kind": "delta", "name": "świat"}'.encode("utf-8")})
+        with zipfile.ZipFile(archive) as zip_ref:
+            self.assertIsNone(zip_ref.testzip())
+            self.assertEqual(zip_ref.namelist(), list(expected))
+            for arc_name, content in expected.items():
+                self.assertEqual(zip_ref.read(arc_name), content, arc_name)
+            # Already compressed files are stored
+            self.assertEqual(zip_ref.getinfo("world/region/r.0.0.mca").compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(zip_ref.getinfo("world/level.dat").compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_round_trip_to_file(self):
+        for workers in (1, 2):
+            archive = os.path.join(self.directory.name, f"save_{workers}.zip")
+            self.write_archive(archive, workers)
+            self.assert_archive(archive)
+
+    def test_round_trip_to_stream(self):
+        output = NonSeekableOutput()
+        self.write_archive(output, 2)
+        self.assert_archive(io.BytesIO(output.output.getvalue()))
+
+    def test_plain_zipfile_without_internals(self):
+        archive = os.path.join(self.directory.name, "save.zip")
+        with mock.patch("parallel_zip.ZIPFILE_INTERNALS", ZIPFILE_INTERNALS + ("_missing_attribute",)):
+            self.write_archive(archive, 2)
+        self.assert_archive(archive)
+
+    def test_growing_file_near_zip64_limit(self):
+        path = os.path.join(self.directory.name, "world", "region", "r.5.0.mca")
+        content = os.urandom(150000)
+        with open(path, "wb") as file:
+            file.write(content)
+        added = os.urandom(100000)
+        archive = os.path.join(self.directory.name, "save.zip")
+        # Size checked before compression is below the limit, data read after the file grew is above it
+        with mock.patch("zipfile.ZIP64_LIMIT", 190000):
+            with ParallelZipWriter(archive, workers=1, chunk_size=CHUNK_SIZE,
+                                   throttle=GrowingThrottle(path, added)) as zipf:
+                zipf.write(path, "world/region/r.5.0.mca")
+            with zipfile.ZipFile(archive) as zip_ref:
+                self.assertIsNone(zip_ref.testzip())
+                self.assertEqual(zip_ref.read("world/region/r.5.0.mca"), (content + added)[:3 * CHUNK_SIZE])
+
+
+if __name__ == '__main__':
+    unittest.main()
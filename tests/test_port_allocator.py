@@ -0,0 +1,75 @@
+import os
+import socket
+import tempfile
+import unittest
+
+from port_allocator import PortAllocator
+
+HOST = "127.0.0.1"
+
+
+class PortAllocatorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.directory.name, "port.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def allocator(self) -> PortAllocator:
+        allocator = PortAllocator(self.state_file, HOST)
+        self.addCleanup(allocator.release)
+        return allocator
+
+    def can_bind(self, port: int) -> bool:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            try:
+                sock.bind((HOST, port))
+            except OSError:
+                return False
+        return True
+
+    def test_reserved_port_is_taken_until_release(self):
+        allocator = self.allocator()
+        port = allocator.allocate()
+        self.assertIsNotNone(port)
+        self.assertIsNotNone(allocator.allocation_time_s)
+        self.assertFalse(self.can_bind(port))
+        # Another allocator gets other port
+        other = self.allocator()
+        self.assertNotEqual(other.allocate(), port)
+        allocator.release()
+        allocator.release()
+        self.assertIsNone(allocator.reservation)
+        self.assertTrue(self.can_bind(port))
+
+    def test_last_working_port_is_reused(self):
+        allocator = self.allocator()
+        port = allocator.allocate()
+        # Port is not remembered until server started on it
+        self.assertIsNone(allocator.load_last_port())
+        allocator.save_last_port()
+        allocator.release()
+        self.assertEqual(self.allocator().allocate(), port)
+
+    def test_taken_last_port_is_replaced(self):
+        allocator = self.allocator()
+        port = allocator.allocate()
+        allocator.save_last_port()
+        # Port is still reserved, like when other program took it
+        next_allocator = self.allocator()
+        next_port = next_allocator.allocate()
+        self.assertNotEqual(next_port, port)
+        next_allocator.save_last_port()
+        self.assertEqual(next_allocator.load_last_port(), next_port)
+
+    def test_damaged_state_file(self):
+        with open(self.state_file, "w") as file:
+            file.write("{broken")
+        allocator = self.allocator()
+        self.assertIsNone(allocator.load_last_port())
+        self.assertIsNotNone(allocator.allocate())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from retention import RetentionPolicy
+from save_catalog import SaveGeneration
+
+# Friday of ISO week 11
+NOW = datetime(2024, 3, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def generation(age: timedelta, size: int = 10) -> SaveGeneration:
+    """
+    :param age: Age of generation at NOW.
+    :param size: Size of generation.
+    :return: Generation named with its modified time.
+    """
+    modified_time = (NOW - age).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    return SaveGeneration(modified_time, [], size, modified_time)
+
+
+def names(generations: list) -> list:
+    return [generation.folder[:16] for generation in generations]
+
+
+class RetentionPolicyTest(unittest.TestCase):
+    def test_keep_last(self):
+        generations = [generation(timedelta(hours=hours)) for hours in range(10)]
+        kept, removed = RetentionPolicy(3, 0, 0, None).select(generations, NOW)
+        self.assertEqual(kept, generations[:3])
+        self.assertEqual(removed, generations[3:])
+
+    def test_newest_of_every_day(self):
+        generations = [generation(timedelta(days=days, hours=hours)) for days in range(10) for hours in (1, 5)]
+        kept, removed = RetentionPolicy(1, 7, 0, None).select(generations, NOW)
+        self.assertEqual(names(kept), [f"2024-03-{day:02d}T11:00" for day in range(15, 8, -1)])
+        self.assertEqual(len(removed), len(generations) - 7)
+
+    def test_newest_of_every_week(self):
+        generations = [generation(timedelta(days=days, hours=1)) for days in range(40)]
+        kept, _ = RetentionPolicy(1, 0, 4, None).select(generations, NOW)
+        self.assertEqual(names(kept), ["2024-03-15T11:00", "2024-03-10T11:00", "2024-03-03T11:00",
+                                       "2024-02-25T11:00", "2024-02-18T11:00"])
+
+    def test_tiers_together(self):
+        generations = [generation(timedelta(days=days, hours=1)) for days in range(40)]
+        kept, removed = RetentionPolicy(2, 3, 4, None).select(generations, NOW)
+        # Two last ones, the newest of each of the last three days and of each of the last four weeks
+        self.assertEqual(names(kept), ["2024-03-15T11:00", "2024-03-14T11:00", "2024-03-13T11:00",
+                                       "2024-03-10T11:00", "2024-03-03T11:00", "2024-02-25T11:00",
+                                       "2024-02-18T11:00"])
+        self.assertEqual(len(kept) + len(removed), len(generations))
+
+    def test_quota_removes_eldest(self):
+        generations = [generation(timedelta(hours=hours)) for hours in range(5)]
+        kept, removed = RetentionPolicy(5, 0, 0, 35).select(generations, NOW)
+        self.assertEqual(kept, generations[:3])
+        self.assertEqual(removed, generations[3:])
+
+    def test_newest_is_always_kept(self):
+        generations = [generation(timedelta(hours=1), size=100), generation(timedelta(hours=2), size=1)]
+        kept, removed = RetentionPolicy(0, 0, 0, 10).select(generations, NOW)
+        self.assertEqual(kept, generations[:1])
+        self.assertEqual(removed, generations[1:])
+        self.assertEqual(RetentionPolicy().select([], NOW), ([], []))
+
+    def test_order_of_input_does_not_matter(self):
+        generations = [generation(timedelta(hours=hours * 7)) for hours in range(30)]
+        shuffled = generations[:]
+        random.Random(1).shuffle(shuffled)
+        self.assertEqual(RetentionPolicy(2, 3, 2, 200).select(shuffled, NOW),
+                         RetentionPolicy(2, 3, 2, 200).select(generations, NOW))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+
+from constants import INCREMENTAL_DELTA_PREFIX, SAVE_FILE_NAME, SAVE_FOLDER_NAME
+from drive_index import FOLDER_MIME_TYPE, DriveIndex
+from fake_drive import FakeDrive, FakeDriveService
+from save_catalog import IndexedSaveCatalog, SaveCatalog
+
+ZIP_MIME_TYPE = "application/zip"
+
+
+def drive_time(day: int, hour: int = 0) -> str:
+    return f"2024-05-{day:02}T{hour:02}:00:00.000Z"
+
+
+class CountingService:
+    def __init__(self, service: FakeDriveService):
+        """
+        Service which counts listings of files.
+        :param service: Fake drive service.
+        """
+        self.service = service
+        self.listings = 0
+
+    def files(self):
+        resource = self.service.files()
+        list_files = resource.list
+
+        def counted_list(**kwargs):
+            self.listings += 1
+            return list_files(**kwargs)
+
+        resource.list = counted_list
+        return resource
+
+
+class SaveCatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.drive = FakeDrive(os.path.join(self.directory.name, "drive"), max_page_size=3)
+        self.drive.start()
+        self.service = CountingService(FakeDriveService(self.drive))
+        # Many other files, drive filters them out
+        for index in range(30):
+            self.drive.add_file(f"photo_{index}.zip", b"photo", mime_type=ZIP_MIME_TYPE, modified_time=drive_time(20))
+        self.drive.add_file(f"backup_{INCREMENTAL_DELTA_PREFIX}0001.zip", b"", mime_type=ZIP_MIME_TYPE,
+                            modified_time=drive_time(20))
+        self.drive.add_file(SAVE_FILE_NAME, b"text", mime_type="text/plain", modified_time=drive_time(20))
+        self.drive.trash_file(self.drive.add_file(SAVE_FILE_NAME, b"trashed", mime_type=ZIP_MIME_TYPE,
+                                                  modified_time=drive_time(20))["id"])
+        # Older generation with base only, newer one with base and deltas
+        self.old_folder = self.add_file(SAVE_FOLDER_NAME, 1, mime_type=FOLDER_MIME_TYPE)
+        self.old_base = self.add_file(SAVE_FILE_NAME, 1, b"old base", self.old_folder)
+        self.folder = self.add_file(SAVE_FOLDER_NAME, 2, mime_type=FOLDER_MIME_TYPE)
+        self.base = self.add_file(SAVE_FILE_NAME, 2, b"base", self.folder, hour=1)
+        self.deltas = [self.add_file(f"{INCREMENTAL_DELTA_PREFIX}{sequence:04}.zip", 2, b"delta" * sequence,
+                                     self.folder, hour=10 - sequence)
+                       for sequence in (1, 2, 3)]
+
+    def tearDown(self):
+        self.drive.stop()
+        self.directory.cleanup()
+
+    def add_file(self, name: str, day: int, content: bytes = b"", folder: dict = None, mime_type: str = ZIP_MIME_TYPE,
+                 hour: int = 0) -> dict:
+        return self.drive.add_file(name, content, [folder["id"]] if folder else None, mime_type,
+                                   drive_time(day, hour))
+
+    def catalogs(self) -> list:
+        drive_index = DriveIndex(os.path.join(self.directory.name, "drive_index.json"))
+        drive_index.sync(FakeDriveService(self.drive))
+        return [SaveCatalog(self.service, page_size=3), IndexedSaveCatalog(drive_index)]
+
+    def test_latest_save_and_snapshot(self):
+        for catalog in self.catalogs():
+            self.assertEqual(catalog.latest_save().id, self.base["id"])
+            # Delta modified last is the newest snapshot, not the one with the highest sequence
+            self.assertEqual(catalog.latest_snapshot().id, self.deltas[0]["id"])
+        # Limit of one record is asked from drive, one request is enough
+        self.assertEqual(self.service.listings, 2)
+
+    def test_snapshot_chain_is_in_applying_order(self):
+        for catalog in self.catalogs():
+            chain = catalog.snapshot_chain(self.folder["id"])
+            self.assertEqual([record.id for record in chain],
+                             [self.base["id"]] + [delta["id"] for delta in self.deltas])
+            self.assertEqual(chain[1].size, len(b"delta"))
+            self.assertEqual([record.id for record in catalog.snapshot_chain(self.old_folder["id"])],
+                             [self.old_base["id"]])
+
+    def test_world_folders(self):
+        for catalog in self.catalogs():
+            self.assertEqual([record.id for record in catalog.world_folders()],
+                             [self.folder["id"], self.old_folder["id"]])
+            self.assertEqual([record.id for record in catalog.world_folders(newest_first=False, limit=1)],
+                             [self.old_folder["id"]])
+            self.assertIsNone(catalog.world_folders()[0].size)
+        # Each listing takes one request, other files of drive are not listed
+        self.assertEqual(self.service.listings, 3)
+
+    def test_generations(self):
+        for catalog in self.catalogs():
+            generations = catalog.generations()
+            self.assertEqual([generation.folder.id for generation in generations],
+                             [self.folder["id"], self.old_folder["id"]])
+            self.assertEqual(sorted(record.id for record in generations[0].files),
+                             sorted([self.base["id"]] + [delta["id"] for delta in self.deltas]))
+            self.assertEqual(generations[0].size, len(b"base") + len(b"delta") * 6)
+            self.assertEqual(generations[0].modified_time, drive_time(2, 9))
+            self.assertEqual((generations[1].size, generations[1].modified_time), (len(b"old base"), drive_time(1)))
+
+    def test_quoted_names(self):
+        self.drive.add_file("it's \\ world_save.zip", b"", mime_type=ZIP_MIME_TYPE)
+        catalog = SaveCatalog(self.service)
+        self.assertEqual([record.name for record in catalog.query(names=("it's \\ world_save.zip",))],
+                         ["it's \\ world_save.zip"])
+
+
+if __name__ == '__main__':
+    unittest.main()
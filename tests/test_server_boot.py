@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from constants import BOOT_DONE_PHASE, BOOT_HISTORY_LENGTH, SERVER_JVM_ARGS_FILE, SERVER_LAUNCH_ARGS_GLOB
+from server_boot import BootTimer, cds_options, server_command
+
+
+def write_file(path: str, content: str, mtime_s: int = None) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+    if mtime_s is not None:
+        os.utime(path, (mtime_s, mtime_s))
+
+
+class CdsOptionsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.java = os.path.join(self.directory.name, "java")
+        self.args_file = os.path.join(self.directory.name, "user_jvm_args.txt")
+        self.archive = os.path.join(self.directory.name, "server.jsa")
+        write_file(self.java, "java", 1_700_000_000)
+        write_file(self.args_file, "-Xmx4G", 1_700_000_000)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def options(self) -> list:
+        return cds_options(self.java, [self.args_file], self.archive)
+
+    def dump_archive(self) -> None:
+        # JVM writes archive at clean exit
+        self.assertEqual(self.options(), [f"-XX:ArchiveClassesAtExit={self.archive}"])
+        write_file(self.archive, "classes")
+
+    def test_archive_is_dumped_then_mapped(self):
+        self.dump_archive()
+        for _ in range(2):
+            self.assertEqual(self.options(), [f"-XX:SharedArchiveFile={self.archive}"])
+
+    def test_changed_files_invalidate_archive(self):
+        self.dump_archive()
+        # Same size, new modification time
+        write_file(self.args_file, "-Xmx8G", 1_700_000_100)
+        self.assertEqual(self.options(), [f"-XX:ArchiveClassesAtExit={self.archive}"])
+        self.assertFalse(os.path.exists(self.archive))
+        self.dump_archive()
+        # Updated java
+        write_file(self.java, "newer java")
+        self.assertEqual(self.options(), [f"-XX:ArchiveClassesAtExit={self.archive}"])
+        self.dump_archive()
+        os.remove(self.args_file)
+        self.assertEqual(self.options(), [f"-XX:ArchiveClassesAtExit={self.archive}"])
+
+    def test_missing_archive_or_fingerprint(self):
+        self.dump_archive()
+        # Server did not exit cleanly, archive was not written
+        os.remove(self.archive)
+        self.assertEqual(self.options(), [f"-XX:ArchiveClassesAtExit={self.archive}"])
+        write_file(self.archive, "classes")
+        write_file(f"{self.archive}.json", "{broken")
+        self.assertEqual(self.options(), [f"-XX:ArchiveClassesAtExit={self.archive}"])
+        self.assertFalse(os.path.exists(self.archive))
+
+    def test_server_command(self):
+        server_dir = os.path.join(self.directory.name, "server")
+        launch_file = os.path.normpath(SERVER_LAUNCH_ARGS_GLOB.replace("*", "47.2.0"))
+        with mock.patch("server_boot.java_executable", return_value=self.java), \
+                mock.patch("server_boot.USE_APP_CDS", False):
+            command, description = server_command(server_dir)
+            self.assertIn("start script", description)
+            write_file(os.path.join(server_dir, SERVER_JVM_ARGS_FILE), "-Xmx4G")
+            write_file(os.path.join(server_dir, launch_file), "--launchTarget forge_server")
+            command, description = server_command(server_dir)
+        self.assertEqual(description, "java directly")
+        self.assertEqual(command[:3], [self.java, f"@{SERVER_JVM_ARGS_FILE}", f"@{launch_file}"])
+
+
+class BootTimerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.history_file = os.path.join(self.directory.name, "boot_history.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def boot(self, total_time: float, phases: tuple = ()) -> str:
+        """
+        Runs boot with phases at given times since start.
+        :param total_time: Time of the last phase.
+        :param phases: Names and times of phases before the last one.
+        :return: Warning of finish.
+        """
+        timer = BootTimer(self.history_file)
+        times = [100.0] + [100.0 + phase_time for _, phase_time in phases] + [100.0 + total_time]
+        with mock.patch("server_boot.time.monotonic", side_effect=times):
+            timer.start()
+            for phase, _ in phases:
+                timer.mark(phase)
+            timer.mark(BOOT_DONE_PHASE)
+        self.timer = timer
+        return timer.finish("java directly")
+
+    def test_phases_are_reported(self):
+        self.assertEqual(self.boot(30, (("mods", 10), ("world", 25))), "")
+        # Only the first occurrence counts
+        self.timer.mark("mods")
+        self.assertEqual(self.timer.report(), "mods at 10.0s (+10.0s), world at 25.0s (+15.0s), done at 30.0s (+5.0s)")
+        self.assertEqual(BootTimer(self.history_file).history()[0]["phases"],
+                         {"mods": 10, "world": 25, BOOT_DONE_PHASE: 30})
+
+    def test_slow_boot_is_compared_with_median(self):
+        # The first boot has nothing to compare with
+        for total_time in (30, 32, 31):
+            self.assertEqual(self.boot(total_time), "")
+        self.assertIn("median of previous 3 boots is 31.0s", self.boot(90))
+        # Median of 31.5 is not moved by one slow boot
+        self.assertEqual(self.boot(37), "")
+        warning = self.boot(39)
+        self.assertIn("Server boot took 39.0s (java directly)", warning)
+        self.assertIn("median of previous 5 boots is 32.0s", warning)
+
+    def test_history_is_limited(self):
+        for _ in range(BOOT_HISTORY_LENGTH + 5):
+            self.boot(30)
+        self.assertEqual(len(BootTimer(self.history_file).history()), BOOT_HISTORY_LENGTH)
+
+    def test_damaged_history(self):
+        with open(self.history_file, "w") as file:
+            file.write("{broken\n")
+        self.assertEqual(self.boot(100), "")
+        with open(self.history_file, "r") as file:
+            self.assertEqual(json.loads(file.readline())["phases"], {BOOT_DONE_PHASE: 100})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import os
+import tempfile
+import unittest
+import zipfile
+import zlib
+from unittest import mock
+
+from staged_restore import StagedRestore
+
+ENTRIES = ["world", "server.properties"]
+
+
+def write_files(directory: str, files: dict) -> None:
+    for name, content in files.items():
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(content)
+
+
+def read_files(directory: str) -> dict:
+    """
+    :param directory: Directory.
+    :return: Relative path with / separators -> content of every file in directory.
+    """
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as file:
+                files[os.path.relpath(path, directory).replace(os.sep, "/")] = file.read()
+    return files
+
+
+class StagedRestoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.live_dir = os.path.join(self.directory.name, "server")
+        self.staging_dir = os.path.join(self.directory.name, "staging")
+        self.old_files = {
+            "world/level.dat": b"old level",
+            "world/region/r.0.0.mca": b"region which did not change",
+            "world/region/r.1.0.mca": b"region AAAA",
+            "world/removed.dat": b"not in the save",
+            "server.properties": b"motd=old",
+            # Not replaced by restore
+            "eula.txt": b"eula=true",
+        }
+        self.save_files = {
+            "world/level.dat": b"new level",
+            "world/region/r.0.0.mca": b"region which did not change",
+            # Same size, different content
+            "world/region/r.1.0.mca": b"region BBBB",
+            "world/added.dat": b"new file",
+            "server.properties": b"motd=new",
+        }
+        write_files(self.live_dir, self.old_files)
+        self.archive = os.path.join(self.directory.name, "save.zip")
+        self.write_archive(self.save_files)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_archive(self, files: dict) -> None:
+        with zipfile.ZipFile(self.archive, "w") as zipf:
+            zipf.writestr("world/", b"")
+            for name, content in files.items():
+                zipf.writestr(name, content)
+
+    def restore(self, known_crc=None) -> StagedRestore:
+        staged_restore = StagedRestore(known_crc, self.live_dir, self.staging_dir, ENTRIES)
+        staged_restore.prepare()
+        return staged_restore
+
+    def test_swap_replaces_live_entries(self):
+        staged_restore = self.restore()
+        staged_restore.extract_archive(self.archive)
+        # Live world is untouched until swap
+        self.assertEqual(read_files(self.live_dir), self.old_files)
+        staged_restore.swap()
+        self.assertEqual(read_files(self.live_dir), dict(self.save_files, **{"eula.txt": b"eula=true"}))
+        self.assertFalse(os.path.exists(self.staging_dir))
+        self.assertFalse(os.path.exists(staged_restore.previous_dir))
+
+    def test_only_crc_matching_files_are_linked(self):
+        live_region = os.path.join(self.live_dir, "world", "region", "r.0.0.mca")
+        changed_region = os.path.join(self.live_dir, "world", "region", "r.1.0.mca")
+        staged_restore = self.restore()
+        staged_restore.extract_archive(self.archive)
+        self.assertEqual((staged_restore.linked, staged_restore.extracted), (1, 4))
+        staged_dir = os.path.join(self.staging_dir, "world", "region")
+        self.assertTrue(os.path.samefile(live_region, os.path.join(staged_dir, "r.0.0.mca")))
+        self.assertFalse(os.path.samefile(changed_region, os.path.join(staged_dir, "r.1.0.mca")))
+        staged_restore.swap()
+        self.assertEqual(read_files(self.live_dir)["world/region/r.1.0.mca"], b"region BBBB")
+
+    def test_known_crc_is_used_instead_of_reading(self):
+        known = {"world/region/r.1.0.mca": zlib.crc32(b"region BBBB")}
+        staged_restore = self.restore(lambda name, path: known.get(name))
+        staged_restore.extract_archive(self.archive)
+        # Manifest claims that live file already has the new content
+        self.assertEqual((staged_restore.linked, staged_restore.extracted), (2, 3))
+
+    def test_failed_extraction_keeps_live_world(self):
+        files = dict(self.save_files)
+        files["world/region/r.2.0.mca"] = b"corrupted member"
+        self.write_archive(files)
+        with open(self.archive, "r+b") as file:
+            content = file.read()
+            file.seek(content.index(b"corrupted member"))
+            file.write(b"CORRUPTED")
+        staged_restore = self.restore()
+        with self.assertRaises(zipfile.BadZipFile):
+            staged_restore.extract_archive(self.archive)
+        staged_restore.discard()
+        self.assertEqual(read_files(self.live_dir), self.old_files)
+        self.assertFalse(os.path.exists(self.staging_dir))
+
+    def test_failed_swap_moves_live_entries_back(self):
+        staged_restore = self.restore()
+        staged_restore.extract_archive(self.archive)
+        replace = os.replace
+        calls = []
+
+        def failing_replace(source, target):
+            calls.append(source)
+            if len(calls) == 3:
+                raise OSError("file is used by another process")
+            replace(source, target)
+
+        with mock.patch("os.replace", failing_replace):
+            with self.assertRaises(OSError):
+                staged_restore.swap()
+        self.assertEqual(read_files(self.live_dir), self.old_files)
+        # Next restore starts from scratch
+        staged_restore = self.restore()
+        staged_restore.extract_archive(self.archive)
+        staged_restore.swap()
+        self.assertEqual(read_files(self.live_dir)["world/level.dat"], b"new level")
+
+    def test_unsafe_member_names_are_rejected(self):
+        for name in ("../outside.txt", "world/../../outside.txt", "/etc/outside.txt", "\\outside.txt",
+                     "C:/outside.txt", "world\\..\\..\\outside.txt"):
+            with zipfile.ZipFile(self.archive, "w") as zipf:
+                zipf.writestr("world/level.dat", b"new level")
+                zipf.writestr(name, b"outside")
+            staged_restore = self.restore()
+            with self.assertRaises(zipfile.BadZipFile, msg=name):
+                staged_restore.extract_archive(self.archive)
+            staged_restore.discard()
+            self.assertNotIn("outside.txt", os.listdir(self.directory.name))
+            self.assertEqual(read_files(self.live_dir), self.old_files)
+
+
+if __name__ == '__main__':
+    unittest.main()
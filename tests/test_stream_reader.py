@@ -0,0 +1,90 @@
+import asyncio
+import io
+import unittest
+
+from stream_reader import LineSplitter, read_lines, read_lines_async
+
+
+def split_all(data: bytes, read_size: int, max_line_length: int = 100) -> list:
+    """
+    :param data: Whole output.
+    :param read_size: Size of pieces fed to splitter.
+    :param max_line_length: Maximal number of characters of line.
+    :return: All lines given by splitter.
+    """
+    splitter = LineSplitter(max_line_length)
+    lines = []
+    for start in range(0, len(data), read_size):
+        lines += splitter.feed(data[start:start + read_size])
+    return lines + splitter.finish()
+
+
+class LineSplitterTest(unittest.TestCase):
+    def test_lines_split_between_reads(self):
+        data = b"first line\nsecond line\n\nthird\n"
+        for read_size in range(1, len(data) + 1):
+            self.assertEqual(split_all(data, read_size), ["first line", "second line", "", "third"], read_size)
+
+    def test_crlf_endings(self):
+        data = b"first\r\nsecond\r\n\r\nthird\r\n"
+        for read_size in range(1, len(data) + 1):
+            self.assertEqual(split_all(data, read_size), ["first", "second", "", "third"], read_size)
+
+    def test_carriage_return_inside_line_is_kept(self):
+        self.assertEqual(split_all(b"progress\r50%\r\n", 3), ["progress\r50%"])
+
+    def test_partial_last_line(self):
+        splitter = LineSplitter()
+        self.assertEqual(splitter.feed(b"done\nnot fini"), ["done"])
+        self.assertEqual(splitter.feed(b"shed"), [])
+        self.assertEqual(splitter.finish(), ["not finished"])
+        self.assertEqual(LineSplitter().finish(), [])
+        self.assertEqual(split_all(b"last\r", 2), ["last"])
+
+    def test_multibyte_character_split_between_reads(self):
+        data = "zażółć gęślą jaźń\n€\n".encode("utf-8")
+        for read_size in range(1, 5):
+            self.assertEqual(split_all(data, read_size), ["zażółć gęślą jaźń", "€"], read_size)
+
+    def test_invalid_bytes_are_replaced(self):
+        self.assertEqual(split_all(b"bad \xff byte\n", 4), ["bad � byte"])
+
+    def test_long_line_is_truncated(self):
+        data = b"x" * 25 + b"\nshort\n" + b"y" * 30
+        for read_size in (1, 7, 100):
+            self.assertEqual(split_all(data, read_size, max_line_length=10),
+                             ["x" * 10 + "... [15 characters truncated]", "short",
+                              "y" * 10 + "... [20 characters truncated]"], read_size)
+
+    def test_long_line_with_crlf_ending(self):
+        for read_size in (1, 7, 100):
+            self.assertEqual(split_all(b"x" * 25 + b"\r\n" + b"z" * 11 + b"\r\n", read_size, max_line_length=10),
+                             ["x" * 10 + "... [15 characters truncated]", "z" * 10 + "... [1 characters truncated]"],
+                             read_size)
+
+    def test_line_of_maximal_length(self):
+        data = b"x" * 10 + b"\n" + b"y" * 10 + b"\r\n"
+        for read_size in (1, 3, 100):
+            self.assertEqual(split_all(data, read_size, max_line_length=10), ["x" * 10, "y" * 10], read_size)
+
+
+class ReadLinesTest(unittest.TestCase):
+    def test_blocking_reader(self):
+        lines = []
+        read_lines(io.BytesIO(b"a\r\nb\nc"), lines.append, read_size=2)
+        self.assertEqual(lines, ["a", "b", "c"])
+
+    def test_async_reader(self):
+        async def read() -> list:
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"a\r\nb\nc")
+            reader.feed_eof()
+            lines = []
+            await read_lines_async(reader, lines.append, read_size=2)
+            return lines
+
+        self.assertEqual(asyncio.run(read()), ["a", "b", "c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
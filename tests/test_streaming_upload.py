@@ -0,0 +1,89 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from fake_drive import FakeDrive
+from streaming_upload import ResumableUploader, UploadError, upload_while_writing
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+CHUNK_SIZE = 256 * 1024
+
+
+@unittest.skipIf(requests is None, "requests is not installed")
+class ResumableUploaderTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = tempfile.TemporaryDirectory()
+        self.drive = None
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.session.close()
+        if self.drive is not None:
+            self.drive.stop()
+        self.storage.cleanup()
+
+    def start_drive(self, persist_limit: int = None) -> FakeDrive:
+        self.drive = FakeDrive(self.storage.name, persist_limit=persist_limit)
+        self.drive.start()
+        return self.drive
+
+    def upload(self, content: bytes, piece_size: int = 100000) -> bytes:
+        """
+        Uploads content written in pieces to pipe.
+        :param content: Uploaded bytes.
+        :param piece_size: Size of one write of archive writer.
+        :return: Content stored by drive.
+        """
+        uploader = ResumableUploader(self.session, self.drive.upload_url, chunk_size=CHUNK_SIZE)
+
+        def write_archive(output):
+            for start in range(0, len(content), piece_size):
+                output.write(content[start:start + piece_size])
+
+        file = upload_while_writing(uploader, {"name": "save.zip"}, write_archive)
+        self.assertEqual(uploader.confirmed, len(content))
+        self.assertEqual(self.drive.files[file["id"]]["md5Checksum"], hashlib.md5(content).hexdigest())
+        with open(self.drive.file_path(file["id"]), "rb") as stored:
+            return stored.read()
+
+    def test_upload_in_chunks(self):
+        self.start_drive()
+        content = os.urandom(3 * CHUNK_SIZE + 12345)
+        self.assertEqual(self.upload(content), content)
+
+    def test_upload_of_exact_chunks(self):
+        self.start_drive()
+        content = os.urandom(2 * CHUNK_SIZE)
+        self.assertEqual(self.upload(content), content)
+
+    def test_small_and_empty_upload(self):
+        self.start_drive()
+        self.assertEqual(self.upload(b"save"), b"save")
+        self.assertEqual(self.upload(b""), b"")
+
+    def test_resume_after_partial_persist(self):
+        # Drive persists unaligned part of every chunk, not persisted bytes have to be sent again in aligned chunks
+        self.start_drive(persist_limit=100001)
+        content = os.urandom(3 * CHUNK_SIZE + 777)
+        self.assertEqual(self.upload(content), content)
+
+    def test_unaligned_chunk_is_rejected(self):
+        self.start_drive()
+        uploader = ResumableUploader(self.session, self.drive.upload_url, chunk_size=CHUNK_SIZE)
+        uploader.start({"name": "save.zip"})
+        with self.assertRaises(UploadError):
+            uploader.send_chunk(b"x" * 1000, 0, None)
+
+    def test_no_progress_fails(self):
+        self.start_drive(persist_limit=0)
+        with self.assertRaises(UploadError):
+            self.upload(os.urandom(2 * CHUNK_SIZE + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from tracing import PROFILE_CPROFILE, PROFILE_SAMPLING, Tracer, traced
+
+
+class Job:
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+
+    @traced()
+    def upload(self, size: int) -> int:
+        self.tracer.add_bytes(size)
+        return size
+
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.trace_file = os.path.join(self.directory.name, "traces", "trace.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def tracer(self, **options) -> Tracer:
+        return Tracer(self.trace_file, enabled=True, **options)
+
+    @staticmethod
+    def run_span(tracer: Tracer, name: str) -> None:
+        with tracer.span(name):
+            pass
+
+    def test_nested_spans_have_parents(self):
+        tracer = self.tracer()
+        with tracer.span("save") as save:
+            self.assertIs(tracer.current(), save)
+            with tracer.span("zip") as zip_span:
+                tracer.add_bytes(100)
+            self.assertEqual(Job(tracer).upload(50), 50)
+            # Other thread has its own stack
+            thread = threading.Thread(target=self.run_span, args=(tracer, "monitor"))
+            thread.start()
+            thread.join()
+        self.assertIsNone(tracer.current())
+        self.assertIsNone(save.parent)
+        self.assertIs(zip_span.parent, save)
+        self.assertEqual([child.name for child in tracer.children(save)], ["zip", "upload"])
+        self.assertEqual((save.bytes, zip_span.bytes), (150, 100))
+        self.assertTrue(tracer.summary(save).startswith("zip "))
+        self.assertGreaterEqual(save.wall_s, zip_span.wall_s)
+        monitor = next(span for span in tracer.spans if span.name == "monitor")
+        self.assertIsNone(monitor.parent)
+        self.assertNotEqual(monitor.thread_id, save.thread_id)
+
+    def test_error_is_recorded(self):
+        tracer = self.tracer()
+        with self.assertRaises(ValueError):
+            with tracer.span("restore"):
+                with tracer.span("download"):
+                    raise ValueError("md5 mismatch")
+        self.assertEqual([(span.name, span.error) for span in tracer.spans],
+                         [("download", "ValueError"), ("restore", "ValueError")])
+        self.assertIn("failed with ValueError", tracer.spans[0].describe())
+        self.assertEqual(tracer.stack(), [])
+
+    def test_failed_profiler_start_leaves_stack_clean(self):
+        tracer = self.tracer(profile_mode=PROFILE_CPROFILE, profile_phases=["zip"])
+        with tracer.span("save"):
+            with mock.patch.object(tracer, "start_profiler", side_effect=RuntimeError("can't start new thread")):
+                with self.assertRaises(RuntimeError):
+                    with tracer.span("zip"):
+                        pass
+            self.assertEqual([span.name for span in tracer.stack()], ["save"])
+        self.assertEqual(tracer.stack(), [])
+        self.assertEqual(tracer.spans[0].error, "RuntimeError")
+
+    def test_profiles_are_written_next_to_trace(self):
+        for mode, extension in ((PROFILE_CPROFILE, "prof"), (PROFILE_SAMPLING, "folded")):
+            tracer = self.tracer(profile_mode=mode, profile_phases=["zip"])
+            with tracer.span("zip"):
+                sum(range(10000))
+            self.assertEqual(len(glob.glob(os.path.join(os.path.dirname(self.trace_file), f"zip_*.{extension}"))), 1)
+
+    def test_chrome_trace_export(self):
+        tracer = self.tracer(max_spans=2)
+        with tracer.span("old"):
+            pass
+        with tracer.span("save", category="backup", folder="world"):
+            tracer.instant("boot_done", phase="done")
+            with tracer.span("zip"):
+                pass
+        tracer.export()
+        with open(self.trace_file, "r", encoding="utf-8") as file:
+            trace = json.load(file)
+        self.assertEqual(trace["displayTimeUnit"], "ms")
+        events = trace["traceEvents"]
+        metadata = [event for event in events if event["ph"] == "M"]
+        self.assertEqual({event["name"] for event in metadata}, {"process_name", "thread_name"})
+        self.assertIn(threading.current_thread().name, [event["args"]["name"] for event in metadata])
+        # The oldest span is dropped
+        complete = {event["name"]: event for event in events if event["ph"] == "X"}
+        self.assertEqual(sorted(complete), ["save", "zip"])
+        save, zip_event = complete["save"], complete["zip"]
+        self.assertEqual((save["cat"], save["pid"], save["tid"]), ("backup", os.getpid(), threading.get_native_id()))
+        self.assertEqual(save["args"]["folder"], "world")
+        self.assertIn("cpu_ms", save["args"])
+        self.assertLessEqual(save["ts"], zip_event["ts"])
+        self.assertGreaterEqual(save["ts"] + save["dur"], zip_event["ts"] + zip_event["dur"])
+        instant = next(event for event in events if event["ph"] == "i")
+        self.assertEqual((instant["name"], instant["s"], instant["args"]), ("boot_done", "t", {"phase": "done"}))
+        self.assertFalse(os.path.exists(f"{self.trace_file}.tmp"))
+
+    def test_disabled_tracer(self):
+        tracer = Tracer(self.trace_file, enabled=False)
+        with tracer.span("save") as span:
+            tracer.add_bytes(10)
+            tracer.instant("boot_done")
+        self.assertIsNone(span)
+        self.assertIsNone(tracer.current())
+        tracer.export()
+        self.assertFalse(os.path.exists(self.trace_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
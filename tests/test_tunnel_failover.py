@@ -0,0 +1,151 @@
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+from constants import NGROK_BACKEND, ZROK_BACKEND
+from process_hub import ProcessHub
+from tunnel_manager import NgrokBackend, TunnelManager, ZrokBackend
+from tunnel_monitor import TunnelMonitor, pack_varint, packet, read_exactly, read_varint, status_ping
+
+FAKE_TUNNEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fake_tunnel.py")
+ZROK_TOKEN = "testtoken"
+STATUS = {"version": {"name": "1.20.1", "protocol": 763}, "players": {"max": 20, "online": 0}}
+
+
+class StatusHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        """
+        Answers server list ping like game server.
+        :return:
+        """
+        try:
+            while True:
+                body = read_exactly(self.request, read_varint(self.request))
+                if body == b"\x00":
+                    status = json.dumps(STATUS).encode("utf-8")
+                    self.request.sendall(packet(0x00, pack_varint(len(status)) + status))
+                elif body[:1] == b"\x01":
+                    self.request.sendall(packet(0x01, body[1:]))
+        except (OSError, ValueError):
+            pass
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TunnelFailoverTest(unittest.TestCase):
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), StatusHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.server_port = self.server.server_address[1]
+        self.hub = ProcessHub()
+        self.hub.start()
+        self.messages = []
+        self.zrok_port = free_port()
+        self.manager = TunnelManager(self.hub, [
+            ZrokBackend(ZROK_TOKEN, [sys.executable, FAKE_TUNNEL, "zrok", "share", "reserved", "--headless"],
+                        probe_address=f"127.0.0.1:{self.zrok_port}"),
+            # Inspection API of fake ngrok does not exist, address is taken from its log
+            NgrokBackend([sys.executable, FAKE_TUNNEL, "ngrok", "tcp"], api_url=f"http://127.0.0.1:{free_port()}"),
+        ], lambda message, prefix: self.messages.append((prefix, message)))
+
+    def tearDown(self):
+        self.stop_tunnel()
+        self.hub.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def start_tunnel(self, backend: str, timeout: float = 10, **environment):
+        """
+        Starts fake tunnel with given FAKE_TUNNEL_ environment variables.
+        :param backend: Name of backend.
+        :param timeout: Start timeout.
+        :param environment: Environment variables without FAKE_TUNNEL_ prefix.
+        :return: Public address or None.
+        """
+        variables = {f"FAKE_TUNNEL_{key}": str(value) for key, value in environment.items()}
+        variables["FAKE_TUNNEL_TARGET_PORT"] = str(self.server_port)
+        variables["FAKE_TUNNEL_PORT"] = str(self.zrok_port if backend == ZROK_BACKEND else 0)
+        with mock.patch.dict(os.environ, variables):
+            return self.manager.start(backend, self.server_port, timeout)
+
+    def stop_tunnel(self):
+        if self.manager.process is not None and self.manager.process.returncode is None:
+            self.manager.process.terminate()
+            self.manager.process.wait(10)
+
+    def probe(self, monitor: TunnelMonitor):
+        """
+        Probes tunnel the same way as tunnel monitor of main app.
+        :param monitor: Tunnel monitor.
+        :return: Problem of tunnel or None.
+        """
+        if not self.manager.running:
+            return "tunnel process is not running"
+        try:
+            latency_ms, status = status_ping(self.manager.backend.probe_address(self.manager.address), timeout=5)
+            self.assertEqual(status, STATUS)
+            monitor.record(latency_ms)
+        except (OSError, ValueError):
+            monitor.record(None)
+        return monitor.problem()
+
+    def test_tunnel_forwards_server_list_ping(self):
+        for backend in (ZROK_BACKEND, NGROK_BACKEND):
+            address = self.start_tunnel(backend)
+            self.assertIsNotNone(address, backend)
+            monitor = TunnelMonitor(min_samples=3)
+            for _ in range(3):
+                self.assertIsNone(self.probe(monitor), backend)
+            self.stop_tunnel()
+        self.assertEqual(self.manager.address, self.manager.address.strip())
+        self.assertIn((ZROK_BACKEND.upper(), f"access your zrok share at the following endpoints: {ZROK_TOKEN}"),
+                      self.messages)
+
+    def test_next_backend_when_first_does_not_start(self):
+        started = time.monotonic()
+        self.assertIsNone(self.start_tunnel(ZROK_BACKEND, timeout=1, START_DELAY_S=30))
+        self.assertLess(time.monotonic() - started, 5)
+        self.stop_tunnel()
+        address = self.start_tunnel(NGROK_BACKEND)
+        self.assertIsNotNone(address)
+        self.assertIsNone(self.probe(TunnelMonitor()))
+
+    def test_failover_when_tunnel_ends(self):
+        self.assertEqual(self.start_tunnel(ZROK_BACKEND, EXIT_AFTER_S=0.5), ZROK_TOKEN)
+        self.assertTrue(self.manager.closed.wait(10))
+        self.assertEqual(self.probe(TunnelMonitor()), "tunnel process is not running")
+        address = self.start_tunnel(NGROK_BACKEND)
+        self.assertIsNotNone(address)
+        self.assertTrue(self.manager.running)
+        self.assertIsNone(self.probe(TunnelMonitor()))
+
+    def test_failover_when_tunnel_is_slow(self):
+        self.assertEqual(self.start_tunnel(ZROK_BACKEND, LATENCY_MS=100), ZROK_TOKEN)
+        monitor = TunnelMonitor(min_samples=3, max_p95_ms=50)
+        problems = [self.probe(monitor) for _ in range(3)]
+        self.assertEqual(problems[:2], [None, None])
+        self.assertIn("95th percentile of latency", problems[2])
+        self.stop_tunnel()
+        self.assertIsNotNone(self.start_tunnel(NGROK_BACKEND))
+        self.assertIsNone(self.probe(TunnelMonitor(min_samples=3, max_p95_ms=50)))
+
+
+    def test_zrok_without_frontend_is_not_probed(self):
+        backend = ZrokBackend(ZROK_TOKEN, [sys.executable, FAKE_TUNNEL, "zrok", "share", "reserved", "--headless"])
+        self.assertIsNone(backend.probe_address(ZROK_TOKEN))
+        self.assertEqual(self.manager.backends[NGROK_BACKEND].probe_address("127.0.0.1:1234"), "127.0.0.1:1234")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,354 @@
+import collections
+import contextlib
+import cProfile
+import ctypes
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from constants import *
+
+PROFILE_CPROFILE = "cprofile"
+PROFILE_SAMPLING = "sampling"
+PROC_IO_FILE = "/proc/self/io"
+SAMPLING_THREAD_NAME = "Sampling profiler"
+
+
+class IoCounters(ctypes.Structure):
+    # IO_COUNTERS of GetProcessIoCounters on Windows
+    _fields_ = [("read_operations", ctypes.c_ulonglong), ("write_operations", ctypes.c_ulonglong),
+                ("other_operations", ctypes.c_ulonglong), ("read_bytes", ctypes.c_ulonglong),
+                ("write_bytes", ctypes.c_ulonglong), ("other_bytes", ctypes.c_ulonglong)]
+
+
+def io_counters():
+    """
+    Counts bytes of the whole app's process, files, pipes and sockets together.
+    :return: Tuple of bytes read and written since start of process or None when they are not available.
+    """
+    if os.name == "nt":
+        counters = IoCounters()
+        kernel32 = ctypes.windll.kernel32
+        if kernel32.GetProcessIoCounters(kernel32.GetCurrentProcess(), ctypes.byref(counters)):
+            return counters.read_bytes, counters.write_bytes
+        return None
+    try:
+        with open(PROC_IO_FILE, "rb") as io_file:
+            fields = dict(line.split(b":", 1) for line in io_file.read().splitlines() if b":" in line)
+        return int(fields[b"rchar"]), int(fields[b"wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def format_bytes(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f}MiB" if size >= 1024 * 1024 else f"{size / 1024:.1f}KiB"
+
+
+class Span:
+    def __init__(self, name: str, category: str, parent, args: dict):
+        """
+        One traced phase, started on creation and finished by tracer.
+        :param name: Name of phase.
+        :param category: Category shown in trace viewer.
+        :param parent: Enclosing span on the same thread or None.
+        :param args: Additional values recorded with span.
+        """
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.args = args
+        self.thread_id = threading.get_native_id()
+        self.thread_name = threading.current_thread().name
+        self.error = None
+        # Bytes reported by phase itself, for example size of downloaded file
+        self.bytes = 0
+        self.start = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.start_thread_cpu = time.thread_time()
+        self.start_io = io_counters()
+        self.wall_s = None
+        self.cpu_s = None
+        self.thread_cpu_s = None
+        self.read_bytes = None
+        self.write_bytes = None
+
+    def finish(self) -> None:
+        self.wall_s = time.perf_counter() - self.start
+        # CPU time of all threads of app, sub-processes are not included
+        self.cpu_s = time.process_time() - self.start_cpu
+        self.thread_cpu_s = time.thread_time() - self.start_thread_cpu
+        end_io = io_counters()
+        if self.start_io is not None and end_io is not None:
+            self.read_bytes = end_io[0] - self.start_io[0]
+            self.write_bytes = end_io[1] - self.start_io[1]
+
+    def describe(self) -> str:
+        """
+        :return: Short description with wall time, CPU time and moved bytes.
+        """
+        details = [f"cpu {self.cpu_s * 1000:.0f}ms"]
+        if self.bytes:
+            details.append(format_bytes(self.bytes))
+        if self.read_bytes is not None:
+            details.append(f"io {format_bytes(self.read_bytes)} read, {format_bytes(self.write_bytes)} written")
+        if self.error:
+            details.append(f"failed with {self.error}")
+        return f"{self.name} {self.wall_s * 1000:.0f}ms ({', '.join(details)})"
+
+    def trace_event(self, origin: float, pid: int) -> dict:
+        """
+        :param origin: perf_counter value of trace's start.
+        :param pid: Process id written to event.
+        :return: Complete event of Chrome trace format.
+        """
+        args = {"cpu_ms": round(self.cpu_s * 1000, 3), "thread_cpu_ms": round(self.thread_cpu_s * 1000, 3),
+                "bytes": self.bytes, "read_bytes": self.read_bytes, "write_bytes": self.write_bytes}
+        if self.error:
+            args["error"] = self.error
+        args.update(self.args)
+        return {"name": self.name, "cat": self.category, "ph": "X", "pid": pid, "tid": self.thread_id,
+                "ts": round((self.start - origin) * 1e6, 1), "dur": round(self.wall_s * 1e6, 1), "args": args}
+
+
+class SamplingProfiler:
+    def __init__(self, interval_s: float = TRACE_SAMPLE_INTERVAL_S):
+        """
+        Samples stacks of all threads of app in wall time, so waiting on network or sub-processes is visible next to
+        computation. Result are folded stacks used by flamegraph.pl and speedscope.
+        :param interval_s: Period of samples.
+        """
+        self.interval_s = interval_s
+        self.counts = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=SAMPLING_THREAD_NAME, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval_s):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                # Profilers of nested phases are not sampled
+                if names.get(thread_id) == SAMPLING_THREAD_NAME:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self, file_name: str) -> None:
+        """
+        Stops sampling and writes folded stacks.
+        :param file_name: Path of output file.
+        :return:
+        """
+        self.stopped.set()
+        self.thread.join()
+        with open(file_name, "w", encoding="utf-8") as output:
+            for stack, count in self.counts.most_common():
+                output.write(f"{stack} {count}\n")
+
+
+class Tracer:
+    def __init__(self, trace_file: str = None, enabled: bool = USE_TRACING, profile_mode: str = TRACE_PROFILE_MODE,
+                 profile_phases: list = TRACE_PROFILE_PHASES, max_spans: int = TRACE_MAX_SPANS):
+        """
+        Records spans of app's phases with wall time, CPU time and moved bytes and exports them as Chrome trace.
+        Chosen phases can be profiled with cProfile (only thread which runs phase) or sampling profiler.
+        :param trace_file: Path of exported trace, new file in TRACE_DIR for every run by default.
+        :param enabled: False turns spans into no-op.
+        :param profile_mode: None, PROFILE_CPROFILE or PROFILE_SAMPLING.
+        :param profile_phases: Names of profiled phases.
+        :param max_spans: Maximal number of kept spans, the oldest ones are dropped.
+        """
+        self.enabled = enabled
+        self.run_name = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.trace_file = trace_file or f"{TRACE_DIR}/trace_{self.run_name}.json"
+        self.profile_mode = profile_mode
+        self.profile_phases = set(profile_phases)
+        self.origin = time.perf_counter()
+        self.spans = collections.deque(maxlen=max_spans)
+        self.instants = collections.deque(maxlen=max_spans)
+        self.thread_names = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def stack(self) -> list:
+        """
+        :return: Open spans of calling thread from the outermost one.
+        """
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def current(self):
+        """
+        :return: The innermost open span of calling thread or None.
+        """
+        stack = self.stack() if self.enabled else None
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "phase", **args):
+        """
+        Traces block of code as phase, nested spans are its children.
+        :param name: Name of phase.
+        :param category: Category shown in trace viewer.
+        :param args: Additional values recorded with span.
+        :return: Context manager giving span, None when tracing is disabled.
+        """
+        if not self.enabled:
+            yield None
+            return
+        stack = self.stack()
+        span = Span(name, category, stack[-1] if stack else None, args)
+        stack.append(span)
+        profiler = None
+        try:
+            # Failed start of profiler fails the span, which is still taken off the stack
+            profiler = self.start_profiler(name)
+            yield span
+        except Exception as exception:
+            span.error = type(exception).__name__
+            raise
+        finally:
+            try:
+                if profiler is not None:
+                    self.stop_profiler(profiler, name)
+            finally:
+                stack.pop()
+                span.finish()
+                with self.lock:
+                    self.spans.append(span)
+                    self.thread_names[span.thread_id] = span.thread_name
+
+    def add_bytes(self, size: int) -> None:
+        """
+        Adds bytes moved by phase to all open spans of calling thread.
+        :param size: Number of bytes.
+        :return:
+        """
+        if self.enabled:
+            for span in self.stack():
+                span.bytes += size
+
+    def instant(self, name: str, **args) -> None:
+        """
+        Records moment without duration, for example phase of server's boot.
+        :param name: Name of event.
+        :param args: Additional values recorded with event.
+        :return:
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.instants.append((name, time.perf_counter(), threading.get_native_id(), args))
+            self.thread_names[threading.get_native_id()] = threading.current_thread().name
+
+    def start_profiler(self, name: str):
+        """
+        :param name: Name of phase.
+        :return: Started profiler if phase is profiled, otherwise None.
+        """
+        if name not in self.profile_phases:
+            return None
+        if self.profile_mode == PROFILE_CPROFILE:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Only one cProfile can run at a time, nested profiled phase is part of the outer one
+                return None
+            return profiler
+        if self.profile_mode == PROFILE_SAMPLING:
+            profiler = SamplingProfiler()
+            profiler.start()
+            return profiler
+        return None
+
+    def stop_profiler(self, profiler, name: str) -> None:
+        """
+        Stops profiler and writes its result next to trace.
+        :param profiler: cProfile.Profile or SamplingProfiler.
+        :param name: Name of phase.
+        :return:
+        """
+        os.makedirs(os.path.dirname(self.trace_file) or ".", exist_ok=True)
+        file_name = f"{os.path.dirname(self.trace_file) or '.'}/{name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        if isinstance(profiler, SamplingProfiler):
+            profiler.stop(f"{file_name}.folded")
+        else:
+            profiler.disable()
+            profiler.dump_stats(f"{file_name}.prof")
+
+    def children(self, span: Span) -> list:
+        """
+        :param span: Finished or open span.
+        :return: Finished spans directly nested in span, in order of start.
+        """
+        with self.lock:
+            return sorted((child for child in self.spans if child.parent is span), key=lambda child: child.start)
+
+    def summary(self, span: Span) -> str:
+        """
+        :param span: Span whose phases are described.
+        :return: Description of direct children of span.
+        """
+        if span is None:
+            return ""
+        return ", ".join(child.describe() for child in self.children(span))
+
+    def chrome_trace(self) -> dict:
+        """
+        :return: Spans and instant events in Chrome trace format.
+        """
+        pid = os.getpid()
+        with self.lock:
+            events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "Server control"}}]
+            events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": name}}
+                       for thread_id, name in self.thread_names.items()]
+            events += [span.trace_event(self.origin, pid) for span in self.spans]
+            events += [{"name": name, "cat": "instant", "ph": "i", "s": "t", "pid": pid, "tid": thread_id,
+                        "ts": round((moment - self.origin) * 1e6, 1), "args": args}
+                       for name, moment, thread_id, args in self.instants]
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"run": self.run_name, "profile_mode": self.profile_mode}}
+
+    def export(self, trace_file: str = None) -> None:
+        """
+        Writes trace, the previous export of the same run is replaced.
+        :param trace_file: Path of trace, tracer's file by default.
+        :return:
+        """
+        if not self.enabled:
+            return
+        trace_file = trace_file or self.trace_file
+        os.makedirs(os.path.dirname(trace_file) or ".", exist_ok=True)
+        trace = self.chrome_trace()
+        with self.lock:
+            with open(f"{trace_file}.tmp", "w", encoding="utf-8") as output:
+                json.dump(trace, output)
+            os.replace(f"{trace_file}.tmp", trace_file)
+
+
+def traced(name: str = None, category: str = "phase"):
+    """
+    Decorator which traces method of object with tracer attribute as phase.
+    :param name: Name of phase, method's name by default.
+    :param category: Category shown in trace viewer.
+    :return: Decorator.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name or method.__name__, category):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
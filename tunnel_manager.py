@@ -0,0 +1,185 @@
+import abc
+import json
+import re
+import shutil
+import threading
+import time
+import urllib.request
+
+from constants import *
+from supervisor import TUNNEL
+
+
+class TunnelBackend(abc.ABC):
+    name = ""
+    prefix = ""
+    # Tunnel writes its log to stderr instead of stdout
+    read_stderr = False
+    start_timeout_s = 0
+
+    @abc.abstractmethod
+    def command(self, port: int) -> list:
+        """
+        :param port: Local port of server.
+        :return: Command which starts tunnel.
+        """
+
+    @abc.abstractmethod
+    def parse_line(self, line: str) -> tuple:
+        """
+        :param line: Line of tunnel's log.
+        :return: Tuple of (message for log or None, public address or None).
+        """
+
+    def poll_address(self):
+        """
+        Asks tunnel for its address in other way than its log, called periodically while waiting.
+        :return: Public address or None.
+        """
+        return None
+
+    def probe_address(self, address: str):
+        """
+        :param address: Public address of tunnel.
+        :return: Address as host:port through which server can be pinged, None if it cannot.
+        """
+        return address
+
+
+class ZrokBackend(TunnelBackend):
+    name = ZROK_BACKEND
+    prefix = ZROK_PREFIX
+    read_stderr = True
+    start_timeout_s = ZROK_START_TIMEOUT_S
+
+    def __init__(self, token: str, command: list = None, probe_address: str = ZROK_PROBE_ADDRESS):
+        """
+        Reserved zrok share, its token is the address given to players.
+        :param token: Reserved share token.
+        :param command: Command without token, ZROK_COMMAND by default.
+        :param probe_address: Local frontend of the share (zrok access private) used for probing, None if there is
+        no such frontend.
+        """
+        self.token = token
+        self.base_command = command or ZROK_COMMAND
+        self.frontend_address = probe_address
+
+    def command(self, port: int) -> list:
+        return self.base_command + [self.token]
+
+    def parse_line(self, line: str) -> tuple:
+        """
+        Zrok writes json records to stderr, share is ready when its token appears.
+        """
+        try:
+            message = json.loads(line).get("msg", line)
+        except (json.JSONDecodeError, AttributeError):
+            message = line
+        return message, self.token if self.token in line else None
+
+    def probe_address(self, address: str):
+        return self.frontend_address
+
+
+class NgrokBackend(TunnelBackend):
+    name = NGROK_BACKEND
+    prefix = NGROK_PREFIX
+    start_timeout_s = NGROK_START_TIMEOUT_S
+
+    def __init__(self, command: list = None, api_url: str = NGROK_API_URL):
+        """
+        Ngrok tcp tunnel. Its log is read from stdout as it is written and its local inspection API is polled, the
+        address is taken from whichever answers first.
+        :param command: Command without port, ngrok from NGROK_DIR or PATH by default.
+        :param api_url: URL of tunnels list of ngrok's local API.
+        """
+        self.base_command = command or [shutil.which("ngrok", path=NGROK_DIR) or "ngrok", "tcp"]
+        self.api_url = api_url
+
+    def command(self, port: int) -> list:
+        return self.base_command + [f"{port}", "--log", "stdout", "--log-format", "logfmt"]
+
+    def parse_line(self, line: str) -> tuple:
+        match = re.search(NGROK_ADDRESS_RE, line)
+        return line, match[1] if match else None
+
+    def poll_address(self):
+        try:
+            with urllib.request.urlopen(self.api_url, timeout=TUNNEL_POLL_PERIOD_S) as response:
+                tunnels = json.load(response).get("tunnels", [])
+        except (OSError, ValueError):
+            return None
+        for tunnel in tunnels:
+            if tunnel.get("public_url", "").startswith("tcp://"):
+                return tunnel["public_url"][len("tcp://"):]
+        return None
+
+
+class TunnelManager:
+    def __init__(self, process_hub, backends: list, log_message):
+        """
+        Starts tunnel backends on process hub and waits for their public address with real deadline, waiting ends
+        as soon as the address is known.
+        :param process_hub: Process hub running tunnel's process.
+        :param backends: List of TunnelBackend.
+        :param log_message: Function taking message and prefix, used for tunnel's log.
+        """
+        self.process_hub = process_hub
+        self.backends = {backend.name: backend for backend in backends}
+        self.log_message = log_message
+        self.backend = None
+        self.process = None
+        self.address = None
+        self.address_found = threading.Event()
+        # Set when output of the current process ended
+        self.closed = threading.Event()
+
+    def start(self, name: str, port: int, timeout: float = None):
+        """
+        Starts backend and waits for its public address.
+        :param name: Name of backend.
+        :param port: Local port of server.
+        :param timeout: Start timeout, backend's own by default.
+        :return: Public address or None when tunnel did not report it in time or ended, process is left running.
+        """
+        backend = self.backends[name]
+        self.backend = backend
+        self.address = None
+        self.address_found.clear()
+        self.closed.clear()
+        closed = self.closed
+        self.process = self.process_hub.spawn(TUNNEL, backend.command(port),
+                                              on_line=lambda line: self.on_line(backend, line),
+                                              on_close=closed.set, read_stderr=backend.read_stderr)
+        deadline = time.monotonic() + (timeout or backend.start_timeout_s)
+        while not self.address_found.wait(min(TUNNEL_POLL_PERIOD_S, max(0.0, deadline - time.monotonic()))):
+            if (address := backend.poll_address()) is not None:
+                self.found(address)
+            elif closed.is_set() or time.monotonic() >= deadline:
+                return None
+        return self.address
+
+    def on_line(self, backend: TunnelBackend, line: str) -> None:
+        """
+        Called by process hub with every line of tunnel's log.
+        :param backend: Backend which wrote the line.
+        :param line: Decoded line.
+        :return:
+        """
+        message, address = backend.parse_line(line)
+        if message:
+            self.log_message(message, backend.prefix)
+        if address is not None and backend is self.backend:
+            self.found(address)
+
+    def found(self, address: str) -> None:
+        if self.address is None:
+            self.address = address
+            self.address_found.set()
+
+    @property
+    def running(self) -> bool:
+        """
+        :return: True if tunnel's process runs and its output did not end.
+        """
+        return self.process is not None and self.process.returncode is None and not self.closed.is_set()
@@ -0,0 +1,136 @@
+import collections
+import json
+import math
+import socket
+import struct
+import time
+
+from constants import *
+
+
+def pack_varint(value: int) -> bytes:
+    """
+    :param value: Non negative integer.
+    :return: Minecraft protocol VarInt.
+    """
+    data = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        data.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(data)
+
+
+def read_varint(sock: socket.socket) -> int:
+    """
+    :param sock: Connected socket.
+    :return: VarInt read from socket.
+    """
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = read_exactly(sock, 1)[0]
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value
+    raise ValueError("VarInt is too long.")
+
+
+def read_exactly(sock: socket.socket, length: int) -> bytes:
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by server.")
+        data += chunk
+    return bytes(data)
+
+
+def packet(packet_id: int, payload: bytes = b"") -> bytes:
+    body = pack_varint(packet_id) + payload
+    return pack_varint(len(body)) + body
+
+
+def status_ping(address: str, timeout: float = TUNNEL_PROBE_TIMEOUT_S) -> tuple:
+    """
+    Asks server for its status the same way as server list of game does, then measures ping packet round trip.
+    https://wiki.vg/Server_List_Ping
+    :param address: Address as host:port.
+    :param timeout: Timeout of the whole ping.
+    :return: Tuple of (round trip in ms, status dictionary).
+    """
+    host, port = address.rsplit(":", 1)
+    with socket.create_connection((host, int(port)), timeout=timeout) as sock:
+        encoded_host = host.encode("utf-8")
+        sock.sendall(packet(0x00, pack_varint(MINECRAFT_PROTOCOL_VERSION) + pack_varint(len(encoded_host)) +
+                            encoded_host + struct.pack(">H", int(port)) + pack_varint(1)) + packet(0x00))
+        read_varint(sock)
+        if read_varint(sock) != 0x00:
+            raise ValueError("Unexpected status response.")
+        status = json.loads(read_exactly(sock, read_varint(sock)).decode("utf-8"))
+        start_time = time.perf_counter()
+        sock.sendall(packet(0x01, struct.pack(">q", int(time.time() * 1000))))
+        read_varint(sock)
+        if read_varint(sock) != 0x01:
+            raise ValueError("Unexpected pong response.")
+        read_exactly(sock, 8)
+        return (time.perf_counter() - start_time) * 1000, status
+
+
+class TunnelMonitor:
+    def __init__(self, window: int = TUNNEL_PROBE_WINDOW, min_samples: int = TUNNEL_MIN_SAMPLES,
+                 max_p95_ms: float = TUNNEL_MAX_P95_MS, max_failures: int = TUNNEL_MAX_FAILURES):
+        """
+        Keeps results of the latest probes of tunnel and decides whether it is healthy.
+        :param window: Number of the latest latencies kept.
+        :param min_samples: Number of latencies needed before latency is judged.
+        :param max_p95_ms: Maximal 95th percentile of latency.
+        :param max_failures: Maximal number of failed probes in a row.
+        """
+        self.latencies = collections.deque(maxlen=window)
+        self.min_samples = min_samples
+        self.max_p95_ms = max_p95_ms
+        self.max_failures = max_failures
+        self.failures = 0
+
+    def record(self, latency_ms) -> None:
+        """
+        :param latency_ms: Round trip of probe or None when probe failed.
+        :return:
+        """
+        if latency_ms is None:
+            self.failures += 1
+        else:
+            self.failures = 0
+            self.latencies.append(latency_ms)
+
+    def reset(self) -> None:
+        self.latencies.clear()
+        self.failures = 0
+
+    def percentile(self, percent: float):
+        """
+        :param percent: Percentile from 0 to 100.
+        :return: Latency percentile of kept probes by nearest rank, None without probes.
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+    def problem(self):
+        """
+        :return: Description of crossed threshold or None if tunnel is healthy.
+        """
+        if self.failures >= self.max_failures:
+            return f"{self.failures} probes failed in a row"
+        if len(self.latencies) >= self.min_samples and self.percentile(95) > self.max_p95_ms:
+            return f"95th percentile of latency {self.percentile(95):.0f}ms exceeds {self.max_p95_ms}ms"
+        return None
+
+    def summary(self) -> str:
+        if not self.latencies:
+            return f"No tunnel latency measured, {self.failures} failed probes in a row."
+        return f"Tunnel latency of {len(self.latencies)} probes: p50 {self.percentile(50):.0f}ms, " \
+               f"p95 {self.percentile(95):.0f}ms, p99 {self.percentile(99):.0f}ms, max {max(self.latencies):.0f}ms, " \
+               f"{self.failures} failed probes in a row."